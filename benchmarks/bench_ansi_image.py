@@ -0,0 +1,89 @@
+"""
+Benchmark of rendering images as ansi text for the image widget:
+climage (per pixel escape codes parsed back with Text.from_ansi) vs image_to_ansi_text
+(with numpy if it's installed, plain python otherwise).
+
+usage: python benchmarks/bench_ansi_image.py [WIDTH] [IMAGE_FILE...]
+"""
+
+import sys
+import time
+from typing import Callable
+
+from climage import climage
+from PIL import Image, ImageDraw
+from rich.console import Console
+from rich.segment import Segment
+from rich.text import Text
+
+from baca.components import contents
+from baca.components.contents import image_to_ansi_text
+
+
+def generate_images() -> dict[str, Image.Image]:
+    # photo like gradient (hardly any repeated cells)
+    gradient = Image.new("RGB", (1200, 1600))
+    gradient.putdata([(x % 256, y % 256, (x * y) % 256) for y in range(1600) for x in range(1200)])
+
+    # comic like page (flat colors & lines)
+    page = Image.new("RGB", (1200, 1600), (255, 255, 255))
+    draw = ImageDraw.Draw(page)
+    for n in range(6):
+        box = (40 + (n % 2) * 580, 40 + (n // 2) * 510, 580 + (n % 2) * 580, 510 + (n // 2) * 510)
+        draw.rectangle(box, fill=(240, 200 - n * 20, 120 + n * 20), outline=(0, 0, 0), width=6)
+        draw.ellipse((box[0] + 60, box[1] + 60, box[0] + 300, box[1] + 300), fill=(30, 90, 200))
+
+    return {"gradient.png": gradient, "page.png": page}
+
+
+def render(text: Text) -> list[Segment]:
+    console = Console(width=1000, color_system="truecolor")
+    return list(Segment.simplify(console.render(text, console.options.update(no_wrap=True))))
+
+
+def measure(func: Callable[[], Text], repeat: int = 3) -> tuple[float, Text]:
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = func()
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed), text
+
+
+def render_with_climage(img: Image.Image, width: int) -> Text:
+    return Text.from_ansi(
+        climage._toAnsi(img, oWidth=width, is_unicode=True, color_type=climage.color_types.truecolor, palette="default")
+    )
+
+
+def render_without_numpy(img: Image.Image, width: int) -> Text:
+    np, contents.np = contents.np, None
+    try:
+        return image_to_ansi_text(img, width)
+    finally:
+        contents.np = np
+
+
+def main() -> None:
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    if len(sys.argv) > 2:
+        images = {path: Image.open(path).convert("RGB") for path in sys.argv[2:]}
+    else:
+        images = generate_images()
+
+    print(f"width: {width}, numpy: {'yes' if contents.np is not None else 'no'}")
+    print(f"{'best of 3':<16}{'climage (s)':>14}{'python (s)':>14}{'numpy (s)':>14}")
+    for name, img in images.items():
+        climage_time, climage_text = measure(lambda: render_with_climage(img, width))
+        python_time, python_text = measure(lambda: render_without_numpy(img, width))
+        assert render(python_text) == render(climage_text), f"{name}: output differs!"
+        numpy_column = "-"
+        if contents.np is not None:
+            numpy_time, numpy_text = measure(lambda: image_to_ansi_text(img, width))
+            assert render(numpy_text) == render(climage_text), f"{name}: output differs!"
+            numpy_column = f"{numpy_time:.3f}"
+        print(f"{name:<16}{climage_time:>14.3f}{python_time:>14.3f}{numpy_column:>14}")
+
+
+if __name__ == "__main__":
+    main()
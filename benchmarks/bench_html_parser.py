@@ -0,0 +1,99 @@
+"""
+Benchmark of splitting a large chapter into segments:
+the legacy double BeautifulSoup parse vs single pass HTMLSegmenter.
+
+usage: python benchmarks/bench_html_parser.py [NUMBER_OF_PARAGRAPHS]
+"""
+
+import sys
+import time
+import tracemalloc
+from typing import Callable, Iterator
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+from baca.models import Segment, SegmentType
+from baca.utils.html_parser import split_html_to_segments
+
+
+def legacy_split_html_to_segments(
+    html_src: str, section_name: str, *, ids_to_find: list[str] | None = None
+) -> Iterator[Segment]:
+    soup = BeautifulSoup(html_src, "html.parser", store_line_numbers=True)
+    body = soup.find("body")
+    body_html = str(body).replace("\n", " ")
+    body = BeautifulSoup(body_html, "html.parser")
+
+    find_nav_points = ids_to_find is None or len(ids_to_find) > 0
+    if find_nav_points:
+        section_elems = body.find_all(id=True if ids_to_find is None else ids_to_find)
+    else:
+        section_elems = []
+    img_elems = body.find_all(["img", "image"])
+    all_elems = sorted(section_elems + img_elems, key=lambda x: [x.sourceline, x.sourcepos])  # type: ignore
+
+    start = 0
+    nav_point = section_name
+    for elem in all_elems:
+        yield Segment(type=SegmentType.BODY, content=body_html[start : elem.sourcepos], nav_point=nav_point)  # type: ignore
+
+        start = elem.sourcepos
+        fragment = elem.get("id")
+        nav_point = f"{section_name}#{fragment}" if find_nav_points and fragment is not None else None
+
+        if elem.name in {"img", "image"}:  # type: ignore
+            img_src = elem.get("src") or elem.get("href")  # type: ignore
+            if img_src is not None:
+                yield Segment(type=SegmentType.IMAGE, content=urljoin(section_name, img_src), nav_point=nav_point)
+
+    yield Segment(type=SegmentType.BODY, content=body_html[start:], nav_point=nav_point)
+
+
+def generate_chapter(paragraphs: int) -> str:
+    body = []
+    for n in range(paragraphs):
+        if n % 50 == 0:
+            body.append(f'<h2 id="section{n}">Section {n}</h2>')
+        if n % 120 == 0:
+            body.append(f'<div class="figure"><img src="../images/figure{n}.png" alt="figure {n}"/></div>')
+        body.append(
+            f'<p class="text">Paragraph {n} with <em>emphasis</em>, <a href="chapter2.xhtml#note{n}">a link</a>'
+            " &amp; some entities &#8220;quoted&#8221; " + "lorem ipsum dolor sit amet " * 8 + "</p>"
+        )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>Chapter</title></head>\n<body>\n'
+        + "\n".join(body)
+        + "\n</body></html>"
+    )
+
+
+def measure(func: Callable[[], list[Segment]]) -> tuple[float, int, list[Segment]]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    segments = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, segments
+
+
+def main() -> None:
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    chapter = generate_chapter(paragraphs)
+    print(f"chapter size: {len(chapter) / 1024 ** 2:.2f} MB, {paragraphs} paragraphs")
+
+    legacy_time, legacy_peak, legacy_segments = measure(
+        lambda: list(legacy_split_html_to_segments(chapter, "chapter.xhtml"))
+    )
+    new_time, new_peak, new_segments = measure(lambda: list(split_html_to_segments(chapter, "chapter.xhtml")))
+
+    assert legacy_segments == new_segments, "segments differ!"
+    print(f"{'':<12}{'time (s)':>12}{'peak (MB)':>12}")
+    print(f"{'legacy':<12}{legacy_time:>12.3f}{legacy_peak / 1024 ** 2:>12.2f}")
+    print(f"{'segmenter':<12}{new_time:>12.3f}{new_peak / 1024 ** 2:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark of resolving the internal links of a link dense KF8 book (XHTMLK8Processor.prepare):
+the legacy position lookups (scanning the tables & searching a copy of the part backwards)
+vs the bisected ones of K8Processor.
+
+usage: python benchmarks/bench_kf8_links.py [NUMBER_OF_ENTRIES_PER_CHAPTER]
+"""
+
+import contextlib
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from baca.tools.KindleUnpack.mobi_header import MobiHeader
+from baca.tools.KindleUnpack.mobi_html import XHTMLK8Processor
+from baca.tools.KindleUnpack.mobi_k8proc import K8Processor
+from baca.tools.KindleUnpack.mobi_sectioner import Sectionizer
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "tests"))
+from kindle_books import LegacyK8Processor, build_kf8, make_book_spec  # noqa: E402
+
+CHAPTERS = 20
+
+
+def generate_book(path: Path, entries: int) -> None:
+    # dictionary like: entries with ids, each linking to a random other one
+    rnd = random.Random(0)
+    spec = make_book_spec(chapters=CHAPTERS, paragraphs=0)
+    for n, chapter in enumerate(spec.chapters):
+        chapter.body += "".join(
+            f'<h3 id="e{n}x{k}">entry</h3>'
+            f'<p>lorem ipsum <a href="#e{rnd.randrange(CHAPTERS)}x{rnd.randrange(entries)}">see</a> dolor sit</p>'
+            for k in range(entries)
+        )
+    path.write_bytes(build_kf8(spec))
+
+
+def resolve_links(path: Path, k8proc_class: type[K8Processor]) -> tuple[float, dict]:
+    with Sectionizer(str(path)) as sect, contextlib.redirect_stdout(None):
+        mh = MobiHeader(sect, 0)
+        k8proc = k8proc_class(mh, sect, None)
+        k8proc.buildParts(mh.getRawML())
+        # NOTE: no images nor fonts, so no resource names needed
+        xhtml_processor = XHTMLK8Processor([], k8proc)
+        start = time.perf_counter()
+        xhtml_processor.prepare()
+        return time.perf_counter() - start, xhtml_processor.posfid_links
+
+
+def main() -> None:
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = Path(tempdir) / "links.azw3"
+        generate_book(path, entries)
+        print(f"{CHAPTERS} chapters of {entries} linked entries")
+        legacy_time, legacy_links = resolve_links(path, LegacyK8Processor)
+        new_time, new_links = resolve_links(path, K8Processor)
+        assert legacy_links == new_links, "links differ!"
+        print(f"{'legacy (s)':>12}{'bisect (s)':>12}{'speedup':>10}")
+        print(f"{legacy_time:>12.3f}{new_time:>12.3f}{legacy_time / new_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark of assembling the xhtml parts of a KF8 book from its skeleton & fragment tables:
+the legacy loop (copying the part for every fragment inserted) vs assemble_parts (gap buffer).
+
+usage: python benchmarks/bench_kf8_parts.py [NUMBER_OF_PARAGRAPHS]
+"""
+
+import contextlib
+import copy
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from baca.tools.KindleUnpack.mobi_header import MobiHeader
+from baca.tools.KindleUnpack.mobi_k8proc import K8Processor, assemble_parts
+from baca.tools.KindleUnpack.mobi_sectioner import Sectionizer
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "tests"))
+import kindle_books  # noqa: E402
+from kindle_books import build_kf8, legacy_assemble_parts, make_book_spec  # noqa: E402
+
+
+def load_tables(path: Path) -> tuple[bytes, list, list]:
+    with Sectionizer(str(path)) as sect, contextlib.redirect_stdout(None):
+        mh = MobiHeader(sect, 0)
+        k8proc = K8Processor(mh, sect, None)
+        return mh.getRawML(), k8proc.skeltbl, k8proc.fragtbl
+
+
+def main() -> None:
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print(f"{'fragment size':<16}{'fragments':>10}{'legacy (s)':>12}{'gap buffer (s)':>16}{'speedup':>10}")
+    for fragment_size in (256, 1024, 4096):
+        kindle_books.FRAGMENT_SIZE = fragment_size
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = Path(tempdir) / "large.azw3"
+            path.write_bytes(build_kf8(make_book_spec(chapters=2, paragraphs=paragraphs)))
+            text, skeltbl, fragtbl = load_tables(path)
+
+        legacy_fragtbl = copy.deepcopy(fragtbl)
+        start = time.perf_counter()
+        legacy = legacy_assemble_parts(text, skeltbl, legacy_fragtbl)
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        new = assemble_parts(text, skeltbl, fragtbl)
+        new_time = time.perf_counter() - start
+        assert legacy == new and legacy_fragtbl == fragtbl, "parts differ!"
+        print(
+            f"{fragment_size:<16}{len(fragtbl):>10}{legacy_time:>12.3f}{new_time:>16.3f}"
+            f"{legacy_time / new_time:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark of peak memory of opening a large AZW3 book in memory (KindleBook):
+the legacy Sectionizer reading the whole file vs the memory-mapped one.
+
+Every step runs in its own process, so its peak RSS doesn't include the others
+(NOTE: a child process starts off with the peak RSS of its parent on linux).
+The RSS once opened is split into anonymous memory and file backed pages, the latter
+being the mapped pages touched, shared with the page cache and reclaimable.
+
+usage: python benchmarks/bench_kindle_memory.py [NUMBER_OF_IMAGES] [AZW3_FILE]
+"""
+
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from baca.tools.KindleUnpack.mobi_sectioner import Sectionizer
+from baca.utils import kindle_book
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "tests"))
+from kindle_books import build_kf8, make_book_spec  # noqa: E402
+
+MODES = ["read", "mmap"]
+
+
+def make_noise_image(size: int, seed: int) -> bytes:
+    # NOTE: only the header gets sniffed by the unpacker, the rest just needs to be incompressible
+    return b"\x89PNG\r\n\x1a\n" + random.Random(seed).randbytes(size)
+
+
+def generate_book(path: Path, images: int) -> None:
+    spec = make_book_spec(chapters=60, paragraphs=200)
+    spec.images += [make_noise_image(1024**2, n) for n in range(images)]
+    path.write_bytes(build_kf8(spec))
+
+
+def run(mode: str, path: str) -> None:
+    if mode == "read":
+        # legacy: the whole file read into memory
+        kindle_book.Sectionizer = lambda filename, use_mmap: Sectionizer(filename)  # type: ignore
+
+    start = time.perf_counter()
+    book = kindle_book.KindleBook(path)
+    elapsed = time.perf_counter() - start
+    # NOTE: ru_maxrss is in kilobytes on linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    status = dict(line.split(":", 1) for line in Path("/proc/self/status").read_text().splitlines())
+    rss_anon, rss_file = (int(status[key].split()[0]) * 1024 for key in ("RssAnon", "RssFile"))
+    print(json.dumps(dict(time=elapsed, max_rss=max_rss, rss_anon=rss_anon, rss_file=rss_file)))
+    book.close()
+
+
+def run_in_subprocess(*args: str) -> str:
+    output = subprocess.run([sys.executable, __file__, *args], capture_output=True, check=True, text=True).stdout
+    return output.splitlines()[-1] if output else ""
+
+
+def main() -> None:
+    images = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    with tempfile.TemporaryDirectory() as tempdir:
+        if len(sys.argv) > 2:
+            path = Path(sys.argv[2])
+        else:
+            path = Path(tempdir) / "large.azw3"
+            run_in_subprocess("--generate", str(path), str(images))
+        print(f"book size: {os.path.getsize(path) / 1024 ** 2:.2f} MB")
+
+        print(f"{'':<12}{'time (s)':>12}{'peak rss (MB)':>16}{'anon (MB)':>12}{'file (MB)':>12}")
+        for mode in MODES:
+            result = json.loads(run_in_subprocess("--run", mode, str(path)))
+            print(
+                f"{mode:<12}{result['time']:>12.3f}{result['max_rss'] / 1024 ** 2:>16.2f}"
+                f"{result['rss_anon'] / 1024 ** 2:>12.2f}{result['rss_file'] / 1024 ** 2:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--generate"]:
+        generate_book(Path(sys.argv[2]), int(sys.argv[3]))
+    elif sys.argv[1:2] == ["--run"]:
+        run(*sys.argv[2:4])
+    else:
+        main()
@@ -0,0 +1,87 @@
+"""
+Benchmark of opening a large AZW3 book and reading all of its contents:
+- epub: the legacy Azw, unpacking the book to a temp tree, zipping it up into an epub
+  and reading the contents back from that (unpack_kindle_book + Epub)
+- tree: unpacking the book to a temp tree without the epub, reading the contents from the tree
+  (unpack_kindle_book with doskipepubzip)
+- memory: the current Azw, unpacking the book into memory (KindleBook)
+
+usage: python benchmarks/bench_kindle_open.py [NUMBER_OF_IMAGES] [AZW3_FILE]
+"""
+
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from baca.ebooks import Azw, Epub
+from baca.tools import unpack_kindle_book
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "tests"))
+from kindle_books import build_kf8, make_book_spec  # noqa: E402
+
+
+def make_noise_image(size: int, seed: int) -> bytes:
+    # NOTE: only the header gets sniffed by the unpacker, the rest just needs to be incompressible
+    return b"\x89PNG\r\n\x1a\n" + random.Random(seed).randbytes(size)
+
+
+def generate_book(path: Path, images: int) -> None:
+    spec = make_book_spec(chapters=200, paragraphs=200)
+    spec.images += [make_noise_image(1024**2, n) for n in range(images)]
+    path.write_bytes(build_kf8(spec))
+
+
+def read_epub(path: Path, tempdir: Path) -> int:
+    unpack_kindle_book(str(path), str(tempdir), epubver="A", use_hd=True)
+    ebook = Epub(tempdir / "mobi8" / f"{path.stem}.epub")
+    try:
+        return sum(len(ebook.get_raw_text(content)) for content in ebook._get_contents())
+    finally:
+        ebook.cleanup()
+
+
+def read_tree(path: Path, tempdir: Path) -> int:
+    unpack_kindle_book(str(path), str(tempdir), epubver="A", use_hd=True, doskipepubzip=True)
+    # NOTE: the spine & toc are in the unpacked opf & ncx, parsed the same as the zipped ones,
+    # so only the contents get read here (the same ones as of the unpacked epub)
+    oebps_dir = tempdir / "mobi8" / "OEBPS"
+    return sum(len(text.read_text("utf-8")) for text in sorted((oebps_dir / "Text").iterdir()))
+
+
+def read_memory(path: Path, tempdir: Path) -> int:
+    ebook = Azw(path)
+    try:
+        return sum(len(ebook.get_raw_text(content)) for content in ebook._get_contents())
+    finally:
+        ebook.cleanup()
+
+
+MODES: dict[str, Callable[[Path, Path], int]] = {"epub": read_epub, "tree": read_tree, "memory": read_memory}
+
+
+def main() -> None:
+    images = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with tempfile.TemporaryDirectory() as tempdir:
+        if len(sys.argv) > 2:
+            path = Path(sys.argv[2])
+        else:
+            path = Path(tempdir) / "large.azw3"
+            generate_book(path, images)
+        print(f"book size: {os.path.getsize(path) / 1024 ** 2:.2f} MB")
+
+        print(f"{'':<12}{'time (s)':>12}{'read (MB)':>12}")
+        for mode, read in MODES.items():
+            with tempfile.TemporaryDirectory() as unpack_dir, contextlib.redirect_stdout(None):
+                start = time.perf_counter()
+                size = read(path, Path(unpack_dir))
+                elapsed = time.perf_counter() - start
+            print(f"{mode:<12}{elapsed:>12.3f}{size / 1024 ** 2:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
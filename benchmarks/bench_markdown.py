@@ -0,0 +1,50 @@
+"""
+Benchmark of converting a large chapter into markdown segments:
+re-parsing each serialized segment with markdownify vs MarkdownSegmenter.
+
+usage: python benchmarks/bench_markdown.py [NUMBER_OF_PARAGRAPHS]
+"""
+
+import sys
+
+from bench_html_parser import generate_chapter, measure
+
+from baca.models import Segment, SegmentType
+from baca.utils.html_parser import (
+    MarkdownConverter,
+    parse_html_to_segmented_md,
+    split_html_to_segments,
+)
+
+
+def reparse_html_to_segmented_md(html_src: str, section_name: str) -> list[Segment]:
+    return [
+        Segment(
+            type=segment.type,
+            content=MarkdownConverter().convert(segment.content)
+            if segment.type == SegmentType.BODY
+            else segment.content,
+            nav_point=segment.nav_point,
+        )
+        for segment in split_html_to_segments(html_src, section_name)
+    ]
+
+
+def main() -> None:
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    chapter = generate_chapter(paragraphs)
+    print(f"chapter size: {len(chapter) / 1024 ** 2:.2f} MB, {paragraphs} paragraphs")
+
+    reparse_time, reparse_peak, reparse_segments = measure(
+        lambda: reparse_html_to_segmented_md(chapter, "chapter.xhtml")
+    )
+    new_time, new_peak, new_segments = measure(lambda: list(parse_html_to_segmented_md(chapter, "chapter.xhtml")))
+
+    assert reparse_segments == new_segments, "segments differ!"
+    print(f"{'':<12}{'time (s)':>12}{'peak (MB)':>12}")
+    print(f"{'re-parse':<12}{reparse_time:>12.3f}{reparse_peak / 1024 ** 2:>12.2f}")
+    print(f"{'direct':<12}{new_time:>12.3f}{new_peak / 1024 ** 2:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark of rewriting the html of a large Mobi7 book (HTMLProcessor.insertHREFS):
+the legacy regex pass over the whole text for every rewrite (insertHREFSInPasses)
+vs the single pass, time & peak memory allocated (traced by tracemalloc),
+from the raw markup (anchors inserted by findAnchors included).
+
+usage: python benchmarks/bench_mobi_html.py [NUMBER_OF_CHAPTERS]
+"""
+
+import contextlib
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from baca.tools.KindleUnpack.mobi_header import MobiHeader
+from baca.tools.KindleUnpack.mobi_html import HTMLProcessor
+from baca.tools.KindleUnpack.mobi_ncx import ncxExtract
+from baca.tools.KindleUnpack.mobi_sectioner import Sectionizer
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "tests"))
+from kindle_books import build_mobi7, make_book_spec  # noqa: E402
+
+
+def load_raw_ml(path: Path) -> tuple[bytes, list, dict]:
+    with Sectionizer(str(path)) as sect, contextlib.redirect_stdout(None):
+        mh = MobiHeader(sect, 0)
+        return mh.getRawML(), ncxExtract(mh, None).parseNCX(), mh.getMetaData()
+
+
+def insert_hrefs(raw_ml: bytes, ncx_data: list, metadata: dict, in_passes: bool) -> bytes:
+    html_processor = HTMLProcessor(None, metadata, ["image00001.png", "image00002.png", "image00003.png"])
+    with contextlib.redirect_stdout(None):
+        html_processor.findAnchors(raw_ml, ncx_data, {})
+        srctext, _ = html_processor.insertHREFSInPasses() if in_passes else html_processor.insertHREFS()
+    return srctext
+
+
+def measure(raw_ml: bytes, ncx_data: list, metadata: dict, in_passes: bool) -> tuple[float, int, bytes]:
+    start = time.perf_counter()
+    srctext = insert_hrefs(raw_ml, ncx_data, metadata, in_passes)
+    elapsed = time.perf_counter() - start
+    # traced apart, since tracing slows down the allocations
+    tracemalloc.start()
+    insert_hrefs(raw_ml, ncx_data, metadata, in_passes)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, srctext
+
+
+def main() -> None:
+    chapters = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = Path(tempdir) / "large.mobi"
+        path.write_bytes(build_mobi7(make_book_spec(chapters=chapters, paragraphs=20)))
+        raw_ml, ncx_data, metadata = load_raw_ml(path)
+    print(f"raw markup: {len(raw_ml) / 1024 ** 2:.2f} MB")
+
+    print(f"{'':<12}{'time (s)':>12}{'peak (MB)':>12}")
+    results = {}
+    for name, in_passes in [("passes", True), ("single", False)]:
+        elapsed, peak, results[name] = measure(raw_ml, ncx_data, metadata, in_passes)
+        print(f"{name:<12}{elapsed:>12.3f}{peak / 1024 ** 2:>12.2f}")
+    assert results["passes"] == results["single"], "html differs!"
+
+
+if __name__ == "__main__":
+    main()
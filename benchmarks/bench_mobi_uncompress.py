@@ -0,0 +1,84 @@
+"""
+Benchmark of decompressing Kindle book text records:
+- PalmDOC: the legacy decoder (bytes concatenation) vs PalmdocReader.unpack (bytearray)
+- HUFF/CDIC: the legacy decoder vs HuffcdicReader.unpack (bytearray, cached phrases),
+  sequentially & in worker processes (HuffcdicReader.unpackRecords)
+
+usage: python benchmarks/bench_mobi_uncompress.py [NUMBER_OF_RECORDS]
+"""
+
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+from baca.tools.KindleUnpack.mobi_uncompress import HuffcdicReader, PalmdocReader
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "tests"))
+from kindle_books import (  # noqa: E402
+    RECORD_SIZE,
+    LegacyHuffcdicReader,
+    huffcdic_compress,
+    legacy_palmdoc_unpack,
+    palmdoc_compress,
+)
+
+
+def generate_texts(count: int) -> dict[str, list[bytes]]:
+    rnd = random.Random(0)
+    words = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+    prose = " ".join(rnd.choice(words) for _ in range(count * RECORD_SIZE // 5)).encode()
+    # markup heavy text with long runs, ie. lots of overlapping back references
+    markup = b"".join(
+        b'<p class="calibre1">' + b"-" * rnd.randint(0, 60) + b"</p>\n" for _ in range(count * RECORD_SIZE // 40)
+    )
+    return {
+        name: [text[n : n + RECORD_SIZE] for n in range(0, count * RECORD_SIZE, RECORD_SIZE)]
+        for name, text in [("prose", prose), ("markup", markup)]
+    }
+
+
+def load_huffcdic_reader(reader: HuffcdicReader, tables: list[bytes]) -> HuffcdicReader:
+    reader.loadHuff(tables[0])
+    for cdic in tables[1:]:
+        reader.loadCdic(cdic)
+    return reader
+
+
+def measure(unpack_records: Callable[[list[bytes]], list[bytes]], records: list[bytes]) -> tuple[float, bytes]:
+    start = time.perf_counter()
+    text = b"".join(unpack_records(records))
+    return time.perf_counter() - start, text
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"{count} records of {RECORD_SIZE} bytes")
+    texts = generate_texts(count)
+
+    print(f"{'palmdoc':<12}{'legacy (s)':>12}{'bytearray (s)':>16}{'speedup':>10}")
+    for name, chunks in texts.items():
+        records = [palmdoc_compress(chunk) for chunk in chunks]
+        legacy_time, legacy_text = measure(lambda records: map(legacy_palmdoc_unpack, records), records)
+        new_time, new_text = measure(lambda records: map(PalmdocReader().unpack, records), records)
+        assert legacy_text == new_text == b"".join(chunks), "texts differ!"
+        print(f"{name:<12}{legacy_time:>12.3f}{new_time:>16.3f}{legacy_time / new_time:>9.1f}x")
+
+    workers = os.cpu_count() or 1
+    print(f"\n{'huffcdic':<12}{'legacy (s)':>12}{'bytearray (s)':>16}{'speedup':>10}{f'{workers} workers (s)':>16}")
+    for name, chunks in texts.items():
+        records, tables = huffcdic_compress(chunks)
+        legacy_reader = load_huffcdic_reader(LegacyHuffcdicReader(), tables)
+        legacy_time, legacy_text = measure(lambda records: map(legacy_reader.unpack, records), records)
+        reader = load_huffcdic_reader(HuffcdicReader(), tables)
+        new_time, new_text = measure(lambda records: map(reader.unpack, records), records)
+        reader = load_huffcdic_reader(HuffcdicReader(), tables)
+        parallel_time, parallel_text = measure(lambda records: reader.unpackRecords(records, workers), records)
+        assert legacy_text == new_text == parallel_text == b"".join(chunks), "texts differ!"
+        print(f"{name:<12}{legacy_time:>12.3f}{new_time:>16.3f}{legacy_time / new_time:>9.1f}x{parallel_time:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
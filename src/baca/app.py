@@ -1,5 +1,6 @@
 import asyncio
 import dataclasses
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import Type
@@ -17,17 +18,31 @@ from baca.components.events import (
     OpenThisImage,
     Screenshot,
     SearchSubmitted,
+    SegmentsLoaded,
 )
 from baca.components.windows import Alert, DictDisplay, SearchInputPrompt, ToC
 from baca.config import load_config
-from baca.ebooks import Ebook
+from baca.ebooks import CachedEbook, Ebook
 from baca.exceptions import LaunchingFileError
-from baca.models import Coordinate, KeyMap, ReadingHistory, SearchMode
+from baca.models import (
+    Coordinate,
+    KeyMap,
+    ReadingHistory,
+    ReadingPosition,
+    SearchMode,
+    Segment,
+)
 from baca.utils.app_resources import get_resource_file
 from baca.utils.keys_parser import dispatch_key
 from baca.utils.systems import launch_file
 from baca.utils.urls import is_url
 
+# number of segments in the first batch posted while loading,
+# the following batches get twice as big as the previous one
+INITIAL_LOAD_BATCH_SIZE = 50
+# max seconds between posting batches of segments
+LOAD_BATCH_INTERVAL = 0.5
+
 
 class Baca(App):
     CSS_PATH = str(get_resource_file("style.css"))
@@ -41,6 +56,8 @@ class Baca(App):
         # TODO: make reactive and display percentage
         # as alternative for scrollbar
         self.reading_progress = 0.0
+        self.reading_position: ReadingPosition | None = None
+        self.is_fully_loaded = False
         self.search_mode = None
 
     def on_load(self, _: events.Load) -> None:
@@ -48,18 +65,53 @@ class Baca(App):
         self._loop.run_in_executor(None, self.load_everything)
 
     def load_everything(self):
-        self.ebook = self.ebook_class(self.ebook_path)
+        max_workers = self.config.parsing_workers or None
+        self.ebook = (
+            CachedEbook(
+                self.ebook_path,
+                self.ebook_class,
+                max_cache_size=self.config.parsed_cache_size * 1024**2,
+                max_workers=max_workers,
+            )
+            if self.config.parsed_cache_size > 0
+            else self.ebook_class(self.ebook_path, max_workers=max_workers)
+        )
         content = Content(self.config, self.ebook)
         self.ebook_state, _ = ReadingHistory.get_or_create(
             filepath=str(self.ebook.get_path()), defaults=dict(reading_progress=0.0)
         )
+        # NOTE: keep the saved progress in case the app
+        # gets closed before the whole ebook is loaded
+        self.reading_progress = self.ebook_state.reading_progress
+        if self.ebook_state.segment_index is not None:
+            self.reading_position = ReadingPosition(
+                segment_index=self.ebook_state.segment_index,  # type: ignore
+                offset=self.ebook_state.segment_offset or 0.0,  # type: ignore
+            )
         # NOTE: using a message instead of calling
         # the callback directly to make sure that the app is ready
         # before calling the callback, since this message will
         # get processed after app ready and composed
         # (self._screen_stack isn't empty)
         # see: Widget.on_event(), App._process_message()
-        self.post_message(DoneLoading(content))
+        self.call_from_thread(self.post_message, DoneLoading(content))
+
+        # NOTE: stream the segments in growing batches, small ones first to show
+        # the beginning of the ebook asap, then bigger ones since every mount
+        # relayouts the whole content
+        batch: list[Segment] = []
+        batch_size = INITIAL_LOAD_BATCH_SIZE
+        last_posted = time.monotonic()
+        for segment in self.ebook.iter_parsed_contents(max_workers=max_workers):
+            batch.append(segment)
+            if len(batch) >= batch_size or time.monotonic() - last_posted >= LOAD_BATCH_INTERVAL:
+                # NOTE: stop parsing once the app is closing
+                if not self.call_from_thread(self.post_message, SegmentsLoaded(batch)):
+                    return
+                batch = []
+                batch_size *= 2
+                last_posted = time.monotonic()
+        self.call_from_thread(self.post_message, SegmentsLoaded(batch, is_last=True))
 
     async def on_done_loading(self, event: DoneLoading) -> None:
         # to be safe, unnecessary?
@@ -69,27 +121,59 @@ class Baca(App):
         # NOTE: await to prevent broken layout
         await self.mount(event.content)
 
+    async def on_segments_loaded(self, event: SegmentsLoaded) -> None:
+        self.content.add_segments(event.segments)
+
+        def remove_loader() -> None:
+            # NOTE: eg. the content width isn't known yet
+            if self.content.is_restoring_position:
+                self.call_after_refresh(remove_loader)
+            else:
+                self.query("#startup-loader").remove()
+
         def restore_reading_progress() -> None:
             # restore reading progress
             # make sure to call this after refresh so the screen.max_scroll_y != 0
-            self.reading_progress = self.ebook_state.reading_progress * self.screen.max_scroll_y
-            self.screen.scroll_to(None, self.reading_progress, duration=0, animate=False)  # type: ignore
-
+            self.screen.scroll_to(
+                None, self.ebook_state.reading_progress * self.screen.max_scroll_y, duration=0, animate=False
+            )
             self.get_widget_by_id("startup-loader", LoadingIndicator).remove()
 
-        def show_images() -> None:
-            self.content.show_ansi_images()
-            self.refresh(layout=True)
-            self.call_after_refresh(restore_reading_progress)
+        def update_reading_progress() -> None:
+            self.is_fully_loaded = True
+            if self.screen.max_scroll_y != 0:
+                self.reading_progress = self.screen.scroll_offset.y / self.screen.max_scroll_y
 
-        self.call_after_refresh(show_images)
+        def relayout() -> None:
+            self.refresh(layout=True)
+            if self.is_loading:
+                self.call_after_refresh(restore_reading_progress if self.reading_position is None else remove_loader)
+            self.call_after_refresh(update_reading_progress)
+
+        if self.is_loading:
+            if self.reading_position is not None:
+                # NOTE: reading position is relative to its segment, so it can be restored
+                # as soon as that segment is loaded
+                if self.content.scroll_to_reading_position(self.reading_position):
+                    self.call_after_refresh(remove_loader)
+            # NOTE: saved reading progress (from older versions) is relative to the whole ebook height,
+            # so unless it's at the very beginning it can only be restored once everything is loaded
+            elif self.ebook_state.reading_progress == 0:
+                remove_loader()
+
+        if event.is_last:
+            self.call_after_refresh(relayout)
 
     def on_mount(self):
         def screen_watch_scroll_y_wrapper(old_watcher, screen):
             def new_watcher(old, new):
                 result = old_watcher(old, new)
-                if screen.max_scroll_y != 0:
+                # NOTE: max_scroll_y keeps growing while the segments are still streamed in
+                if self.is_fully_loaded and screen.max_scroll_y != 0:
                     self.reading_progress = new / screen.max_scroll_y
+                # NOTE: keep the saved position until it's restored
+                if not self.is_loading:
+                    self.reading_position = self.content.get_reading_position()
                 return result
 
             return new_watcher
@@ -166,6 +250,8 @@ class Baca(App):
         self.screen.scroll_page_up(duration=self.config.page_scroll_duration)
 
     async def action_input_search(self, forward: bool) -> None:
+        # NOTE: start indexing while the pattern is being typed
+        self.content.build_search_index()
         await self.mount(SearchInputPrompt(forward=forward))
 
     async def action_search_next(self) -> bool:
@@ -213,15 +299,11 @@ class Baca(App):
             if len(toc_entries) == 0:
                 return await self.alert("No content navigations for this ebook.")
 
-            initial_index = 0
-            toc_values = [e.value for e in toc_entries]
-            for s in self.content.get_navigables():
-                if s.nav_point is not None and s.nav_point in toc_values:
-                    # if round(self.screen.scroll_y) >= s.virtual_region.y:
-                    if self.screen.scroll_offset.y >= s.virtual_region.y:
-                        initial_index = toc_values.index(s.nav_point)
-                    else:
-                        break
+            toc_indices: dict[str, int] = {}
+            for n, toc_entry in enumerate(toc_entries):
+                toc_indices.setdefault(toc_entry.value, n)
+            nav_point = self.content.get_section_at(self.screen.scroll_offset.y, toc_indices)
+            initial_index = toc_indices[nav_point] if nav_point is not None else 0
 
             toc = ToC(self.config, entries=toc_entries, initial_index=initial_index)
             # NOTE: await to prevent broken layout
@@ -243,7 +325,7 @@ class Baca(App):
             except LaunchingFileError as e:
                 await self.alert(str(e))
 
-        elif link in [n.nav_point for n in self.content.get_navigables()]:
+        elif self.content.get_section(link) is not None:
             self.content.scroll_to_section(link)
 
         else:
@@ -288,6 +370,9 @@ class Baca(App):
             self.ebook_state.title = meta.title  # type: ignore
             self.ebook_state.author = meta.creator  # type: ignore
             self.ebook_state.reading_progress = self.reading_progress  # type: ignore
+            if self.reading_position is not None:
+                self.ebook_state.segment_index = self.reading_position.segment_index  # type: ignore
+                self.ebook_state.segment_offset = self.reading_position.offset  # type: ignore
             self.ebook_state.save()
             self.ebook.cleanup()
 
@@ -312,6 +397,10 @@ class Baca(App):
         except NoMatches:
             return None
 
+    @property
+    def is_loading(self) -> bool:
+        return len(self.query("#startup-loader")) > 0
+
     @property
     def content(self) -> Content:
         return self.query_one(Content.__name__, Content)
@@ -1,25 +1,171 @@
+import asyncio
 import io
+import math
 import re
-from marshal import dumps
+import time
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from itertools import accumulate, chain, groupby, islice
+from typing import Callable, Container, Iterable, Sequence, Type
 from urllib.parse import urljoin
 
-from climage import climage
 from PIL import Image as PILImage
+from rich.color import Color, ColorType
+from rich.color_triplet import ColorTriplet
+from rich.console import Console
 from rich.markdown import Markdown
-from rich.text import Text
+from rich.segment import Segment as RichSegment
+from rich.style import Style
+from rich.text import Span, Text
 from textual import events
 from textual.app import ComposeResult
-from textual.geometry import Region
+from textual.geometry import Region, Size
 from textual.strip import Strip
+from textual.timer import Timer
 from textual.widget import Widget
 from textual.widgets import DataTable
 from textual.widgets.markdown import Markdown as PrettyMarkdown
 
 from baca.components.events import OpenThisImage
 from baca.ebooks import Ebook
-from baca.models import Config, Coordinate, SegmentType
+from baca.models import Config, Coordinate, ReadingPosition, Segment, SegmentType
+from baca.utils.search_index import SearchIndex
 from baca.utils.urls import is_url
 
+try:
+    import numpy as np
+except ImportError:
+    # NOTE: numpy is optional, images get rendered (slower) with plain python without it
+    np = None
+
+JUSTIFY = dict(center="center", left="left", right="right", justify="full")
+# NOTE: enough for the segments around the screen even after measuring
+# every segment (which goes through this cache too) on resize
+MARKDOWN_LINES_CACHE_SIZE = 512
+DECODED_IMAGES_CACHE_SIZE = 16
+ANSI_IMAGES_CACHE_SIZE = 64
+# NOTE: sizes are tiny, enough for every image of most ebooks since all of them get measured
+IMAGE_SIZES_CACHE_SIZE = 1024
+# errors of images which can't be loaded or rendered, eg. too wide ones get resized to 0 lines
+IMAGE_ERRORS = (OSError, KeyError, ValueError, PILImage.DecompressionBombError)
+# seconds to wait for more resize events before laying out the content again
+RELAYOUT_DELAY = 0.2
+# max seconds spent on measuring segments between processing other events
+RELAYOUT_STEP_DURATION = 0.02
+
+
+@lru_cache(maxsize=MARKDOWN_LINES_CACHE_SIZE)
+def render_markdown_lines(console: Console, content: str, width: int, justify: str) -> list[list[RichSegment]]:
+    """
+    Lay out markdown `content` into lines once for measuring, showing and searching it
+
+    :return: shared lines, must not be modified
+    """
+    # NOTE: same as how textual renders (and measures) Body widget
+    options = console.options.update_width(width).update(highlight=False)
+    return console.render_lines(Markdown(content, justify=justify), options, pad=False)  # type: ignore
+
+
+def lines_to_text(lines: list[list[RichSegment]]) -> str:
+    return "\n".join("".join(segment.text for segment in line) for line in lines)
+
+
+@lru_cache(maxsize=IMAGE_SIZES_CACHE_SIZE)
+def get_image_size(ebook: Ebook, src: str) -> tuple[int, int] | None:
+    """
+    :return: size of image `src` (without decoding it), None if it can't be loaded
+    """
+    try:
+        with PILImage.open(io.BytesIO(ebook.get_img_bytestr(src)[1])) as img:
+            return img.size
+    except IMAGE_ERRORS:
+        return None
+
+
+@lru_cache(maxsize=DECODED_IMAGES_CACHE_SIZE)
+def decode_image(ebook: Ebook, src: str) -> PILImage.Image:
+    with PILImage.open(io.BytesIO(ebook.get_img_bytestr(src)[1])) as img:
+        return img.convert("RGB")
+
+
+def _iter_cell_runs_numpy(img: PILImage.Image) -> Iterable[list[tuple[int, int]]]:
+    pixels = np.asarray(img, dtype=np.uint64)
+    packed = (pixels[..., 0] << np.uint64(16)) | (pixels[..., 1] << np.uint64(8)) | pixels[..., 2]
+    cells = (packed[0::2] << np.uint64(24)) | packed[1::2]
+    # every cell different from its left neighbour (or first in its line) starts a run
+    run_starts = np.ones(cells.shape, dtype=bool)
+    run_starts[:, 1:] = cells[:, 1:] != cells[:, :-1]
+    lines, columns = np.nonzero(run_starts)
+    lengths = np.diff(lines * cells.shape[1] + columns, append=cells.size).tolist()
+    runs = iter(zip(lengths, cells[lines, columns].tolist()))
+    for n_runs in np.bincount(lines, minlength=len(cells)).tolist():
+        yield list(islice(runs, n_runs))
+
+
+def _iter_cell_runs_python(img: PILImage.Image) -> Iterable[list[tuple[int, int]]]:
+    width, height = img.size
+    data = img.tobytes()
+    row_size = width * 3
+    for top in range(0, height * row_size, 2 * row_size):
+        bottom = top + row_size
+        cells = (
+            int.from_bytes(data[x : x + 3] + data[x + row_size : x + row_size + 3], "big")
+            for x in range(top, bottom, 3)
+        )
+        yield [(sum(1 for _ in run), cell) for cell, run in groupby(cells)]
+
+
+def image_to_ansi_text(img: PILImage.Image, width: int) -> Text:
+    """
+    Render RGB image `img` as `width` cells wide half-block truecolor text,
+    i.e. the same output as Text.from_ansi(climage._toAnsi(...)) but without going through
+    per pixel ansi escape codes; runs of identical cells share a single span
+
+    :param img: image in RGB mode
+    :param width: number of cells per line
+    """
+    height = int(img.height // (img.width / width))
+    # NOTE: two pixel rows per line
+    height -= height % 2
+    img = img.resize((width, height))
+
+    # NOTE: every cell is packed as a single int of its top & bottom pixels (8 bits per channel),
+    # i.e. 0xRRGGBBrrggbb for top pixel RRGGBB and bottom pixel rrggbb
+    iter_cell_runs = _iter_cell_runs_numpy if np is not None else _iter_cell_runs_python
+    colors: dict[int, Color] = {}
+    styles: dict[int, Style] = {}
+    spans: list[Span] = []
+    offset = 0
+    for runs in iter_cell_runs(img):
+        for length, cell in runs:
+            style = styles.get(cell)
+            if style is None:
+                top, bottom = cell >> 24, cell & 0xFFFFFF
+                for rgb in (top, bottom):
+                    if rgb not in colors:
+                        # NOTE: same as Color.from_rgb() without formatting the hex name twice
+                        triplet = ColorTriplet(rgb >> 16, (rgb >> 8) & 0xFF, rgb & 0xFF)
+                        colors[rgb] = Color(f"#{rgb:06x}", ColorType.TRUECOLOR, triplet=triplet)
+                style = styles[cell] = Style(color=colors[bottom], bgcolor=colors[top])
+            spans.append(Span(offset, offset + length, style))
+            offset += length
+        # newline
+        offset += 1
+
+    # NOTE: every line ends with a newline, same as climage
+    return Text(("▄" * width + "\n") * (height // 2), spans=spans)
+
+
+@lru_cache(maxsize=ANSI_IMAGES_CACHE_SIZE)
+def render_ansi_image(ebook: Ebook, src: str, width: int) -> Text:
+    """
+    Render image `src` as ansi image for `width` wide image widget,
+    safe to be called from worker threads
+    """
+    # NOTE: -1 for precaution on rounding of screen width
+    return image_to_ansi_text(decode_image(ebook, src), width - 1)
+
 
 class Table(DataTable):
     can_focus = False
@@ -45,30 +191,70 @@ class SegmentWidget(Widget):
     def get_text_at(self, y: int) -> str:
         return self.render_lines(Region(0, y, self.virtual_region_with_margin.width, 1))[0].text
 
+    def bind(self, content: str, nav_point: str | None) -> None:
+        """
+        Reuse this widget to show another segment
+        """
+        self.content = content
+        self.nav_point = nav_point
+        self.refresh(layout=True)
+
 
 class Body(SegmentWidget):
     def __init__(self, _: Ebook, config: Config, content: str, nav_point: str | None = None):
         super().__init__(config, nav_point)
         self.content = content
+        # laid out lines with the (width, justification, theme) they're laid out for
+        self._strips: tuple[tuple[int, str, Style], list[Strip]] | None = None
+
+    def bind(self, content: str, nav_point: str | None) -> None:
+        self._strips = None
+        super().bind(content, nav_point)
 
     def render(self):
         # NOTE: Markdwon rich isn't widget, so we cannot set using css
         # hence this translation workaround
-        return Markdown(
-            self.content, justify=dict(center="center", left="left", right="right", justify="full")[self.styles.text_align]  # type: ignore
-        )
+        return Markdown(self.content, justify=JUSTIFY[self.styles.text_align])  # type: ignore
 
-    def render_line(self, y) -> Strip:
-        strip = super().render_line(y)
-        for s in strip._segments:
-            if s.style is not None and s.style.link is not None:
+    def get_strips(self) -> list[Strip]:
+        """
+        :return: lines of this segment laid out for the current width, justification & theme
+        """
+        width = self.size.width
+        justify = JUSTIFY[self.styles.text_align]
+        key = width, justify, self.rich_style
+        if self._strips is None or self._strips[0] != key:
+            lines = render_markdown_lines(self.app.console, self.content, width, justify)
+            self._strips = key, [Strip(self._style_line(line)).adjust_cell_length(width, Style()) for line in lines]
+        return self._strips[1]
+
+    def _style_line(self, line: list[RichSegment]) -> list[RichSegment]:
+        # NOTE: same styling as textual's Widget.post_render()
+        # plus the links turned into clickable actions
+        style = self.rich_style
+        styled_line = []
+        for text, segment_style, _ in line:
+            segment_style = style + segment_style
+            if segment_style.link is not None:
                 link = (
-                    s.style.link
-                    if is_url(s.style.link) or self.nav_point is None
-                    else urljoin(self.nav_point, s.style.link)
+                    segment_style.link
+                    if is_url(segment_style.link) or self.nav_point is None
+                    else urljoin(self.nav_point, segment_style.link)
                 )
-                s.style._meta = dumps({"@click": f"link({link!r})"})
-        return strip
+                segment_style += Style.from_meta({"@click": f"link({link!r})"})
+            styled_line.append(RichSegment(text, segment_style))
+        return styled_line
+
+    def get_content_height(self, container: Size, viewport: Size, width: int) -> int:
+        return len(render_markdown_lines(self.app.console, self.content, width, JUSTIFY[self.styles.text_align]))
+
+    def render_line(self, y) -> Strip:
+        strips = self.get_strips()
+        return strips[y] if y < len(strips) else Strip.blank(self.size.width, self.rich_style)
+
+    def get_text_at(self, y: int) -> str:
+        strips = self.get_strips()
+        return strips[y].text if y < len(strips) else ""
 
 
 class Image(SegmentWidget):
@@ -78,24 +264,75 @@ class Image(SegmentWidget):
         self.content = src
         self.ebook = ebook
         self._renderable = Text("IMAGE", justify="center")
+        # width the ansi image is rendered (or being rendered) for
+        self._ansi_image_width: int | None = None
+        self._is_rendering = False
 
     def render(self):
         return self._renderable
 
+    def on_mount(self) -> None:
+        if self.config.show_image_as_ansi:
+            self.show_ansi_image()
+
+    def bind(self, content: str, nav_point: str | None) -> None:
+        self._renderable = Text("IMAGE", justify="center")
+        self._ansi_image_width = None
+        self._is_rendering = False
+        super().bind(content, nav_point)
+        if self.config.show_image_as_ansi:
+            self.show_ansi_image()
+
+    @staticmethod
+    def get_ansi_image_height(image_size: tuple[int, int], width: int) -> int:
+        """
+        :return: number of lines of ansi image shown inside `width` wide image widget
+        """
+        # NOTE: following image_to_ansi_text() resizing, two pixel rows per line
+        # plus the trailing newline which gets rendered as an empty line
+        image_width, image_height = image_size
+        height = int(image_height // (image_width / (width - 1)))
+        return (height - height % 2) // 2 + 1
+
     def show_ansi_image(self):
-        img = PILImage.open(io.BytesIO(self.ebook.get_img_bytestr(self.content)[1])).convert("RGB")
-        img_ansi = climage._toAnsi(
-            img,
-            # NOTE: -1 for precaution on rounding of screen width
-            oWidth=self.size.width - 1,
-            is_unicode=True,
-            color_type=climage.color_types.truecolor,
-            palette="default",
-        )
-        img.close()
-        self._renderable = Text.from_ansi(img_ansi)
+        # NOTE: not laid out yet, eg. when content gets mounted
+        # right away from parsed cache, so try again after refresh
+        if self.size.width <= 1:
+            self.call_after_refresh(self.show_ansi_image)
+            return
+        # NOTE: already rendered (or being rendered) for this width,
+        # eg. content got resized only vertically since more segments were loaded
+        if self._ansi_image_width == self.size.width:
+            return
+
+        src, width = self.content, self.size.width
+        self._ansi_image_width = width
+        self._is_rendering = True
+        self.refresh(layout=True)
+        # NOTE: render off the UI thread, keeping the placeholder meanwhile
+        worker = asyncio.get_running_loop().run_in_executor(None, render_ansi_image, self.ebook, src, width)
+        worker.add_done_callback(partial(self._on_ansi_image_rendered, src, width))
+
+    def _on_ansi_image_rendered(self, src: str, width: int, worker: asyncio.Future) -> None:
+        # NOTE: this widget may have been reused for another image
+        # or resized while rendering
+        if worker.cancelled() or (src, width) != (self.content, self._ansi_image_width):
+            return
+        self._is_rendering = False
+        try:
+            self._renderable = worker.result()
+        except IMAGE_ERRORS:
+            # NOTE: keep the placeholder for the images which can't be loaded
+            pass
         self.refresh(layout=True)
 
+    def get_content_height(self, container: Size, viewport: Size, width: int) -> int:
+        # NOTE: take up the space of the ansi image while it's being rendered
+        image_size = get_image_size(self.ebook, self.content) if self._is_rendering else None
+        if image_size is not None and width > 1:
+            return self.get_ansi_image_height(image_size, width)
+        return super().get_content_height(container, viewport, width)
+
     # TODO: "Click ot Open" on mouse hover
     # def on_mouse_move(self, _: events.MouseMove) -> None:
     #     self.styles.background = "red"
@@ -108,17 +345,24 @@ class PrettyBody(PrettyMarkdown):
     def __init__(self, _: Ebook, config: Config, value: str, nav_point: str | None = None):
         super().__init__(value)
         self.nav_point = nav_point
+        # y offset of each block with the (size, number of blocks) they're measured at
+        self._offsets: tuple[tuple[Size, int], list[int]] | None = None
+
+    @property
+    def offsets(self) -> list[int]:
+        key = self.size, len(self.children)
+        if self._offsets is None or self._offsets[0] != key:
+            self._offsets = key, [0, *accumulate(child.virtual_region_with_margin.height for child in self.children)]
+        return self._offsets[1]
 
     def get_text_at(self, y: int) -> str | None:
         # TODO: this implementation still has issue in positioning match
         # at the end of ebook segment
-        accumulated_height = 0
-        for child in self.children:
-            if accumulated_height + child.virtual_region_with_margin.height > y:
-                return child.render_lines(Region(0, y - accumulated_height, child.virtual_region_with_margin.width, 1))[
-                    0
-                ].text
-            accumulated_height += child.virtual_region_with_margin.height
+        offsets = self.offsets
+        index = bisect_right(offsets, y) - 1
+        if 0 <= index < len(self.children):
+            child = self.children[index]
+            return child.render_lines(Region(0, y - offsets[index], child.virtual_region_with_margin.width, 1))[0].text
 
 
 class SearchMatch(Widget):
@@ -132,6 +376,11 @@ class SearchMatch(Widget):
     def on_mount(self):
         self.styles.offset = (self.coordinate.x, self.coordinate.y)
 
+    def move_to(self, coordinate: Coordinate) -> None:
+        if coordinate != self.coordinate:
+            self.coordinate = coordinate
+            self.styles.offset = (coordinate.x, coordinate.y)
+
     def render(self):
         return self.match_str
 
@@ -149,30 +398,528 @@ class SearchMatch(Widget):
         )
 
 
+class Spacer(Widget):
+    """
+    Blank space standing in for the segments that aren't mounted
+    """
+
+    can_focus = False
+
+    def __init__(self):
+        super().__init__()
+        self.styles.height = 0
+
+    def render(self):
+        return ""
+
+    def render_line(self, y: int) -> Strip:
+        # NOTE: instead of rendering all the (maybe thousands of) blank lines
+        # whenever the height changes, only the visible ones are asked for
+        return Strip.blank(self.size.width, self.rich_style)
+
+
+@dataclass
+class SegmentRecord:
+    segment: Segment
+    # height at the current content width, None if not measured yet
+    height: int | None = None
+    # content width the height is measured at, 0 if the height is only estimated
+    width: int = 0
+
+
 class Content(Widget):
+    """
+    Virtualized ebook content: only segments inside the screen (plus `Overscan`
+    lines above & below it) get mounted as widgets, the rest are just records
+    with their measured heights taken up by a spacer above & below the mounted ones.
+    """
+
     can_focus = False
 
     def __init__(self, config: Config, ebook: Ebook):
         super().__init__()
         self.config = config
+        self.ebook = ebook
 
-        self._segments: list[SegmentWidget | PrettyBody] = []
-        for segment in ebook.iter_parsed_contents():
-            if segment.type == SegmentType.BODY:
-                component_cls = Body if not config.pretty else PrettyBody
-            else:
-                component_cls = Image
-            self._segments.append(component_cls(ebook, self.config, segment.content, segment.nav_point))
+        self._records: list[SegmentRecord] = []
+        # first segment index of each nav point
+        self._sections: dict[str, int] = {}
+        # width the segment heights are measured at
+        self._width = 0
+        # y offset of each segment (and the total height as the last item)
+        self._offsets: list[int] | None = None
+        self._search_index = SearchIndex()
+        # generation of the search index being built and its worker
+        self._search_index_build: tuple[int, asyncio.Future] | None = None
+        # coordinate returned for the last search match (the widget gets moved since),
+        # its widget, and its segment index & line in it
+        self._search_match: tuple[Coordinate, SearchMatch, int, int] | None = None
+
+        # mounted widgets by segment index
+        self._widgets: dict[int, SegmentWidget | PrettyBody] = {}
+        # hidden widgets waiting to be reused for other segments
+        self._free_widgets: dict[type[SegmentWidget], list[SegmentWidget]] = {}
+        self._top_spacer = Spacer()
+        self._bottom_spacer = Spacer()
+
+        # content width to lay out for once the timer fires
+        self._relayout_timer: tuple[int, Timer] | None = None
+        # segments before this index have their heights measured at the current width
+        self._measured_until = 0
+        # start time of the ongoing relayout
+        self._relayout_started: float | None = None
+        # segment and position inside it to be scrolled to once relayouted,
+        # and the scroll offset it was taken at
+        self._anchor: tuple[tuple[int, float], int] | None = None
+        # last anchor scrolled to and its y offset
+        self._restored_anchor: tuple[tuple[int, float], int] | None = None
+
+    def on_mount(self) -> None:
+        self.watch(self.screen, "scroll_y", self.refresh_window, init=False)
+        self.call_after_refresh(self._wait_for_width)
+
+    def on_unmount(self) -> None:
+        # NOTE: stop building the search index
+        self._search_index.reset(0)
+
+    def _wait_for_width(self) -> None:
+        # NOTE: content without any height doesn't get resize event,
+        # so wait for the first layout to measure the segments
+        if self.size.width == 0:
+            self.call_after_refresh(self._wait_for_width)
+        else:
+            self._update_width()
+
+    def add_segments(self, segments: Iterable[Segment]) -> None:
+        """
+        Add (the next batch of) parsed segments
+        """
+        start = len(self._records)
+        for segment in segments:
+            if segment.nav_point is not None:
+                self._sections.setdefault(segment.nav_point, len(self._records))
+            self._records.append(SegmentRecord(segment))
+        self._search_index.extend(len(self._records))
 
-    def get_navigables(self):
-        return [s for s in self._segments if s.nav_point is not None]
+        if not self._update_width() and self._width > 0:
+            for index in range(start, len(self._records)):
+                if not self._estimate(index, 0):
+                    self._remeasure(index)
+            self._offsets = None
+            # NOTE: only the new segments on the screen right away, the rest in small steps
+            self._measure_window(self.screen.scroll_offset.y)
+            self._measure_later(start)
+            self.refresh_window()
+            if self._search_index_build is not None:
+                self.build_search_index()
+
+    def _update_width(self) -> bool:
+        """
+        Lay out the segments again if the content width has changed:
+        the ones around the screen right away and the rest in small steps,
+        estimating their heights meanwhile
+        """
+        if self.size.width == self._width:
+            return False
+
+        started = time.perf_counter()
+        anchor = self._get_anchor()
+        previous_width, self._width = self._width, self.size.width
+        # NOTE: lines get wrapped differently, so index them again
+        self._search_index.reset(len(self._records))
+        for index, record in enumerate(self._records):
+            if record.width != self._width and not self._estimate(index, previous_width):
+                self._remeasure(index)
+        self._offsets = None
+
+        self._measure_window(self._get_anchor_y(anchor) if anchor is not None else self.screen.scroll_offset.y)
+        self._scroll_to_anchor(anchor)
+        self.refresh_window()
+        self.show_ansi_images()
+        if self._search_index_build is not None:
+            self.build_search_index()
+
+        self.log.debug(f"Relayout for width {self._width}: screen done in {time.perf_counter() - started:.3f}s")
+        self._measure_later(0)
+        self._relayout_started = started
+        return True
+
+    def _estimate(self, index: int, previous_width: int) -> bool:
+        """
+        Estimate the height of text segment without laying it out
+
+        :param previous_width: width its current height is measured (or estimated) at, 0 if none
+        :return: False if the segment isn't a text
+        """
+        record = self._records[index]
+        if record.segment.type != SegmentType.BODY:
+            return False
+        if record.height is not None and previous_width > 0:
+            # NOTE: text gets rewrapped roughly proportional to the width
+            record.height = math.ceil(record.height * previous_width / self._width)
+        else:
+            # NOTE: a line per width worth of characters plus the blank lines between paragraphs
+            content = record.segment.content
+            record.height = len(content) // self._width + 2 * content.count("\n\n") + 1
+        record.width = 0
+        return True
+
+    def _measure_window(self, scroll_y: int) -> None:
+        """
+        Measure the segments inside the screen (+ overscan) scrolled to `scroll_y` right away
+        """
+        for index in self._get_window(scroll_y):
+            if self._records[index].width != self._width:
+                self._remeasure(index)
+        self._offsets = None
+
+    def _measure_later(self, start: int) -> None:
+        """
+        Measure the segments with estimated heights (from `start` on) in small steps
+        """
+        self._measured_until = min(self._measured_until, start)
+        if self._relayout_started is None:
+            self._relayout_started = time.perf_counter()
+            self.set_timer(RELAYOUT_STEP_DURATION, self._continue_relayout)
+
+    def _continue_relayout(self) -> None:
+        self.measure_estimated(duration=RELAYOUT_STEP_DURATION)
+        if self._measured_until < len(self._records):
+            self.set_timer(RELAYOUT_STEP_DURATION, self._continue_relayout)
+        elif self._relayout_started is not None:
+            duration = time.perf_counter() - self._relayout_started
+            self.log.debug(f"Relayout for width {self._width}: all done in {duration:.3f}s")
+            self._relayout_started = None
+
+    def measure_estimated(self, *, duration: float | None = None) -> None:
+        """
+        Measure the segments whose heights are only estimated, keeping the reading position
+
+        :param duration: max seconds to spend on it, all of them if None
+        """
+        if self._measured_until >= len(self._records):
+            return
+
+        anchor = self._get_anchor()
+        deadline = time.perf_counter() + duration if duration is not None else math.inf
+        while self._measured_until < len(self._records) and time.perf_counter() < deadline:
+            if self._records[self._measured_until].width != self._width:
+                self._remeasure(self._measured_until)
+            self._measured_until += 1
+        self._offsets = None
+        self._scroll_to_anchor(anchor)
+        self.refresh_window()
+
+    def _get_anchor(self) -> tuple[int, float] | None:
+        """
+        :return: index of the segment at the top of the screen and the position inside it:
+            number of (non-space) characters before the top line for text, ratio of the height otherwise
+        """
+        # NOTE: not scrolled to the previous anchor yet
+        anchor = self._get_pending_anchor()
+        if anchor is not None:
+            return anchor
+        # NOTE: not scrolled since, keep the exact position instead of the one of the top line
+        if self._restored_anchor is not None and self._restored_anchor[1] == self.screen.scroll_offset.y:
+            return self._restored_anchor[0]
+
+        location = self.locate(self.screen.scroll_offset.y - self.virtual_region.y)
+        if location is None:
+            return None
+        index, y = location
+        if self._records[index].segment.type == SegmentType.BODY:
+            lines = self._get_segment_text(index).split("\n")
+            return index, sum(len("".join(line.split())) for line in lines[:y])
+        return index, y / self._records[index].height  # type: ignore
+
+    def _get_anchor_y(self, anchor: tuple[int, float]) -> int:
+        index, position = anchor
+        height = self._records[index].height or 0
+        if self._records[index].segment.type == SegmentType.BODY:
+            y = 0
+            for line in self._get_segment_text(index).split("\n"):
+                position -= len("".join(line.split()))
+                if position < 0:
+                    break
+                y += 1
+        else:
+            y = int(position * height)
+        return self.virtual_region.y + self.offsets[index] + min(y, max(height - 1, 0))
+
+    def _get_pending_anchor(self) -> tuple[int, float] | None:
+        if self._anchor is not None and self._anchor[1] != self.screen.scroll_offset.y:
+            # NOTE: scrolled by the reader meanwhile, so it's outdated
+            self._anchor = None
+        return self._anchor[0] if self._anchor is not None else None
+
+    def _scroll_to_anchor(self, anchor: tuple[int, float] | None) -> None:
+        if anchor is not None:
+            self._anchor = anchor, self.screen.scroll_offset.y
+            # NOTE: after refresh so the content height is updated
+            self.call_after_refresh(self._restore_anchor)
+
+    def _restore_anchor(self) -> None:
+        anchor = self._get_pending_anchor()
+        # NOTE: otherwise it gets restored once the content width is known, see _update_width()
+        if anchor is not None and self._width > 0:
+            y = self._get_anchor_y(anchor)
+            if (
+                y > self.screen.max_scroll_y
+                and self.screen.virtual_size.height < self.virtual_region.y + self.offsets[-1]
+            ):
+                # NOTE: screen isn't laid out for the current content height yet
+                self.call_after_refresh(self._restore_anchor)
+                return
+            # NOTE: before scrolling, since the scroll watchers may ask for the anchor
+            self._anchor = None
+            self._restored_anchor = anchor, y
+            # NOTE: right away, since scroll_to() waits for another refresh
+            self.screen.scroll_target_y = self.screen.scroll_y = y
+
+    @property
+    def is_restoring_position(self) -> bool:
+        """
+        Whether it's still waiting to be scrolled to the reading position
+        """
+        return self._get_pending_anchor() is not None
+
+    def get_reading_position(self) -> ReadingPosition | None:
+        anchor = self._get_anchor()
+        return ReadingPosition(*anchor) if anchor is not None else None
+
+    def scroll_to_reading_position(self, position: ReadingPosition) -> bool:
+        """
+        Scroll to `position`, laying out only the segments around it
+
+        :return: False if the segment of `position` isn't loaded yet
+        """
+        if position.segment_index >= len(self._records):
+            return False
+
+        anchor = position.segment_index, position.offset
+        if self._width > 0:
+            self._measure_window(self._get_anchor_y(anchor))
+        self._scroll_to_anchor(anchor)
+        return True
+
+    def _get_component_cls(self, segment: Segment) -> Type[SegmentWidget | PrettyBody]:
+        if segment.type == SegmentType.BODY:
+            return Body if not self.config.pretty else PrettyBody
+        else:
+            return Image
+
+    def _render_lines(self, content: str, width: int) -> list[list[RichSegment]]:
+        return render_markdown_lines(self.app.console, content, width, JUSTIFY[self.config.text_justification])
+
+    def _layout_text(self, index: int, console: Console, width: int, *, render_lines=render_markdown_lines) -> str:
+        segment = self._records[index].segment
+        if segment.type != SegmentType.BODY:
+            return ""
+        lines = render_lines(console, segment.content, width, JUSTIFY[self.config.text_justification])
+        return lines_to_text(lines)
+
+    def _get_segment_text(self, index: int) -> str:
+        text = self._search_index.texts[index]
+        if text is None:
+            text = self._layout_text(index, self.app.console, self._width)
+            self._search_index.texts[index] = text
+        return text
+
+    def build_search_index(self) -> None:
+        """
+        Index the text of the segments for searching in a background worker
+        """
+        generation = self._search_index.generation
+        if self._width == 0 or (
+            self._search_index_build is not None
+            and self._search_index_build[0] == generation
+            and not self._search_index_build[1].done()
+        ):
+            return
+
+        worker = asyncio.get_running_loop().run_in_executor(None, self._search_index.build, self._get_layout_text())
+        self._search_index_build = generation, worker
+
+    def _get_layout_text(self) -> Callable[[int], str]:
+        """
+        :return: `_layout_text` at the current width to be run in a worker thread
+        """
+        # NOTE: bypassing the layout cache so the segments on the screen stay cached,
+        # also the app isn't accessible from the worker thread
+        return partial(
+            self._layout_text,
+            console=self.app.console,
+            width=self._width,
+            render_lines=render_markdown_lines.__wrapped__,
+        )
+
+    async def _index_segment_text(self, index: int) -> str:
+        """
+        Like `_get_segment_text` but laying out the segment not indexed yet in a worker thread
+        """
+        text = self._search_index.texts[index]
+        if text is None:
+            generation = self._search_index.generation
+            text = await asyncio.get_running_loop().run_in_executor(None, self._get_layout_text(), index)
+            if generation == self._search_index.generation:
+                self._search_index.texts[index] = text
+        return text
+
+    def _remeasure(self, index: int) -> None:
+        record = self._records[index]
+        record.height = self._measure(index, self._width)
+        record.width = self._width
+
+    def _measure(self, index: int, width: int) -> int:
+        segment = self._records[index].segment
+        if segment.type == SegmentType.BODY:
+            lines = self._render_lines(segment.content, width)
+            # NOTE: index the text for searching while it's laid out anyway
+            self._search_index.texts[index] = lines_to_text(lines)
+            # NOTE: only an estimate for PrettyBody, corrected once it's mounted
+            return len(lines)
+
+        self._search_index.texts[index] = ""
+
+        # NOTE: image widget has border around it
+        image_size = get_image_size(self.ebook, segment.content) if self.config.show_image_as_ansi else None
+        if image_size is None or width <= 3:
+            return 1 + 2
+        return Image.get_ansi_image_height(image_size, width - 2) + 2
+
+    @property
+    def offsets(self) -> list[int]:
+        if self._offsets is None:
+            self._offsets = [0, *accumulate(record.height or 0 for record in self._records)]
+        return self._offsets
+
+    def refresh_window(self) -> None:
+        """
+        Mount the segments inside the screen (+ overscan) and free the rest
+        """
+        if self._width == 0:
+            return
+
+        # NOTE: not scrolled to the anchor yet
+        anchor = self._get_pending_anchor()
+        scroll_y = self._get_anchor_y(anchor) if anchor is not None else self.screen.scroll_offset.y
+        window = self._get_window(scroll_y)
+        # NOTE: lay out the estimated segments before mounting them,
+        # keeping the reading position since their heights change
+        while any(self._records[index].width != self._width for index in window):
+            anchor = self._get_anchor()
+            self._measure_window(scroll_y)
+            if anchor is not None:
+                scroll_y = self._get_anchor_y(anchor)
+                self._scroll_to_anchor(anchor)
+            window = self._get_window(scroll_y)
+
+        offsets = self.offsets
+        start, end = window.start, window.stop
+
+        for index in [index for index in self._widgets if index not in window]:
+            self._free(index)
+
+        previous: Widget = self._top_spacer
+        for index in window:
+            widget = self._widgets.get(index)
+            if widget is None:
+                widget = self._bind(index, after=previous)
+            previous = widget
+
+        self._top_spacer.styles.height = offsets[start]
+        self._bottom_spacer.styles.height = offsets[-1] - offsets[end]
+
+        # NOTE: the heights above the search match may have changed, eg. once laid out
+        if self._search_match is not None:
+            _, match_widget, index, line_y = self._search_match
+            match_widget.move_to(Coordinate(match_widget.coordinate.x, offsets[index] + line_y))
+
+    def _get_window(self, scroll_y: int) -> range:
+        """
+        :return: indices of the segments inside the screen (+ overscan) scrolled to `scroll_y`
+        """
+        offsets = self.offsets
+        top = scroll_y - self.virtual_region.y - self.config.overscan
+        bottom = top + self.screen.size.height + 2 * self.config.overscan
+        start = max(bisect_right(offsets, top) - 1, 0)
+        end = min(bisect_left(offsets, bottom), len(self._records))
+        return range(start, end)
+
+    def _bind(self, index: int, *, after: Widget) -> SegmentWidget | PrettyBody:
+        segment = self._records[index].segment
+        component_cls = self._get_component_cls(segment)
+        free_widgets = self._free_widgets.get(component_cls)  # type: ignore
+        if free_widgets:
+            widget = free_widgets.pop()
+            widget.bind(segment.content, segment.nav_point)
+            widget.display = True
+            self.move_child(widget, after=after)
+        else:
+            widget = component_cls(self.ebook, self.config, segment.content, segment.nav_point)
+            self.mount(widget, after=after)
+        self._widgets[index] = widget
+        return widget
+
+    def _free(self, index: int) -> None:
+        widget = self._widgets.pop(index)
+        if isinstance(widget, SegmentWidget):
+            widget.display = False
+            self._free_widgets.setdefault(type(widget), []).append(widget)
+        else:
+            widget.remove()
+
+    def _sync_heights(self) -> None:
+        # NOTE: actual heights of mounted widgets may differ from the measured ones,
+        # eg. PrettyBody or images which failed to render
+        is_changed = False
+        anchor = self._get_anchor()
+        for index, widget in self._widgets.items():
+            region = widget.virtual_region_with_margin
+            record = self._records[index]
+            if region.width > 0:
+                is_changed = is_changed or region.height != record.height
+                record.height, record.width = region.height, self._width
+        if is_changed:
+            self._offsets = None
+            self._scroll_to_anchor(anchor)
+            self.refresh_window()
+
+    def locate(self, y: int) -> tuple[int, int] | None:
+        """
+        :param y: offset relative to the content
+        :return: index of the segment at `y` and the offset inside that segment
+        """
+        offsets = self.offsets
+        index = bisect_right(offsets, y) - 1
+        if not 0 <= index < len(self._records):
+            return None
+        return index, y - offsets[index]
+
+    def get_section_at(self, y: int, nav_points: Container[str] | None = None) -> str | None:
+        """
+        :param y: offset relative to the screen
+        :param nav_points: only look for these nav points
+        :return: nav point of the section at `y`
+        """
+        location = self.locate(min(y - self.virtual_region.y, self.offsets[-1] - 1))
+        for index in reversed(range(location[0] + 1 if location is not None else 0)):
+            nav_point = self._records[index].segment.nav_point
+            if nav_point is not None and (nav_points is None or nav_point in nav_points):
+                return nav_point
+        return None
+
+    def get_section(self, nav_point: str) -> int | None:
+        """
+        :return: y offset of the first segment of `nav_point` (relative to the screen)
+        """
+        index = self._sections.get(nav_point)
+        return self.virtual_region.y + self.offsets[index] if index is not None else None
 
     def scroll_to_section(self, nav_point: str) -> None:
-        # TODO: add attr TocEntry.uuid so we can query("#{uuid}")
-        for s in self.get_navigables():
-            if s.nav_point == nav_point:
-                s.scroll_visible(top=True)
-                break
+        section_y = self.get_section(nav_point)
+        if section_y is not None:
+            self.screen.scroll_to(None, section_y, animate=False)
 
     def on_mouse_scroll_down(self, _: events.MouseScrollDown) -> None:
         self.screen.scroll_down()
@@ -184,41 +931,112 @@ class Content(Widget):
     def render(self):
         return ""
 
+    def render_line(self, y: int) -> Strip:
+        # NOTE: blank as well, see Spacer.render_line()
+        return Strip.blank(self.size.width, self.rich_style)
+
     def compose(self) -> ComposeResult:
-        yield from iter(self._segments)
+        yield self._top_spacer
+        yield self._bottom_spacer
 
     def get_text_at(self, y: int) -> str | None:
-        accumulated_height = 0
-        for segment in self._segments:
-            if accumulated_height + segment.virtual_region_with_margin.height > y:
-                return segment.get_text_at(y - accumulated_height)
-            accumulated_height += segment.virtual_region_with_margin.height
+        location = self.locate(y)
+        if location is None:
+            return None
+
+        index, line_y = location
+        segment = self._records[index].segment
+        widget = self._widgets.get(index)
+        if segment.type == SegmentType.BODY and (widget is None or isinstance(widget, Body)):
+            lines = self._get_segment_text(index).split("\n")
+            return lines[line_y] if line_y < len(lines) else None
+        elif widget is not None:
+            return widget.get_text_at(line_y)
 
     async def search_next(
         self, pattern_str: str, current_coord: Coordinate = Coordinate(-1, 0), forward: bool = True
     ) -> Coordinate | None:
         pattern = re.compile(pattern_str, re.IGNORECASE)
+        # NOTE: to skip the whole segment at once when it has no match in any of its lines
+        segment_pattern = re.compile(pattern_str, re.IGNORECASE | re.MULTILINE)
+        # NOTE: matches are found in the plain text index rather than laying out
+        # the whole content here, the segments not indexed yet get laid out in workers
+        self.build_search_index()
+
+        if len(self._records) == 0:
+            return None
+
+        # NOTE: the heights may have changed since the last match, so continue from its segment
+        if self._search_match is not None and self._search_match[0] == current_coord:
+            _, _, current_index, current_line_y = self._search_match
+        else:
+            offsets = self.offsets
+            current_index = min(max(bisect_right(offsets, current_coord.y) - 1, 0), len(self._records) - 1)
+            current_line_y = current_coord.y - offsets[current_index]
         current_x = current_coord.x
-        line_range = (
-            range(current_coord.y, self.virtual_size.height) if forward else reversed(range(0, current_coord.y + 1))
-        )
-        for linenr in line_range:
-            line_text = self.get_text_at(linenr)
-            if line_text is not None:
-                for match in pattern.finditer(line_text):
-                    is_next_match = (match.start() > current_x) if forward else (match.start() < current_x)
-                    if is_next_match:
-                        await self.clear_search()
-
-                        match_str = match.group()
-                        match_coord = Coordinate(match.start(), linenr)
-                        match_widget = SearchMatch(match_str, match_coord)
-                        await self.mount(match_widget)
-                        match_widget.scroll_visible()
-                        return match_coord
-            current_x = -1 if forward else self.size.width  # maybe virtual_size?
+        segment_range = range(current_index, len(self._records)) if forward else reversed(range(0, current_index + 1))
+        for index in segment_range:
+            widget = self._widgets.get(index)
+            if widget is None or isinstance(widget, Body):
+                text = await self._index_segment_text(index)
+                if segment_pattern.search(text) is None:
+                    current_x = -1 if forward else self.size.width
+                    continue
+                lines: Sequence[str | None] = text.split("\n")
+            else:
+                # NOTE: mounted, so already laid out
+                lines = [widget.get_text_at(line_y) for line_y in range(self._records[index].height or 0)]
+
+            if index != current_index:
+                line_range = range(len(lines)) if forward else reversed(range(len(lines)))
+            elif forward:
+                line_range = range(max(current_line_y, 0), len(lines))
+            else:
+                line_range = reversed(range(0, min(current_line_y + 1, len(lines))))
+            for line_y in line_range:
+                line_text = lines[line_y]
+                if line_text is not None:
+                    for match in pattern.finditer(line_text):
+                        is_next_match = (match.start() > current_x) if forward else (match.start() < current_x)
+                        if is_next_match:
+                            await self.clear_search()
+
+                            match_str = match.group()
+                            match_coord = Coordinate(match.start(), self._measure_match(index, line_y))
+                            match_widget = SearchMatch(match_str, match_coord)
+                            self._search_match = match_coord, match_widget, index, line_y
+                            await self.mount(match_widget)
+                            match_widget.scroll_visible()
+                            return match_coord
+                current_x = -1 if forward else self.size.width  # maybe virtual_size?
+
+    def _measure_match(self, index: int, line_y: int) -> int:
+        """
+        Lay out only the segments on the screen (+ overscan) wherever
+        the line at `line_y` of the segment at `index` gets scrolled into view
+
+        :return: y offset of the line relative to the content
+        """
+        while True:
+            y = self.offsets[index] + line_y
+            scroll_y = self.virtual_region.y + y
+            estimated = {
+                window_index
+                for window_index in chain(
+                    self._get_window(scroll_y - self.screen.size.height + 1), self._get_window(scroll_y), [index]
+                )
+                if self._records[window_index].width != self._width
+            }
+            if not estimated:
+                break
+            for window_index in estimated:
+                self._remeasure(window_index)
+            self._offsets = None
+        self.refresh_window()
+        return y
 
     async def clear_search(self) -> None:
+        self._search_match = None
         await self.query(SearchMatch.__name__).remove()
 
     def scroll_to_widget(self, *args, **kwargs) -> bool:
@@ -228,17 +1046,32 @@ class Content(Widget):
         if not self.config.show_image_as_ansi:
             return
 
-        # TODO: lazy load the images
-        # 1. Need to change how reading prog saved
-        #    instead of global 30%, save local by segment (ie. segment 3, 60%)
-        # 2. Only load image when scrolled in view. (Checkout `scroll_visible` in Widget/Screen)
-        for segment in self._segments:
-            if isinstance(segment, Image):
-                segment.show_ansi_image()
-        self.refresh(layout=True)
+        # NOTE: only the mounted images, the rest get shown once mounted
+        for widget in self._widgets.values():
+            if isinstance(widget, Image):
+                widget.show_ansi_image()
 
-    def on_resize(self):
-        self.show_ansi_images()
+    def on_resize(self) -> None:
+        if self.size.width == self._width:
+            self._cancel_relayout()
+            self._sync_heights()
+        elif self._width == 0:
+            self._update_width()
+        # NOTE: height changes while waiting, eg. when more segments got loaded
+        elif self._relayout_timer is None or self._relayout_timer[0] != self.size.width:
+            # NOTE: wait for more resize events while eg. the terminal window
+            # is being dragged, to lay out everything only once
+            self._cancel_relayout()
+            self._relayout_timer = self.size.width, self.set_timer(RELAYOUT_DELAY, self._relayout)
+
+    def _cancel_relayout(self) -> None:
+        if self._relayout_timer is not None:
+            self._relayout_timer[1].stop()
+            self._relayout_timer = None
+
+    def _relayout(self) -> None:
+        self._relayout_timer = None
+        self._update_width()
 
     # Already handled by self.styles.max_width
     # async def on_resize(self, event: events.Resize) -> None:
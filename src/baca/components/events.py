@@ -1,5 +1,7 @@
 from textual.message import Message
 
+from baca.models import Segment
+
 
 class DoneLoading(Message):
     def __init__(self, content):
@@ -7,6 +9,13 @@ class DoneLoading(Message):
         self.content = content
 
 
+class SegmentsLoaded(Message):
+    def __init__(self, segments: list[Segment], is_last: bool = False):
+        super().__init__()
+        self.segments = segments
+        self.is_last = is_last
+
+
 class FollowThis(Message):
     def __init__(self, nav_point: str):
         super().__init__()
@@ -32,6 +32,9 @@ def load_config() -> Config:
         pretty=bool(get_value("General", "Pretty", True)),
         page_scroll_duration=float(get_value("General", "PageScrollDuration")),
         show_image_as_ansi=bool(get_value("General", "ShowImageAsANSI", True)),
+        parsed_cache_size=int(get_value("General", "ParsedCacheSize")),
+        parsing_workers=int(get_value("General", "ParsingWorkers")),
+        overscan=int(get_value("General", "Overscan")),
         dark=Color(
             bg=str(get_value("Color Dark", "Background")),
             fg=str(get_value("Color Dark", "Foreground")),
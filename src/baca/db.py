@@ -18,6 +18,9 @@ obj2.save()
 Read more: http://docs.peewee-orm.com/en/latest/peewee/models.html?highlight=force_insert#id4
 """
 
+from playhouse.migrate import SqliteMigrator
+from playhouse.migrate import migrate as run_migrations
+
 from baca.exceptions import TableDoesNotExist
 from baca.models import DbMetadata, Migration, ReadingHistory, db
 
@@ -26,8 +29,22 @@ def initial_migration() -> None:
     db.create_tables([DbMetadata, ReadingHistory])
 
 
+def add_reading_position() -> None:
+    # NOTE: tables created by the initial migration already have the new columns
+    columns = {column.name for column in db.get_columns(ReadingHistory._meta.table_name)}  # type: ignore
+    migrator = SqliteMigrator(db)
+    run_migrations(
+        *(
+            migrator.add_column(ReadingHistory._meta.table_name, field.column_name, field)  # type: ignore
+            for field in [ReadingHistory.segment_index, ReadingHistory.segment_offset]
+            if field.column_name not in columns
+        )
+    )
+
+
 MIGRATIONS: list[Migration] = [
     Migration(version=0, migrate=initial_migration),
+    Migration(version=1, migrate=add_reading_position),
 ]
 
 
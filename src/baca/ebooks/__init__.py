@@ -1,5 +1,6 @@
 __all__ = [
     "Azw",
+    "CachedEbook",
     "Ebook",
     "Epub",
     "Mobi",
@@ -8,5 +9,6 @@ __all__ = [
 
 from baca.ebooks.azw import Azw
 from baca.ebooks.base import Ebook
+from baca.ebooks.cached import CachedEbook
 from baca.ebooks.epub import Epub
 from baca.ebooks.mobi import Mobi
@@ -1,13 +1,23 @@
+import multiprocessing
 import shutil
 import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import cached_property
 from pathlib import Path
-from typing import Iterator
+from typing import Callable, Iterator
+from urllib.parse import urldefrag
 
 from baca.models import BookMetadata, Segment, TocEntry
+from baca.utils.html_parser import parse_html_to_segmented_md
 
 
 class Ebook:
-    def __init__(self, ebook_path: Path):
+    def __init__(self, ebook_path: Path, *, max_workers: int | None = 1):
+        """
+        :param max_workers: number of processes the ebook may get opened with
+            (eg. to decompress its text), None to use all the cpu cores
+        """
         raise NotImplementedError()
 
     def get_tempdir(self) -> Path:
@@ -25,12 +35,71 @@ class Ebook:
     def cleanup(self) -> None:
         shutil.rmtree(self.get_tempdir())
 
-    # TODO: maybe cache @lru_cache
     def get_toc(self) -> tuple[TocEntry, ...]:
         raise NotImplementedError()
 
-    def iter_parsed_contents(self) -> Iterator[Segment]:
+    @cached_property
+    def _toc_fragments(self) -> dict[str, tuple[str, ...]]:
+        toc_fragments: dict[str, list[str]] = {}
+        for toc_entry in self.get_toc():
+            content, fragment = urldefrag(toc_entry.value)
+            if fragment != "":
+                toc_fragments.setdefault(content, []).append(fragment)
+        return {content: tuple(fragments) for content, fragments in toc_fragments.items()}
+
+    def get_toc_fragments(self, content: str) -> tuple[str, ...]:
+        """
+        :return: url fragments (ie. section ids) of toc entries pointing inside `content`
+        """
+        return self._toc_fragments.get(content, ())
+
+    def iter_parsed_contents(self, *, max_workers: int | None = 1) -> Iterator[Segment]:
+        """
+        :param max_workers: number of processes to parse the contents with,
+            1 to parse in the current process, None to use all cpu cores
+        """
+        raise NotImplementedError()
+
+    def _get_raw_text_reader(self) -> Callable[[str], str] | None:
+        """
+        :return: picklable equivalent of `get_raw_text` for parsing in worker processes,
+            None if there's nothing for them to read the contents from
+        """
+        return None
+
+    def _iter_parsed_contents_in_parallel(self, max_workers: int | None) -> Iterator[Segment]:
+        contents = [str(content) for content in self._get_contents()]
+        read_raw_text = self._get_raw_text_reader()
+        # NOTE: spawn instead of fork since the app has running threads
+        # (forking those might deadlock the worker processes)
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            # NOTE: without a reader the raw text of every content gets sent along instead,
+            # submitted as soon as it's read so the first ones get parsed meanwhile
+            futures: deque[Future[list[Segment]]] = deque()
+            for content in contents:
+                raw_text = read_raw_text if read_raw_text is not None else self.get_raw_text(content)
+                futures.append(executor.submit(parse_content, raw_text, content, list(self.get_toc_fragments(content))))
+                while futures and futures[0].done():
+                    yield from futures.popleft().result()
+            while futures:
+                yield from futures.popleft().result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _get_contents(self) -> tuple[str, ...] | tuple[ET.Element, ...]:
         raise NotImplementedError()
 
     def get_meta(self) -> BookMetadata:
         raise NotImplementedError("Ebook.get_meta() not implemented")
+
+
+def parse_content(raw_text: str | Callable[[str], str], content: str, ids_to_find: list[str]) -> list[Segment]:
+    """
+    Parse `content` in a worker process
+
+    :param raw_text: raw text of `content`, or the function to read it with
+    """
+    if callable(raw_text):
+        raw_text = raw_text(content)
+    return list(parse_html_to_segmented_md(raw_text, content, ids_to_find=ids_to_find))
@@ -0,0 +1,73 @@
+import threading
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Iterator, Type
+
+from baca.ebooks.base import Ebook
+from baca.models import BookMetadata, ParsedBook, Segment, TocEntry
+from baca.utils.book_cache import load_parsed_book, save_parsed_book
+
+
+class CachedEbook(Ebook):
+    """
+    Ebook wrapper that serves parsed segments, toc & metadata from
+    the on-disk parsed ebook cache, the wrapped ebook only gets
+    instantiated (ie. unpacked) when its files are actually needed,
+    eg. for opening images.
+    """
+
+    def __init__(self, ebook_path: Path, ebook_class: Type[Ebook], *, max_cache_size: int, max_workers: int | None = 1):
+        self._path = ebook_path.resolve()
+        self._ebook_class = ebook_class
+        self._max_workers = max_workers
+        self._ebook: Ebook | None = None
+        # NOTE: the files may be needed by several threads at once,
+        # eg. the UI one measuring images & the image rendering ones
+        self._ebook_lock = threading.Lock()
+        self._max_cache_size = max_cache_size
+        self._parsed_book = load_parsed_book(self._path)
+
+    @property
+    def ebook(self) -> Ebook:
+        with self._ebook_lock:
+            if self._ebook is None:
+                self._ebook = self._ebook_class(self._path, max_workers=self._max_workers)
+            return self._ebook
+
+    def get_tempdir(self) -> Path:
+        return self.ebook.get_tempdir()
+
+    def get_path(self) -> Path:
+        return self._path
+
+    def get_raw_text(self, content: str | ET.Element) -> str:
+        return self.ebook.get_raw_text(content)
+
+    def get_img_bytestr(self, image_id: str) -> tuple[str, bytes]:
+        return self.ebook.get_img_bytestr(image_id)
+
+    def cleanup(self) -> None:
+        with self._ebook_lock:
+            if self._ebook is not None:
+                self._ebook.cleanup()
+
+    def get_toc(self) -> tuple[TocEntry, ...]:
+        return self._parsed_book.toc if self._parsed_book is not None else self.ebook.get_toc()
+
+    def get_meta(self) -> BookMetadata:
+        return self._parsed_book.metadata if self._parsed_book is not None else self.ebook.get_meta()
+
+    def iter_parsed_contents(self, *, max_workers: int | None = 1) -> Iterator[Segment]:
+        if self._parsed_book is not None:
+            yield from self._parsed_book.segments
+            return
+
+        segments: list[Segment] = []
+        for segment in self.ebook.iter_parsed_contents(max_workers=max_workers):
+            segments.append(segment)
+            yield segment
+
+        self._parsed_book = ParsedBook(
+            segments=tuple(segments), toc=self.ebook.get_toc(), metadata=self.ebook.get_meta()
+        )
+        save_parsed_book(self._path, self._parsed_book, self._max_cache_size)
@@ -2,13 +2,14 @@ import dataclasses
 import os
 import xml.etree.ElementTree as ET
 import zipfile
-import zlib
+from functools import cache, cached_property, partial
 from pathlib import Path
+from types import MappingProxyType
 from typing import Callable, Iterator
-from urllib.parse import unquote, urljoin, urlparse
+from urllib.parse import unquote, urljoin
 
 from baca.ebooks.base import Ebook
-from baca.models import BookMetadata, Segment, TocEntry
+from baca.models import BookMetadata, EpubPackage, ManifestItem, Segment, TocEntry
 from baca.utils.html_parser import parse_html_to_segmented_md
 from baca.utils.tempdir import create_tempdir
 
@@ -24,41 +25,75 @@ class Epub(Ebook):
         "DC": "http://purl.org/dc/elements/1.1/",
     }
 
-    def __init__(self, ebook_path: Path):
+    def __init__(self, ebook_path: Path, *, max_workers: int | None = 1):
+        # NOTE: the spine documents are read lazily from the zip,
+        # in a worker pool only when ParsingWorkers > 1
         self._path = ebook_path.resolve()
         self._file: zipfile.ZipFile = zipfile.ZipFile(ebook_path, "r")
         self._tempdir = create_tempdir()
 
+    @staticmethod
+    def _is_toc_item(manifest_item: ManifestItem) -> bool:
+        # EPUB2 toc.ncx or EPUB3 nav document
+        properties = (manifest_item.properties or "").split()
+        return manifest_item.media_type == "application/x-dtbncx+xml" or "nav" in properties
+
+    @staticmethod
+    def _parse_package(content_opf: ET.ElementTree) -> EpubPackage:
+        version = content_opf.getroot().get("version")  # type: ignore
+
+        # NOTE: index manifest items by id once, so resolving spine items
+        # and other lookups (eg. by href or media-type) stay linear
+        manifest: dict[str, ManifestItem] = {}
+        for manifest_elem in content_opf.findall("OPF:manifest/*", Epub.NAMESPACE):
+            manifest_item = ManifestItem(
+                id=manifest_elem.get("id"),  # type: ignore
+                href=manifest_elem.get("href"),  # type: ignore
+                media_type=manifest_elem.get("media-type"),
+                properties=manifest_elem.get("properties"),
+            )
+            # keep the first item on duplicate ids
+            manifest.setdefault(manifest_item.id, manifest_item)
+
+        spine = tuple(
+            spine_elem.get("idref") for spine_elem in content_opf.findall("OPF:spine/*", Epub.NAMESPACE)  # type: ignore
+        )
+
+        metadata: dict[str, str | None] = {}
+        for field in dataclasses.fields(BookMetadata):
+            element = content_opf.find(f".//DC:{field.name}", Epub.NAMESPACE)
+            if element is not None:
+                metadata[field.name] = element.text
+
+        if version in {"1.0", "2.0"}:
+            # "OPF:manifest/*[@id='ncx']"
+            toc_item = next((m for m in manifest.values() if m.media_type == "application/x-dtbncx+xml"), None)
+        elif version == "3.0":
+            toc_item = next((m for m in manifest.values() if "nav" in (m.properties or "").split()), None)
+        else:
+            raise NotImplementedError(f"Unsupported Epub version: {version}")
+
+        return EpubPackage(
+            version=version,
+            manifest=MappingProxyType(manifest),
+            spine=spine,
+            metadata=BookMetadata(**metadata),
+            toc_href=toc_item.href if toc_item is not None else None,
+        )
+
     @staticmethod
     def _parse_content_opf(
-        content_opf: ET.ElementTree, root_dirpath: str, *, path_resolver: Callable = urljoin
+        package: EpubPackage, root_dirpath: str, *, path_resolver: Callable = urljoin
     ) -> tuple[str, ...]:
-        # cont = ET.parse(self.file.open(self.root_filepath)).getroot()
-        manifests: list[tuple[str, str]] = []
-        for manifest_elem in content_opf.findall("OPF:manifest/*", Epub.NAMESPACE):
-            # EPUB3
-            # if manifest_elem.get("id") != "ncx" and manifest_elem.get("properties") != "nav":
-            if (
-                manifest_elem.get("media-type") != "application/x-dtbncx+xml"
-                and manifest_elem.get("properties") != "nav"
-            ):
-                manifest_id = manifest_elem.get("id")
-                manifest_href = manifest_elem.get("href")
-                manifests.append((manifest_id, manifest_href))  # type: ignore
-
-        spines: list[str] = []
         contents: list[str] = []
-        for spine_elem in content_opf.findall("OPF:spine/*", Epub.NAMESPACE):
-            idref = spine_elem.get("idref")
-            spines.append(idref)  # type: ignore
-        for spine in spines:
-            for manifest in manifests:
-                if spine == manifest[0]:
-                    # book_contents.append(root_dirpath + unquote(manifest[1]))
-                    contents.append(unquote(manifest[1]))
-                    manifests.remove(manifest)
-                    # TODO: test is break necessary
-                    break
+        seen_idrefs: set[str] = set()
+        for idref in package.spine:
+            manifest_item = package.manifest.get(idref)
+            # skip spine items missing from manifest & duplicated ones
+            if manifest_item is None or idref in seen_idrefs or Epub._is_toc_item(manifest_item):
+                continue
+            seen_idrefs.add(idref)
+            contents.append(unquote(manifest_item.href))
 
         return tuple(path_resolver(root_dirpath, content) for content in contents)
 
@@ -100,13 +135,13 @@ class Epub(Ebook):
                 )
         return tuple(toc_entries)
 
-    @property
+    @cached_property
     def _root_filepath(self) -> str:
         container = ET.parse(self._file.open("META-INF/container.xml"))
         rootfile_elem = container.find("CONT:rootfiles/CONT:rootfile", Epub.NAMESPACE)
         return rootfile_elem.attrib["full-path"]  # type: ignore
 
-    @property
+    @cached_property
     def _root_dirpath(self) -> str:
         dirname = os.path.dirname(self._root_filepath)
         return f"{dirname}/" if dirname != "" else ""
@@ -115,19 +150,14 @@ class Epub(Ebook):
     def _content_opf(self) -> ET.ElementTree:
         return ET.parse(self._file.open(self._root_filepath))
 
+    @cached_property
+    def _package(self) -> EpubPackage:
+        # NOTE: parse content.opf once and keep only the immutable package model
+        return Epub._parse_package(self._content_opf)
+
     @property
     def _relactive_toc_ncx_path(self) -> str:
-        if self._version in {"1.0", "2.0"}:
-            # "OPF:manifest/*[@id='ncx']"
-            relative_toc = self._content_opf.find(
-                "OPF:manifest/*[@media-type='application/x-dtbncx+xml']", Epub.NAMESPACE
-            )
-        elif self._version == "3.0":
-            relative_toc = self._content_opf.find("OPF:manifest/*[@properties='nav']", Epub.NAMESPACE)
-        else:
-            raise NotImplementedError(f"Unsupported Epub version: {self._version}")
-
-        return relative_toc.get("href")  # type: ignore
+        return self._package.toc_href  # type: ignore
 
     @property
     def _toc_ncx(self) -> ET.Element:
@@ -136,10 +166,18 @@ class Epub(Ebook):
 
     @property
     def _version(self) -> str:
-        return self._content_opf.getroot().get("version")  # type: ignore
+        return self._package.version
+
+    @cached_property
+    def _contents(self) -> tuple[str, ...]:
+        return Epub._parse_content_opf(self._package, self._root_dirpath)
+
+    @cached_property
+    def _toc(self) -> tuple[TocEntry, ...]:
+        return Epub._parse_toc(self._toc_ncx, self._version, self._root_dirpath)
 
     def _get_contents(self) -> tuple[str, ...] | tuple[ET.Element, ...]:
-        return Epub._parse_content_opf(self._content_opf, self._root_dirpath)
+        return self._contents
 
     def get_path(self) -> Path:
         return self._path
@@ -148,49 +186,45 @@ class Epub(Ebook):
         return self._tempdir
 
     def get_meta(self) -> BookMetadata:
-        metadata: dict[str, str | None] = {}
-        for field in dataclasses.fields(BookMetadata):
-            element = self._content_opf.find(f".//DC:{field.name}", Epub.NAMESPACE)
-            if element is not None:
-                metadata[field.name] = element.text
-        return BookMetadata(**metadata)
+        return self._package.metadata
 
     def get_toc(self) -> tuple[TocEntry, ...]:
-        return Epub._parse_toc(self._toc_ncx, self._version, self._root_dirpath)
+        return self._toc
 
     def get_raw_text(self, content_path: str | ET.Element) -> str:
         assert isinstance(content_path, str)
+        return self._file.read(content_path).decode("utf-8")
 
-        max_tries: int | None = None
-
-        # use try-except block to catch
-        # zlib.error: Error -3 while decompressing data: invalid distance too far back
-        # seems like caused by multiprocessing
-        tries = 0
-        while True:
-            try:
-                content = self._file.open(content_path).read()
-                break
-            except zlib.error as e:
-                tries += 1
-                if max_tries is not None and tries >= max_tries:
-                    raise e
-
-        return content.decode("utf-8")
+    def _get_raw_text_reader(self) -> Callable[[str], str]:
+        """
+        :return: picklable equivalent of `get_raw_text` for parsing in worker processes
+        """
+        assert self._file.filename is not None
+        return partial(read_zipped_text, self._file.filename)
 
     def get_img_bytestr(self, impath: str) -> tuple[str, bytes]:
         assert isinstance(self._file, zipfile.ZipFile)
         unquoted_impath = unquote(impath)
         return os.path.basename(unquoted_impath), self._file.read(unquoted_impath)
 
-    def iter_parsed_contents(self) -> Iterator[Segment]:
-        toc_entries = self.get_toc()
+    def iter_parsed_contents(self, *, max_workers: int | None = 1) -> Iterator[Segment]:
+        if max_workers != 1 and len(self._get_contents()) > 1:
+            yield from self._iter_parsed_contents_in_parallel(max_workers)
+            return
+
         for content in self._get_contents():
-            ids_for_this_content = [
-                urlparse(t.value).fragment
-                for t in toc_entries
-                if t.value.startswith(content) and urlparse(t.value).fragment != ""
-            ]
+            ids_for_this_content = list(self.get_toc_fragments(str(content)))
             raw = self.get_raw_text(content)
             for segment in parse_html_to_segmented_md(raw, str(content), ids_to_find=ids_for_this_content):
                 yield segment
+
+
+@cache
+def _open_zipfile(filename: str) -> zipfile.ZipFile:
+    return zipfile.ZipFile(filename, "r")
+
+
+def read_zipped_text(filename: str, content_path: str) -> str:
+    # NOTE: every worker process opens its own ZipFile handle, sharing one
+    # across processes leads to "zlib.error: Error -3 while decompressing data"
+    return _open_zipfile(filename).read(content_path).decode("utf-8")
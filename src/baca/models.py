@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
-from typing import Callable, Literal
+from typing import Callable, Literal, Mapping
 
 from peewee import (
     CharField,
@@ -35,12 +35,28 @@ class ReadingHistory(BaseModel):
     title = CharField(null=True)
     author = CharField(null=True)
     reading_progress = FloatField(null=False)
+    # see ReadingPosition, null if only the reading progress is saved
+    segment_index = IntegerField(null=True)
+    segment_offset = FloatField(null=True)
     last_read = DateTimeField(default=datetime.now, null=False)
 
     class Meta:
         table_name = "reading_history"
 
 
+@dataclass(frozen=True)
+class ReadingPosition:
+    """
+    Reading position relative to the segment at the top of the screen,
+    so it doesn't depend on the layout of the rest of the ebook
+    """
+
+    # index of the segment in the parsed contents
+    segment_index: int
+    # number of (non-space) characters before the top line for text, ratio of the height otherwise
+    offset: float
+
+
 @dataclass(frozen=True)
 class Migration:
     version: int
@@ -88,6 +104,9 @@ class Config:
     pretty: bool
     page_scroll_duration: float
     show_image_as_ansi: bool
+    parsed_cache_size: int
+    parsing_workers: int
+    overscan: int
     dark: Color
     light: Color
     keymaps: Keymaps
@@ -106,6 +125,25 @@ class BookMetadata:
     source: str | None = None
 
 
+@dataclass(frozen=True)
+class ManifestItem:
+    id: str
+    href: str
+    media_type: str | None = None
+    properties: str | None = None
+
+
+@dataclass(frozen=True)
+class EpubPackage:
+    version: str
+    # manifest items keyed by id, in document order
+    manifest: Mapping[str, ManifestItem]
+    spine: tuple[str, ...]
+    metadata: BookMetadata
+    # relative path of toc.ncx (epub2) or nav document (epub3)
+    toc_href: str | None
+
+
 @dataclass(frozen=True)
 class TocEntry:
     label: str
@@ -119,6 +157,13 @@ class Segment:
     nav_point: str | None
 
 
+@dataclass(frozen=True)
+class ParsedBook:
+    segments: tuple[Segment, ...]
+    toc: tuple[TocEntry, ...]
+    metadata: BookMetadata
+
+
 @dataclass(frozen=True)
 class KeyMap:
     keys: list[str]
@@ -465,7 +465,7 @@ def processPrintReplica(metadata, files, rscnames, mh):
     opf.writeOPF()
 
 
-def processMobi8(mh, metadata, sect, files, rscnames, pagemapproc, k8resc, obfuscate_data, apnxfile=None, epubver='2'):
+def processMobi8(mh, metadata, sect, files, rscnames, pagemapproc, k8resc, obfuscate_data, apnxfile=None, epubver='2', zipup=True):
     global DUMP
     global WRITE_RAW_DATA
 
@@ -599,8 +599,11 @@ def processMobi8(mh, metadata, sect, files, rscnames, pagemapproc, k8resc, obfus
         nav.writeNAV(ncx_data, guidetext, metadata)
 
     # make an epub-like structure of it all
-    print("Creating an epub-like file")
-    files.makeEPUB(usedmap, obfuscate_data, uuid)
+    if zipup:
+        print("Creating an epub-like file")
+    else:
+        print("Creating an epub-like structure")
+    files.makeEPUB(usedmap, obfuscate_data, uuid, zipup)
 
 
 def processMobi7(mh, metadata, sect, files, rscnames):
@@ -733,7 +736,7 @@ def processUnknownSections(mh, sect, files, K8Boundary):
             sect.setsectiondescription(i, description)
 
 
-def process_all_mobi_headers(files, apnxfile, sect, mhlst, K8Boundary, k8only=False, epubver='2', use_hd=False):
+def process_all_mobi_headers(files, apnxfile, sect, mhlst, K8Boundary, k8only=False, epubver='2', use_hd=False, zipup=True):
     global DUMP
     global WRITE_RAW_DATA
     rscnames = []
@@ -846,7 +849,7 @@ def process_all_mobi_headers(files, apnxfile, sect, mhlst, K8Boundary, k8only=Fa
 
         # KF8 (Mobi 8)
         if mh.isK8():
-            processMobi8(mh, metadata, sect, files, rscnames, pagemapproc, k8resc, obfuscate_data, apnxfile, epubver)
+            processMobi8(mh, metadata, sect, files, rscnames, pagemapproc, k8resc, obfuscate_data, apnxfile, epubver, zipup)
 
         # Old Mobi (Mobi 7)
         elif not k8only:
@@ -858,7 +861,7 @@ def process_all_mobi_headers(files, apnxfile, sect, mhlst, K8Boundary, k8only=Fa
     return
 
 
-def unpackBook(infile, outdir, apnxfile=None, epubver='2', use_hd=False, dodump=False, dowriteraw=False, dosplitcombos=False):
+def unpackBook(infile, outdir, apnxfile=None, epubver='2', use_hd=False, dodump=False, dowriteraw=False, dosplitcombos=False, doskipepubzip=False):
     global DUMP
     global WRITE_RAW_DATA
     global SPLIT_COMBO_MOBIS
@@ -877,62 +880,65 @@ def unpackBook(infile, outdir, apnxfile=None, epubver='2', use_hd=False, dodump=
     files = fileNames(infile, outdir)
 
     # process the PalmDoc database header and verify it is a mobi
-    sect = Sectionizer(infile)
-    if sect.ident != b'BOOKMOBI' and sect.ident != b'TEXtREAd':
-        raise unpackException('Invalid file format')
-    if DUMP:
-        sect.dumppalmheader()
-    else:
-        print("Palm DB type: %s, %d sections." % (sect.ident.decode('utf-8'),sect.num_sections))
+    sect = Sectionizer(infile, use_mmap=True)
+    try:
+        if sect.ident != b'BOOKMOBI' and sect.ident != b'TEXtREAd':
+            raise unpackException('Invalid file format')
+        if DUMP:
+            sect.dumppalmheader()
+        else:
+            print("Palm DB type: %s, %d sections." % (sect.ident.decode('utf-8'),sect.num_sections))
 
-    # scan sections to see if this is a compound mobi file (K8 format)
-    # and build a list of all mobi headers to process.
-    mhlst = []
-    mh = MobiHeader(sect,0)
-    # if this is a mobi8-only file hasK8 here will be true
-    mhlst.append(mh)
-    K8Boundary = -1
+        # scan sections to see if this is a compound mobi file (K8 format)
+        # and build a list of all mobi headers to process.
+        mhlst = []
+        mh = MobiHeader(sect,0)
+        # if this is a mobi8-only file hasK8 here will be true
+        mhlst.append(mh)
+        K8Boundary = -1
 
-    if mh.isK8():
-        print("Unpacking a KF8 book...")
-        hasK8 = True
-    else:
-        # This is either a Mobipocket 7 or earlier, or a combi M7/KF8
-        # Find out which
-        hasK8 = False
-        for i in range(len(sect.sectionoffsets)-1):
-            before, after = sect.sectionoffsets[i:i+2]
-            if (after - before) == 8:
-                data = sect.loadSection(i)
-                if data == K8_BOUNDARY:
-                    sect.setsectiondescription(i,"Mobi/KF8 Boundary Section")
-                    mh = MobiHeader(sect,i+1)
-                    hasK8 = True
-                    mhlst.append(mh)
-                    K8Boundary = i
-                    break
-        if hasK8:
-            print("Unpacking a Combination M{0:d}/KF8 book...".format(mh.version))
-            if SPLIT_COMBO_MOBIS:
-                # if this is a combination mobi7-mobi8 file split them up
-                mobisplit = mobi_split(infile)
-                if mobisplit.combo:
-                    outmobi7 = os.path.join(files.outdir, 'mobi7-'+files.getInputFileBasename() + '.mobi')
-                    outmobi8 = os.path.join(files.outdir, 'mobi8-'+files.getInputFileBasename() + '.azw3')
-                    with open(pathof(outmobi7), 'wb') as f:
-                        f.write(mobisplit.getResult7())
-                    with open(pathof(outmobi8), 'wb') as f:
-                        f.write(mobisplit.getResult8())
+        if mh.isK8():
+            print("Unpacking a KF8 book...")
+            hasK8 = True
         else:
-            print("Unpacking a Mobipocket {0:d} book...".format(mh.version))
+            # This is either a Mobipocket 7 or earlier, or a combi M7/KF8
+            # Find out which
+            hasK8 = False
+            for i in range(len(sect.sectionoffsets)-1):
+                before, after = sect.sectionoffsets[i:i+2]
+                if (after - before) == 8:
+                    data = sect.loadSection(i)
+                    if data == K8_BOUNDARY:
+                        sect.setsectiondescription(i,"Mobi/KF8 Boundary Section")
+                        mh = MobiHeader(sect,i+1)
+                        hasK8 = True
+                        mhlst.append(mh)
+                        K8Boundary = i
+                        break
+            if hasK8:
+                print("Unpacking a Combination M{0:d}/KF8 book...".format(mh.version))
+                if SPLIT_COMBO_MOBIS:
+                    # if this is a combination mobi7-mobi8 file split them up
+                    mobisplit = mobi_split(infile)
+                    if mobisplit.combo:
+                        outmobi7 = os.path.join(files.outdir, 'mobi7-'+files.getInputFileBasename() + '.mobi')
+                        outmobi8 = os.path.join(files.outdir, 'mobi8-'+files.getInputFileBasename() + '.azw3')
+                        with open(pathof(outmobi7), 'wb') as f:
+                            f.write(mobisplit.getResult7())
+                        with open(pathof(outmobi8), 'wb') as f:
+                            f.write(mobisplit.getResult8())
+            else:
+                print("Unpacking a Mobipocket {0:d} book...".format(mh.version))
 
-    if hasK8:
-        files.makeK8Struct()
+        if hasK8:
+            files.makeK8Struct()
 
-    process_all_mobi_headers(files, apnxfile, sect, mhlst, K8Boundary, False, epubver, use_hd)
+        process_all_mobi_headers(files, apnxfile, sect, mhlst, K8Boundary, False, epubver, use_hd, not doskipepubzip)
 
-    if DUMP:
-        sect.dumpsectionsinfo()
+        if DUMP:
+            sect.dumpsectionsinfo()
+    finally:
+        sect.close()
     return
 
 
@@ -943,7 +949,7 @@ def usage(progname):
     print("  or an unencrypted Kindle/Print Replica ebook to PDF and images")
     print("  into the specified output folder.")
     print("Usage:")
-    print("  %s -r -s -p apnxfile -d -h --epub_version= infile [outdir]" % progname)
+    print("  %s -r -s -p apnxfile -d -h --epub_version= --no_epub_zip infile [outdir]" % progname)
     print("Options:")
     print("    -h                 print this help message")
     print("    -i                 use HD Images, if present, to overwrite reduced resolution images")
@@ -951,6 +957,7 @@ def usage(progname):
     print("    -p APNXFILE        path to an .apnx file associated with the azw3 input (optional)")
     print("    --epub_version=    specify epub version to unpack to: 2, 3, A (for automatic) or ")
     print("                         F (force to fit to epub2 definitions), default is 2")
+    print("    --no_epub_zip      only unpack the epub-like tree of mobi8, without zipping it up into an epub")
     print("    -d                 dump headers and other info to output and extra files")
     print("    -r                 write raw data to the output folder")
 
@@ -970,7 +977,7 @@ def main(argv=unicode_argv()):
 
     progname = os.path.basename(argv[0])
     try:
-        opts, args = getopt.getopt(argv[1:], "dhirsp:", ['epub_version='])
+        opts, args = getopt.getopt(argv[1:], "dhirsp:", ['epub_version=', 'no_epub_zip'])
     except getopt.GetoptError as err:
         print(str(err))
         usage(progname)
@@ -983,6 +990,7 @@ def main(argv=unicode_argv()):
     apnxfile = None
     epubver = '2'
     use_hd = False
+    doskipepubzip = False
 
     for o, a in opts:
         if o == "-h":
@@ -1000,6 +1008,8 @@ def main(argv=unicode_argv()):
             apnxfile = a
         if o == "--epub_version":
             epubver = a
+        if o == "--no_epub_zip":
+            doskipepubzip = True
 
     if len(args) > 1:
         infile, outdir = args
@@ -1014,7 +1024,7 @@ def main(argv=unicode_argv()):
 
     try:
         print('Unpacking Book...')
-        unpackBook(infile, outdir, apnxfile, epubver, use_hd)
+        unpackBook(infile, outdir, apnxfile, epubver, use_hd, doskipepubzip=doskipepubzip)
         print('Completed')
 
     except ValueError as e:
@@ -17,6 +17,7 @@ from .compatibility_utils import PY2, unicode_str, hexlify, bord
 if PY2:
     range = xrange
 
+import os
 import struct
 import uuid
 
@@ -24,6 +25,10 @@ import uuid
 from .mobi_utils import getLanguage
 from .mobi_uncompress import HuffcdicReader, PalmdocReader, UncompressedReader
 
+# huffman coded books with fewer text records aren't worth starting worker processes for
+HUFF_PARALLEL_MIN_RECORDS = 512
+
+
 class unpackException(Exception):
     pass
 
@@ -540,6 +545,7 @@ class MobiHeader:
 
         # set up for decompression/unpacking
         self.compression, = struct.unpack_from(b'>H', self.header, 0x0)
+        self.huffReader = None
         if self.compression == 0x4448:
             reader = HuffcdicReader()
             huffoff, huffnum = struct.unpack_from(b'>LL', self.header, 0x70)
@@ -550,6 +556,7 @@ class MobiHeader:
                 self.sect.setsectiondescription(huffoff+i,"Huffman CDIC Compression Seed %d" % i)
                 reader.loadCdic(self.sect.loadSection(huffoff+i))
             self.unpack = reader.unpack
+            self.huffReader = reader
         elif self.compression == 2:
             self.unpack = PalmdocReader().unpack
         elif self.compression == 1:
@@ -812,7 +819,7 @@ class MobiHeader:
                 return getLanguage(langid, sublangid)
         return False
 
-    def getRawML(self):
+    def getRawML(self, max_workers=1):
         def getSizeOfTrailingDataEntry(data):
             num = 0
             for v in data[-4:]:
@@ -825,7 +832,7 @@ class MobiHeader:
                 num = getSizeOfTrailingDataEntry(data)
                 data = data[:-num]
             if multibyte:
-                num = (ord(data[-1:]) & 3) + 1
+                num = (bord(data[-1]) & 3) + 1
                 data = data[:-num]
             return data
         multibyte = 0
@@ -842,17 +849,21 @@ class MobiHeader:
                     flags = flags >> 1
         # get raw mobi markup languge
         print("Unpacking raw markup language")
-        dataList = []
+        records = []
         # offset = 0
         for i in range(1, self.records+1):
-            data = trimTrailingDataEntries(self.sect.loadSection(self.start + i))
-            dataList.append(self.unpack(data))
+            records.append(trimTrailingDataEntries(self.sect.loadSectionView(self.start + i)))
             if self.isK8():
                 self.sect.setsectiondescription(self.start + i,"KF8 Text Section {0:d}".format(i))
             elif self.version == 0:
                 self.sect.setsectiondescription(self.start + i,"PalmDOC Text Section {0:d}".format(i))
             else:
                 self.sect.setsectiondescription(self.start + i,"Mobipocket Text Section {0:d}".format(i))
+        workers = max_workers or os.cpu_count() or 1
+        if self.huffReader is not None and workers > 1 and len(records) >= HUFF_PARALLEL_MIN_RECORDS:
+            dataList = self.huffReader.unpackRecords(records, workers)
+        else:
+            dataList = [self.unpack(data) for data in records]
         rawML = b''.join(dataList)
         self.rawSize = len(rawML)
         return rawML
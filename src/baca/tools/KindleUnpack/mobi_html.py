@@ -15,6 +15,36 @@ import re
 
 from .mobi_utils import fromBase32
 
+# the rewrites of HTMLProcessor.insertHREFSInPasses in a single pattern:
+#   links: <a ... filepos=XXX ...> (case insensitive)
+#   empty anchors: <a/>, and <a></a> with only whitespace (or empty anchors) in between
+#       since those are empty once the others get removed
+#   image tags: <img ...> (case insensitive)
+# (the '<' is left out of the alternatives, so the regex engine can skip to the next one)
+_href_pattern = re.compile(br'''<(?:(?P<link>[aA]([^>]*?)[fF][iI][lL][eE][pP][oO][sS]=['"]{0,1}0*(\d+)['"]{0,1}([^>]*?)>)'''
+                           br'''|(?P<anchor>a\s*/>)|(?P<empty>a\s*>(?:\s|<a\s*/>)*</a>)|(?P<img>[iI][mM][gG].*?>))''')
+_image_index_pattern = re.compile(br'''recindex=['"]{0,1}([0-9]+)['"]{0,1}''', re.IGNORECASE)
+
+
+# whether the text before beg and after end is outside of any tag, ie. the last of '<' and '>'
+# before beg is '>' (or there's none) and the first one after end is '<' (or there's none)
+def isOutsideTags(text, beg, end):
+    if text.rfind(b'<', 0, beg) > text.rfind(b'>', 0, beg):
+        return False
+    pgt = text.find(b'>', end)
+    plt = text.find(b'<', end)
+    return pgt == -1 or (plt != -1 and plt < pgt)
+
+
+# pieces of text with data inserted at offset of the text, the same as slicing the joined text
+def insertPiece(pieces, offset, data):
+    for i, piece in enumerate(pieces):
+        if offset <= len(piece):
+            return pieces[:i] + [piece[:offset], data, piece[offset:]] + pieces[i+1:]
+        offset -= len(piece)
+    return pieces + [data]
+
+
 class HTMLProcessor:
 
     def __init__(self, files, metadata, rscnames):
@@ -47,22 +77,72 @@ class HTMLProcessor:
         print("Insert data into html")
         pos = 0
         lastPos = len(rawtext)
+        # views of the raw text, so it only gets copied once into srctext
+        rawview = memoryview(rawtext)
         dataList = []
         for end in sorted(positionMap.keys()):
             if end == 0 or end > lastPos:
                 continue  # something's up - can't put a tag in outside <html>...</html>
-            dataList.append(rawtext[pos:end])
+            dataList.append(rawview[pos:end])
             dataList.append(positionMap[end])
             pos = end
-        dataList.append(rawtext[pos:])
+        dataList.append(rawview[pos:])
         srctext = b"".join(dataList)
         rawtext = None
+        rawview = None
         dataList = None
         self.srctext = srctext
         self.indx_data = indx_data
         return srctext
 
     def insertHREFS(self):
+        # all of the rewrites done in a single pass over the text, the same as the separate ones
+        # of insertHREFSInPasses unless tags are nested or broken around the rewritten ones,
+        # when it falls back to those
+        srctext = self.srctext
+        rscnames = self.rscnames
+        metadata = self.metadata
+
+        # put in the hrefs, remove empty anchors and convert image references
+        # (there doesn't seem to be a standard, so search as best as we can)
+        print("Insert hrefs, remove empty anchors and insert image references into html")
+        srcview = memoryview(srctext)
+        srcpieces = []
+        pos = 0
+        for m in _href_pattern.finditer(srctext):
+            tag = m.group()
+            if m.group('link') is not None or m.group('img') is not None:
+                if tag.find(b'<', 1) != -1:
+                    return self.insertHREFSInPasses()
+            elif not isOutsideTags(srctext, m.start(), m.end()):
+                # removing the empty anchor could join the text around it into a new tag
+                return self.insertHREFSInPasses()
+            srcpieces.append(srcview[pos:m.start()])
+            pos = m.end()
+            if m.group('link') is not None:
+                srcpieces.append(b'<a' + m.group(2) + b'href="#filepos' + m.group(3) + b'"' + m.group(4) + b'>')
+            elif m.group('img') is not None:
+                for im in _image_index_pattern.finditer(tag):
+                    imageNumber = int(im.group(1))
+                    imageName = rscnames[imageNumber-1]
+                    if imageName is None:
+                        print("Error: Referenced image %s was not recognized as a valid image" % imageNumber)
+                    else:
+                        replacement = b'src="Images/' + utf8_str(imageName) + b'"'
+                        tag = _image_index_pattern.sub(replacement, tag, 1)
+                srcpieces.append(tag)
+        srcpieces.append(srcview[pos:])
+
+        # add in character set meta into the html header if needed
+        if 'Codec' in metadata:
+            meta = b'<meta http-equiv="content-type" content="text/html; charset='+utf8_str(metadata.get('Codec')[0])+b'" />'
+            srcpieces = insertPiece(srcpieces, 12, meta)
+        srctext = b"".join(srcpieces)
+        self.srctext = None
+        return srctext, self.used
+
+    # insertHREFS as a pass over the whole text for every rewrite
+    def insertHREFSInPasses(self):
         srctext = self.srctext
         rscnames = self.rscnames
         metadata = self.metadata
@@ -109,12 +189,33 @@ class HTMLProcessor:
 
 class XHTMLK8Processor:
 
+    # pos:fid pattern
+    posfid_pattern = re.compile(br'''(<a.*?href=.*?>)''', re.IGNORECASE)
+    posfid_index_pattern = re.compile(br'''['"]kindle:pos:fid:([0-9|A-V]+):off:([0-9|A-V]+).*?["']''')
+
     def __init__(self, rscnames, k8proc):
         self.rscnames = rscnames
         self.k8proc = k8proc
         self.used = {}
+        self.flows = None
+        # (posfid, offset) of the internal links -> replacement of the link
+        self.posfid_links = {}
 
     def buildXHTML(self):
+        self.prepare()
+        parts = []
+        print("Building proper xhtml for each file")
+        for i in range(self.k8proc.getNumberOfParts()):
+            parts.append(self.buildPart(i))
+
+        self.k8proc.setFlows(self.flows)
+        self.k8proc.setParts(parts)
+
+        return self.used
+
+    # resolve the internal links of all the parts and process the flows, everything
+    # building the xhtml of a single part with buildPart depends on
+    def prepare(self):
 
         # first need to update all links that are internal which
         # are based on positions within the xhtml files **BEFORE**
@@ -124,72 +225,24 @@ class XHTMLK8Processor:
         #       XXXX is the offset in records into divtbl
         #       YYYYYYYYYYYY is a base32 number you add to the divtbl insertpos to get final position
 
-        # pos:fid pattern
-        posfid_pattern = re.compile(br'''(<a.*?href=.*?>)''', re.IGNORECASE)
-        posfid_index_pattern = re.compile(br'''['"]kindle:pos:fid:([0-9|A-V]+):off:([0-9|A-V]+).*?["']''')
-
-        parts = []
-        print("Building proper xhtml for each file")
+        # NOTE: resolving the links records the linked aids in k8proc.linked_aids,
+        # the aids of every part get stripped but those, so the links of all
+        # the parts need to be resolved before building any of them
         for i in range(self.k8proc.getNumberOfParts()):
-            part = self.k8proc.getPart(i)
-            [partnum, dir, filename, beg, end, aidtext] = self.k8proc.getPartInfo(i)
-
-            # internal links
-            srcpieces = posfid_pattern.split(part)
+            srcpieces = self.posfid_pattern.split(self.k8proc.getPart(i))
             for j in range(1, len(srcpieces),2):
                 tag = srcpieces[j]
                 if tag.startswith(b'<'):
-                    for m in posfid_index_pattern.finditer(tag):
+                    for m in self.posfid_index_pattern.finditer(tag):
                         posfid = m.group(1)
                         offset = m.group(2)
-                        filename, idtag = self.k8proc.getIDTagByPosFid(posfid, offset)
-                        if idtag == b'':
-                            replacement= b'"' + utf8_str(filename) + b'"'
-                        else:
-                            replacement = b'"' + utf8_str(filename) + b'#' + idtag + b'"'
-                        tag = posfid_index_pattern.sub(replacement, tag, 1)
-                    srcpieces[j] = tag
-            part = b"".join(srcpieces)
-            parts.append(part)
-
-        # we are free to cut and paste as we see fit
-        # we can safely remove all of the Kindlegen generated aid tags
-        # change aid ids that are in k8proc.linked_aids to xhtml ids
-        find_tag_with_aid_pattern = re.compile(br'''(<[^>]*\said\s*=[^>]*>)''', re.IGNORECASE)
-        within_tag_aid_position_pattern = re.compile(br'''\said\s*=['"]([^'"]*)['"]''')
-        for i in range(len(parts)):
-            part = parts[i]
-            srcpieces = find_tag_with_aid_pattern.split(part)
-            for j in range(len(srcpieces)):
-                tag = srcpieces[j]
-                if tag.startswith(b'<'):
-                    for m in within_tag_aid_position_pattern.finditer(tag):
-                        try:
-                            aid = m.group(1)
-                        except IndexError:
-                            aid = None
-                        replacement = b''
-                        if aid in self.k8proc.linked_aids:
-                            replacement = b' id="aid-' + aid + b'"'
-                        tag = within_tag_aid_position_pattern.sub(replacement, tag, 1)
-                    srcpieces[j] = tag
-            part = b"".join(srcpieces)
-            parts[i] = part
-
-        # we can safely replace all of the Kindlegen generated data-AmznPageBreak tags
-        # with page-break-after style patterns
-        find_tag_with_AmznPageBreak_pattern = re.compile(br'''(<[^>]*\sdata-AmznPageBreak=[^>]*>)''', re.IGNORECASE)
-        within_tag_AmznPageBreak_position_pattern = re.compile(br'''\sdata-AmznPageBreak=['"]([^'"]*)['"]''')
-        for i in range(len(parts)):
-            part = parts[i]
-            srcpieces = find_tag_with_AmznPageBreak_pattern.split(part)
-            for j in range(len(srcpieces)):
-                tag = srcpieces[j]
-                if tag.startswith(b'<'):
-                    srcpieces[j] = within_tag_AmznPageBreak_position_pattern.sub(
-                        lambda m:b' style="page-break-after:' + m.group(1) + b'"', tag)
-            part = b"".join(srcpieces)
-            parts[i] = part
+                        if (posfid, offset) not in self.posfid_links:
+                            filename, idtag = self.k8proc.getIDTagByPosFid(posfid, offset)
+                            if idtag == b'':
+                                replacement= b'"' + utf8_str(filename) + b'"'
+                            else:
+                                replacement = b'"' + utf8_str(filename) + b'#' + idtag + b'"'
+                            self.posfid_links[posfid, offset] = replacement
 
         # we have to handle substitutions for the flows  pieces first as they may
         # be inlined into the xhtml text
@@ -197,7 +250,7 @@ class XHTMLK8Processor:
         #   kindle:flow:XXXX?mime=YYYY/ZZZ (used for style sheets, svg images, etc)
         #   kindle:embed:XXXX   (used for fonts)
 
-        flows = []
+        self.flows = flows = []
         flows.append(None)
         flowinfo = []
         flowinfo.append([None, None, None, None])
@@ -314,97 +367,124 @@ class XHTMLK8Processor:
             #         srcpieces[j] = tag
             # flowpart = b"".join(srcpieces)
 
-        # now handle the main text xhtml parts
+    # xhtml of the i-th part, prepare needs to be called first
+    def buildPart(self, i):
+        part = self.k8proc.getPart(i)
+
+        # internal links
+        srcpieces = self.posfid_pattern.split(part)
+        for j in range(1, len(srcpieces),2):
+            tag = srcpieces[j]
+            if tag.startswith(b'<'):
+                for m in self.posfid_index_pattern.finditer(tag):
+                    replacement = self.posfid_links[m.group(1), m.group(2)]
+                    tag = self.posfid_index_pattern.sub(replacement, tag, 1)
+                srcpieces[j] = tag
+        part = b"".join(srcpieces)
+
+        # we are free to cut and paste as we see fit
+        # we can safely remove all of the Kindlegen generated aid tags
+        # change aid ids that are in k8proc.linked_aids to xhtml ids
+        find_tag_with_aid_pattern = re.compile(br'''(<[^>]*\said\s*=[^>]*>)''', re.IGNORECASE)
+        within_tag_aid_position_pattern = re.compile(br'''\said\s*=['"]([^'"]*)['"]''')
+        srcpieces = find_tag_with_aid_pattern.split(part)
+        for j in range(len(srcpieces)):
+            tag = srcpieces[j]
+            if tag.startswith(b'<'):
+                for m in within_tag_aid_position_pattern.finditer(tag):
+                    try:
+                        aid = m.group(1)
+                    except IndexError:
+                        aid = None
+                    replacement = b''
+                    if aid in self.k8proc.linked_aids:
+                        replacement = b' id="aid-' + aid + b'"'
+                    tag = within_tag_aid_position_pattern.sub(replacement, tag, 1)
+                srcpieces[j] = tag
+        part = b"".join(srcpieces)
+
+        # we can safely replace all of the Kindlegen generated data-AmznPageBreak tags
+        # with page-break-after style patterns
+        find_tag_with_AmznPageBreak_pattern = re.compile(br'''(<[^>]*\sdata-AmznPageBreak=[^>]*>)''', re.IGNORECASE)
+        within_tag_AmznPageBreak_position_pattern = re.compile(br'''\sdata-AmznPageBreak=['"]([^'"]*)['"]''')
+        srcpieces = find_tag_with_AmznPageBreak_pattern.split(part)
+        for j in range(len(srcpieces)):
+            tag = srcpieces[j]
+            if tag.startswith(b'<'):
+                srcpieces[j] = within_tag_AmznPageBreak_position_pattern.sub(
+                    lambda m:b' style="page-break-after:' + m.group(1) + b'"', tag)
+        part = b"".join(srcpieces)
 
         # Handle the flow items in the XHTML text pieces
         # kindle:flow:XXXX?mime=YYYY/ZZZ (used for style sheets, svg images, etc)
         tag_pattern = re.compile(br'''(<[^>]*>)''')
         flow_pattern = re.compile(br'''['"]kindle:flow:([0-9|A-V]+)\?mime=([^'"]+)['"]''', re.IGNORECASE)
-        for i in range(len(parts)):
-            part = parts[i]
-            [partnum, dir, filename, beg, end, aidtext] = self.k8proc.partinfo[i]
-            # flow pattern
-            srcpieces = tag_pattern.split(part)
-            for j in range(1, len(srcpieces),2):
-                tag = srcpieces[j]
-                if tag.startswith(b'<'):
-                    for m in flow_pattern.finditer(tag):
-                        num = fromBase32(m.group(1))
-                        if num > 0 and num < len(self.k8proc.flowinfo):
-                            [typ, fmt, pdir, fnm] = self.k8proc.getFlowInfo(num)
-                            flowpart = flows[num]
-                            if fmt == b'inline':
-                                tag = flowpart
-                            else:
-                                replacement = b'"../' + utf8_str(pdir) + b'/' + utf8_str(fnm) + b'"'
-                                tag = flow_pattern.sub(replacement, tag, 1)
-                                self.used[fnm] = 'used'
+        # flow pattern
+        srcpieces = tag_pattern.split(part)
+        for j in range(1, len(srcpieces),2):
+            tag = srcpieces[j]
+            if tag.startswith(b'<'):
+                for m in flow_pattern.finditer(tag):
+                    num = fromBase32(m.group(1))
+                    if num > 0 and num < len(self.k8proc.flowinfo):
+                        [typ, fmt, pdir, fnm] = self.k8proc.getFlowInfo(num)
+                        flowpart = self.flows[num]
+                        if fmt == b'inline':
+                            tag = flowpart
                         else:
-                            print("warning: ignoring non-existent flow link", tag, " value 0x%x" % num)
-                    srcpieces[j] = tag
-            part = b''.join(srcpieces)
-
-            # store away modified version
-            parts[i] = part
+                            replacement = b'"../' + utf8_str(pdir) + b'/' + utf8_str(fnm) + b'"'
+                            tag = flow_pattern.sub(replacement, tag, 1)
+                            self.used[fnm] = 'used'
+                    else:
+                        print("warning: ignoring non-existent flow link", tag, " value 0x%x" % num)
+                srcpieces[j] = tag
+        part = b''.join(srcpieces)
 
         # Handle any embedded raster images links in style= attributes urls
         style_pattern = re.compile(br'''(<[a-zA-Z0-9]+\s[^>]*style\s*=\s*[^>]*>)''', re.IGNORECASE)
         img_index_pattern = re.compile(br'''[('"]kindle:embed:([0-9|A-V]+)[^'"]*['")]''', re.IGNORECASE)
 
-        for i in range(len(parts)):
-            part = parts[i]
-            [partnum, dir, filename, beg, end, aidtext] = self.k8proc.partinfo[i]
-
-            # replace urls in style attributes
-            srcpieces = style_pattern.split(part)
-            for j in range(1, len(srcpieces),2):
-                tag = srcpieces[j]
-                if b'kindle:embed' in tag:
-                    for m in img_index_pattern.finditer(tag):
-                        imageNumber = fromBase32(m.group(1))
-                        imageName = self.rscnames[imageNumber-1]
-                        osep = m.group()[0:1]
-                        csep = m.group()[-1:]
-                        if imageName is not None:
-                            replacement = osep + b'../Images/'+ utf8_str(imageName) + csep
-                            self.used[imageName] = 'used'
-                            tag = img_index_pattern.sub(replacement, tag, 1)
-                        else:
-                            print("Error: Referenced image %s in style url was not recognized in %s" % (imageNumber, tag))
-                    srcpieces[j] = tag
-            part = b"".join(srcpieces)
-
-            # store away modified version
-            parts[i] = part
+        # replace urls in style attributes
+        srcpieces = style_pattern.split(part)
+        for j in range(1, len(srcpieces),2):
+            tag = srcpieces[j]
+            if b'kindle:embed' in tag:
+                for m in img_index_pattern.finditer(tag):
+                    imageNumber = fromBase32(m.group(1))
+                    imageName = self.rscnames[imageNumber-1]
+                    osep = m.group()[0:1]
+                    csep = m.group()[-1:]
+                    if imageName is not None:
+                        replacement = osep + b'../Images/'+ utf8_str(imageName) + csep
+                        self.used[imageName] = 'used'
+                        tag = img_index_pattern.sub(replacement, tag, 1)
+                    else:
+                        print("Error: Referenced image %s in style url was not recognized in %s" % (imageNumber, tag))
+                srcpieces[j] = tag
+        part = b"".join(srcpieces)
 
         # Handle any embedded raster images links in the xhtml text
         # kindle:embed:XXXX?mime=image/gif (png, jpeg, etc) (used for images)
         img_pattern = re.compile(br'''(<[img\s|image\s][^>]*>)''', re.IGNORECASE)
         img_index_pattern = re.compile(br'''['"]kindle:embed:([0-9|A-V]+)[^'"]*['"]''')
 
-        for i in range(len(parts)):
-            part = parts[i]
-            [partnum, dir, filename, beg, end, aidtext] = self.k8proc.partinfo[i]
-
-            # links to raster image files
-            # image_pattern
-            srcpieces = img_pattern.split(part)
-            for j in range(1, len(srcpieces),2):
-                tag = srcpieces[j]
-                if tag.startswith(b'<im'):
-                    for m in img_index_pattern.finditer(tag):
-                        imageNumber = fromBase32(m.group(1))
-                        imageName = self.rscnames[imageNumber-1]
-                        if imageName is not None:
-                            replacement = b'"../Images/' + utf8_str(imageName) + b'"'
-                            self.used[imageName] = 'used'
-                            tag = img_index_pattern.sub(replacement, tag, 1)
-                        else:
-                            print("Error: Referenced image %s was not recognized as a valid image in %s" % (imageNumber, tag))
-                    srcpieces[j] = tag
-            part = b"".join(srcpieces)
-            # store away modified version
-            parts[i] = part
+        # links to raster image files
+        # image_pattern
+        srcpieces = img_pattern.split(part)
+        for j in range(1, len(srcpieces),2):
+            tag = srcpieces[j]
+            if tag.startswith(b'<im'):
+                for m in img_index_pattern.finditer(tag):
+                    imageNumber = fromBase32(m.group(1))
+                    imageName = self.rscnames[imageNumber-1]
+                    if imageName is not None:
+                        replacement = b'"../Images/' + utf8_str(imageName) + b'"'
+                        self.used[imageName] = 'used'
+                        tag = img_index_pattern.sub(replacement, tag, 1)
+                    else:
+                        print("Error: Referenced image %s was not recognized as a valid image in %s" % (imageNumber, tag))
+                srcpieces[j] = tag
+        part = b"".join(srcpieces)
 
         # finally perform any general cleanups needed to make valid XHTML
         # these include:
@@ -414,26 +494,17 @@ class XHTMLK8Processor:
         tag_pattern = re.compile(br'''(<[^>]*>)''')
         li_value_pattern = re.compile(br'''\svalue\s*=\s*['"][^'"]*['"]''', re.IGNORECASE)
 
-        for i in range(len(parts)):
-            part = parts[i]
-            [partnum, dir, filename, beg, end, aidtext] = self.k8proc.partinfo[i]
-
-            # tag pattern
-            srcpieces = tag_pattern.split(part)
-            for j in range(1, len(srcpieces),2):
-                tag = srcpieces[j]
-                if tag.startswith(b'<svg') or tag.startswith(b'<SVG'):
-                    tag = tag.replace(b'preserveaspectratio',b'preserveAspectRatio')
-                    tag = tag.replace(b'viewbox',b'viewBox')
-                elif tag.startswith(b'<li ') or tag.startswith(b'<LI '):
-                    tagpieces = li_value_pattern.split(tag)
-                    tag = b"".join(tagpieces)
-                srcpieces[j] = tag
-            part = b"".join(srcpieces)
-            # store away modified version
-            parts[i] = part
-
-        self.k8proc.setFlows(flows)
-        self.k8proc.setParts(parts)
-
-        return self.used
+        # tag pattern
+        srcpieces = tag_pattern.split(part)
+        for j in range(1, len(srcpieces),2):
+            tag = srcpieces[j]
+            if tag.startswith(b'<svg') or tag.startswith(b'<SVG'):
+                tag = tag.replace(b'preserveaspectratio',b'preserveAspectRatio')
+                tag = tag.replace(b'viewbox',b'viewBox')
+            elif tag.startswith(b'<li ') or tag.startswith(b'<LI '):
+                tagpieces = li_value_pattern.split(tag)
+                tag = b"".join(tagpieces)
+            srcpieces[j] = tag
+        part = b"".join(srcpieces)
+
+        return part
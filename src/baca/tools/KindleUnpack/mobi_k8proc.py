@@ -11,6 +11,8 @@ if PY2:
 
 import os
 
+from bisect import bisect_left, bisect_right
+
 import struct
 # note:  struct pack, unpack, unpack_from all require bytestring format
 # data all the way up to at least python 2.7.5, python 3 okay with bytestring
@@ -52,6 +54,139 @@ def reverse_tag_iter(block):
         end = plt
 
 
+# the tags reverse_tag_iter finds start at a '<' followed by a '>' before any other '<', and
+# a named anchor needs its attribute before that '>', so these are all the tags possibly having one
+_anchor_tag_pattern = re.compile(br'''<(?:body |[^<>]*?(?:id|name))[^<>]*>''', re.IGNORECASE)
+
+# find id and name attributes only inside of tags
+#    inside any < > pair find "id=" and "name=" attributes return it
+#    [^>]* means match any amount of chars except for  '>' char
+#    [^'"] match any amount of chars except for the quote character
+#    \s* means match any amount of whitespace
+_id_pattern = re.compile(br'''<[^>]*\sid\s*=\s*['"]([^'"]*)['"]''',re.IGNORECASE)
+_name_pattern = re.compile(br'''<[^>]*\sname\s*=\s*['"]([^'"]*)['"]''',re.IGNORECASE)
+_aid_pattern = re.compile(br'''<[^>]+\s(?:aid|AID)\s*=\s*['"]([^'"]+)['"]''')
+
+
+# the named anchor of a tag as (idtext, aid) if it has one, aid being None unless it's
+# an aid attribute, the body tag's anchor is the top of the file, None otherwise
+def tagAnchor(tag):
+    # any ids in the body should default to top of file
+    if tag[0:6] == b'<body ':
+        return b'', None
+    if tag[0:6] != b'<meta ':
+        m = _id_pattern.match(tag) or _name_pattern.match(tag)
+        if m is not None:
+            return m.group(1), None
+        m = _aid_pattern.match(tag)
+        if m is not None:
+            return b'aid-' + m.group(1), m.group(1)
+    return None
+
+
+# text of a part being assembled, a list of pieces with a gap at the last insert position
+# so inserting the fragments (mostly in document order) never copies the part built so far
+class PartBuffer:
+
+    def __init__(self, skeleton):
+        self.head = []
+        # pieces after the gap, last one first
+        self.tail = [skeleton]
+        self.headlen = 0
+        self.length = len(skeleton)
+
+    def moveGap(self, pos):
+        # positions work as slicing the assembled part would, negative ones count from the end
+        if pos < 0:
+            pos = max(0, self.length + pos)
+        pos = min(pos, self.length)
+        while self.headlen > pos:
+            piece = self.head.pop()
+            self.headlen -= len(piece)
+            self.tail.append(piece)
+        while self.headlen < pos:
+            piece = self.tail.pop()
+            if self.headlen + len(piece) > pos:
+                self.tail.append(piece[pos - self.headlen:])
+                piece = piece[:pos - self.headlen]
+            self.head.append(piece)
+            self.headlen += len(piece)
+
+    def insert(self, data):
+        self.head.append(data)
+        self.headlen += len(data)
+        self.length += len(data)
+
+    def headInTag(self):
+        # same as head.rfind(b'>') < head.rfind(b'<')
+        for piece in reversed(self.head):
+            pos = max(piece.rfind(b'>'), piece.rfind(b'<'))
+            if pos != -1:
+                return piece[pos:pos+1] == b'<'
+        return False
+
+    def tailInTag(self):
+        # same as tail.find(b'>') < tail.find(b'<')
+        first = None
+        for piece in reversed(self.tail):
+            pgt, plt = piece.find(b'>'), piece.find(b'<')
+            if first is None:
+                if pgt != -1 and plt != -1:
+                    return pgt < plt
+                if pgt != -1:
+                    first = b'>'
+                elif plt != -1:
+                    first = b'<'
+            elif (plt if first == b'>' else pgt) != -1:
+                return first == b'>'
+        return first == b'<'
+
+    def getvalue(self):
+        return b''.join(self.head + self.tail[::-1])
+
+
+# insert the fragments into their skeletons, fixes the corrupt insert positions of fragtbl in place
+def assemble_parts(text, skeltbl, fragtbl):
+    parts = []
+    partinfo = []
+    fragptr = 0
+    baseptr = 0
+    cnt = 0
+    filename = 'part%04d.xhtml' % cnt
+    for [skelnum, skelname, fragcnt, skelpos, skellen] in skeltbl:
+        baseptr = skelpos + skellen
+        part = PartBuffer(text[skelpos: baseptr])
+        aidtext = "0"
+        for i in range(fragcnt):
+            [insertpos, idtext, filenum, seqnum, startpos, length] = fragtbl[fragptr]
+            aidtext = idtext[12:-2]
+            if i == 0:
+                filename = 'part%04d.xhtml' % filenum
+            slice = text[baseptr: baseptr + length]
+            insertpos = insertpos - skelpos
+            part.moveGap(insertpos)
+            actual_inspos = insertpos
+            if part.tailInTag() or part.headInTag():
+                # There is an incomplete tag in either the head or tail.
+                # This can happen for some badly formed KF8 files
+                print('The fragment table for %s has incorrect insert position. Calculating manually.' % skelname)
+                bp, ep = locate_beg_end_of_tag(part.getvalue(), aidtext)
+                if bp != ep:
+                    actual_inspos = ep + 1 + startpos
+            if insertpos != actual_inspos:
+                print("fixed corrupt fragment table insert position", insertpos+skelpos, actual_inspos+skelpos)
+                insertpos = actual_inspos
+                fragtbl[fragptr][0] = actual_inspos + skelpos
+                part.moveGap(insertpos)
+            part.insert(slice)
+            baseptr = baseptr + length
+            fragptr += 1
+        cnt += 1
+        parts.append(part.getvalue())
+        partinfo.append([skelnum, 'Text', filename, skelpos, baseptr, aidtext])
+    return parts, partinfo
+
+
 class K8Processor:
 
     def __init__(self, mh, sect, files, debug=False):
@@ -69,6 +204,11 @@ class K8Processor:
         self.parts = None
         self.partinfo = []
         self.linked_aids = set()
+        # sorted position arrays of the fragment & part tables, and the named anchors
+        # of each part, built on first use (see getFragTblInfo, getFileInfo and getIDTag)
+        self.fragindex = None
+        self.partindex = None
+        self.anchorindex = {}
         self.fdsttbl= [0,0xffffffff]
         self.DEBUG = debug
 
@@ -175,46 +315,13 @@ class K8Processor:
         # and create final list of file separation start: stop points and etc in partinfo
         if self.DEBUG:
             print("\nRebuilding flow piece 0: the main body of the ebook")
-        self.parts = []
-        self.partinfo = []
-        fragptr = 0
-        baseptr = 0
-        cnt = 0
-        filename = 'part%04d.xhtml' % cnt
-        for [skelnum, skelname, fragcnt, skelpos, skellen] in self.skeltbl:
-            baseptr = skelpos + skellen
-            skeleton = text[skelpos: baseptr]
-            aidtext = "0"
-            for i in range(fragcnt):
-                [insertpos, idtext, filenum, seqnum, startpos, length] = self.fragtbl[fragptr]
-                aidtext = idtext[12:-2]
-                if i == 0:
-                    filename = 'part%04d.xhtml' % filenum
-                slice = text[baseptr: baseptr + length]
-                insertpos = insertpos - skelpos
-                head = skeleton[:insertpos]
-                tail = skeleton[insertpos:]
-                actual_inspos = insertpos
-                if (tail.find(b'>') < tail.find(b'<') or head.rfind(b'>') < head.rfind(b'<')):
-                    # There is an incomplete tag in either the head or tail.
-                    # This can happen for some badly formed KF8 files
-                    print('The fragment table for %s has incorrect insert position. Calculating manually.' % skelname)
-                    bp, ep = locate_beg_end_of_tag(skeleton, aidtext)
-                    if bp != ep:
-                        actual_inspos = ep + 1 + startpos
-                if insertpos != actual_inspos:
-                    print("fixed corrupt fragment table insert position", insertpos+skelpos, actual_inspos+skelpos)
-                    insertpos = actual_inspos
-                    self.fragtbl[fragptr][0] = actual_inspos + skelpos
-                skeleton = skeleton[0:insertpos] + slice + skeleton[insertpos:]
-                baseptr = baseptr + length
-                fragptr += 1
-            cnt += 1
-            self.parts.append(skeleton)
-            self.partinfo.append([skelnum, 'Text', filename, skelpos, baseptr, aidtext])
-
-        assembled_text = b''.join(self.parts)
+        self.parts, self.partinfo = assemble_parts(text, self.skeltbl, self.fragtbl)
+        self.fragindex = None
+        self.partindex = None
+        self.anchorindex = {}
+
         if self.DEBUG:
+            assembled_text = b''.join(self.parts)
             outassembled = os.path.join(self.files.k8dir, 'assembled_text.dat')
             with open(pathof(outassembled),'wb') as f:
                 f.write(assembled_text)
@@ -308,21 +415,50 @@ class K8Processor:
 
     # get information fragment table entry by pos
     def getFragTblInfo(self, pos):
-        for j in range(len(self.fragtbl)):
-            [insertpos, idtext, filenum, seqnum, startpos, length] = self.fragtbl[j]
-            if pos >= insertpos and pos < (insertpos + length):
-                # why are these "in: and before: added here
-                return seqnum, b'in: ' + idtext
-            if pos < insertpos:
-                return seqnum, b'before: ' + idtext
-        return None, None
+        # the first entry (in table order) pos is in or before is the first one ending after pos,
+        # found by bisecting the running maximum of the entry ends
+        if self.fragindex is None:
+            self.fragindex = []
+            fragend = -1
+            for [insertpos, idtext, filenum, seqnum, startpos, length] in self.fragtbl:
+                fragend = max(fragend, insertpos + max(length, 0))
+                self.fragindex.append(fragend)
+        j = bisect_right(self.fragindex, pos)
+        if j == len(self.fragtbl):
+            return None, None
+        [insertpos, idtext, filenum, seqnum, startpos, length] = self.fragtbl[j]
+        if pos >= insertpos and pos < (insertpos + length):
+            # why are these "in: and before: added here
+            return seqnum, b'in: ' + idtext
+        return seqnum, b'before: ' + idtext
+
+    # get the number of the part that exists at pos in original rawML, None if there's none
+    def getPartNumberAt(self, pos):
+        if self.partindex is None:
+            starts = [start for [partnum, pdir, filename, start, end, aidtext] in self.partinfo]
+            ends = [end for [partnum, pdir, filename, start, end, aidtext] in self.partinfo]
+            # parts are normally in order and do not overlap, otherwise fall back to scanning them
+            if all(ends[i] <= starts[i+1] for i in range(len(starts)-1)):
+                self.partindex = starts
+            else:
+                self.partindex = False
+        if self.partindex is False:
+            for i, [partnum, pdir, filename, start, end, aidtext] in enumerate(self.partinfo):
+                if pos >= start and pos < end:
+                    return i
+            return None
+        i = bisect_right(self.partindex, pos) - 1
+        if i >= 0 and pos < self.partinfo[i][4]:
+            return i
+        return None
 
     # get information about the part (file) that exists at pos in original rawML
     def getFileInfo(self, pos):
-        for [partnum, pdir, filename, start, end, aidtext] in self.partinfo:
-            if pos >= start and pos < end:
-                return filename, partnum, start, end
-        return None, None, None, None
+        i = self.getPartNumberAt(pos)
+        if i is None:
+            return None, None, None, None
+        [partnum, pdir, filename, start, end, aidtext] = self.partinfo[i]
+        return filename, partnum, start, end
 
     # accessor functions to properly protect the internal structure
     def getNumberOfParts(self):
@@ -386,35 +522,49 @@ class K8Processor:
         plt = textblock.find(b'<',npos)
         if plt == npos or pgt < plt:
             npos = pgt + 1
-        # find id and name attributes only inside of tags
-        # use a reverse tag search since that is faster
-        #    inside any < > pair find "id=" and "name=" attributes return it
-        #    [^>]* means match any amount of chars except for  '>' char
-        #    [^'"] match any amount of chars except for the quote character
-        #    \s* means match any amount of whitespace
-        textblock = textblock[0:npos]
-        id_pattern = re.compile(br'''<[^>]*\sid\s*=\s*['"]([^'"]*)['"]''',re.IGNORECASE)
-        name_pattern = re.compile(br'''<[^>]*\sname\s*=\s*['"]([^'"]*)['"]''',re.IGNORECASE)
-        aid_pattern = re.compile(br'''<[^>]+\s(?:aid|AID)\s*=\s*['"]([^'"]+)['"]''')
-        for tag in reverse_tag_iter(textblock):
-            # any ids in the body should default to top of file
-            if tag[0:6] == b'<body ':
+        # search backwards the tags before npos for a named anchor, the first one is
+        # the one cut at npos, the named anchors of the others are indexed
+        pgt = textblock.rfind(b'>', 0, npos)
+        plt = textblock.rfind(b'<', 0, pgt)
+        if pgt == -1 or plt == -1:
+            return b''
+        anchor = tagAnchor(textblock[plt:pgt+1])
+        if anchor is None:
+            anchorstarts, anchors = self.getAnchorIndex(pn)
+            i = bisect_left(anchorstarts, plt)
+            if i == 0:
                 return b''
-            if tag[0:6] != b'<meta ':
-                m = id_pattern.match(tag) or name_pattern.match(tag)
-                if m is not None:
-                    return m.group(1)
-                m = aid_pattern.match(tag)
-                if m is not None:
-                    self.linked_aids.add(m.group(1))
-                    return b'aid-' + m.group(1)
-        return b''
+            anchor = anchors[i-1]
+        idtext, aid = anchor
+        if aid is not None:
+            self.linked_aids.add(aid)
+        return idtext
+
+    # start positions of the tags of the part having a named anchor (see tagAnchor) and their anchors
+    def getAnchorIndex(self, pn):
+        if pn not in self.anchorindex:
+            textblock = self.parts[pn]
+            anchorstarts = []
+            anchors = []
+            for m in _anchor_tag_pattern.finditer(textblock):
+                start = m.start()
+                # reverse_tag_iter finds the tag up to the last '>' before the next '<'
+                nextlt = textblock.find(b'<', m.end())
+                if nextlt == -1:
+                    nextlt = len(textblock)
+                anchor = tagAnchor(textblock[start:textblock.rfind(b'>', start, nextlt)+1])
+                if anchor is not None:
+                    anchorstarts.append(start)
+                    anchors.append(anchor)
+            self.anchorindex[pn] = (anchorstarts, anchors)
+        return self.anchorindex[pn]
 
     # do we need to do deep copying
     def setParts(self, parts):
         assert(len(parts) == len(self.parts))
         for i in range(len(parts)):
             self.parts[i] = parts[i]
+        self.anchorindex = {}
 
     # do we need to do deep copying
     def setFlows(self, flows):
@@ -424,10 +574,10 @@ class K8Processor:
 
     # get information about the part (file) that exists at pos in original rawML
     def getSkelInfo(self, pos):
-        for [partnum, pdir, filename, start, end, aidtext] in self.partinfo:
-            if pos >= start and pos < end:
-                return [partnum, pdir, filename, start, end, aidtext]
-        return [None, None, None, None, None, None]
+        i = self.getPartNumberAt(pos)
+        if i is None:
+            return [None, None, None, None, None, None]
+        return self.partinfo[i]
 
     # fileno is actually a reference into fragtbl (a fragment)
     def getGuideText(self):
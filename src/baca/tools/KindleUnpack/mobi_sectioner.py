@@ -7,6 +7,7 @@ from __future__ import unicode_literals, division, absolute_import, print_functi
 from .compatibility_utils import PY2, hexlify, bstr, bord, bchar
 
 import datetime
+import mmap
 
 if PY2:
     range = xrange
@@ -44,12 +45,20 @@ def datetimefrompalmtime(palmtime):
 
 class Sectionizer:
 
-    def __init__(self, filename):
+    def __init__(self, filename, use_mmap=False):
         self.data = b''
-        with open(pathof(filename), 'rb') as f:
-            self.data = f.read()
-        self.palmheader = self.data[:78]
-        self.palmname = self.data[:32]
+        self._mmap = None
+        if use_mmap:
+            # map the file instead of reading it whole, only the sections
+            # loaded get read (and copied unless loaded as views)
+            with open(pathof(filename), 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = memoryview(self._mmap)
+        else:
+            with open(pathof(filename), 'rb') as f:
+                self.data = f.read()
+        self.palmheader = bytes(self.data[:78])
+        self.palmname = bytes(self.data[:32])
         self.ident = self.palmheader[0x3C:0x3C+8]
         self.num_sections, = struct.unpack_from(b'>H', self.palmheader, 76)
         self.filelength = len(self.data)
@@ -117,4 +126,27 @@ class Sectionizer:
 
     def loadSection(self, section):
         before, after = self.sectionoffsets[section:section+2]
-        return self.data[before:after]
+        return bytes(self.data[before:after])
+
+    def loadSectionView(self, section):
+        # zero-copy memoryview of the section, must not outlive close()
+        before, after = self.sectionoffsets[section:section+2]
+        return memoryview(self.data)[before:after]
+
+    def close(self):
+        if self._mmap is not None:
+            self.data.release()
+            try:
+                self._mmap.close()
+            except BufferError:
+                # NOTE: section views still referenced (eg. by a traceback),
+                # the mapping gets closed once they're garbage collected
+                pass
+            self._mmap = None
+        self.data = b''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
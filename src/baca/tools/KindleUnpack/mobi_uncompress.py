@@ -4,12 +4,15 @@
 
 from __future__ import unicode_literals, division, absolute_import, print_function
 
-from .compatibility_utils import PY2, bchr, lmap, bstr
+from .compatibility_utils import PY2, lmap, bstr
 
 if PY2:
     range = xrange
 
+import multiprocessing
+import os
 import struct
+from concurrent.futures import ProcessPoolExecutor
 # note:  struct pack, unpack, unpack_from all require bytestring format
 # data all the way up to at least python 2.7.5, python 3 okay with bytestring
 
@@ -25,35 +28,36 @@ class UncompressedReader:
 class PalmdocReader:
 
     def unpack(self, i):
-        o, p = b'', 0
-        while p < len(i):
-            # for python 3 must use slice since i[p] returns int while slice returns character
-            c = ord(i[p:p+1])
+        # accepts any bytes-like record, eg. a memoryview of a mapped section
+        o = bytearray()
+        p, size = 0, len(i)
+        while p < size:
+            c = i[p]
             p += 1
             if (c >= 1 and c <= 8):
                 o += i[p:p+c]
                 p += c
             elif (c < 128):
-                o += bchr(c)
+                o.append(c)
             elif (c >= 192):
-                o += b' ' + bchr(c ^ 128)
-            else:
-                if p < len(i):
-                    c = (c << 8) | ord(i[p:p+1])
-                    p += 1
-                    m = (c >> 3) & 0x07ff
-                    n = (c & 7) + 3
-                    if (m > n):
-                        o += o[-m:n-m]
-                    else:
-                        for _ in range(n):
-                            # because of completely ass-backwards decision by python mainters for python 3
-                            # we must use slice for bytes as i[p] returns int while slice returns character
-                            if m == 1:
-                                o += o[-m:]
-                            else:
-                                o += o[-m:-m+1]
-        return o
+                o.append(0x20)
+                o.append(c ^ 0x80)
+            elif p < size:
+                c = (c << 8) | i[p]
+                p += 1
+                m = (c >> 3) & 0x07ff
+                n = (c & 7) + 3
+                if (m > n):
+                    o += o[-m:n-m]
+                elif 0 < m <= len(o):
+                    # overlapping back reference, the last m bytes repeat
+                    pattern = o[-m:]
+                    o += (pattern * (n // m + 1))[:n]
+                else:
+                    # invalid distance, copied byte by byte the way it always was
+                    for _ in range(n):
+                        o += o[-m:-m+1]
+        return bytes(o)
 
 class HuffcdicReader:
     q = struct.Struct(b'>Q').unpack_from
@@ -80,6 +84,8 @@ class HuffcdicReader:
             self.maxcode += (((maxcode + 1) << (32 - codelen)) - 1, )
 
         self.dictionary = []
+        self.phrases = []
+        self.expanding = set()
 
     def loadCdic(self, cdic):
         if cdic[0:8] != b'CDIC\x00\x00\x00\x10':
@@ -91,41 +97,77 @@ class HuffcdicReader:
             blen, = h(cdic, 16+off)
             slice = cdic[18+off:18+off+(blen&0x7fff)]
             return (slice, blen&0x8000)
-        self.dictionary += lmap(getslice, struct.unpack_from(bstr('>%dH' % n), cdic, 16))
+        slices = lmap(getslice, struct.unpack_from(bstr('>%dH' % n), cdic, 16))
+        self.dictionary += slices
+        # fully expanded phrases, the ones still huffman coded get expanded once needed
+        self.phrases += [slice if flag else None for slice, flag in slices]
 
     def unpack(self, data):
         q = HuffcdicReader.q
+        dict1, mincode, maxcode, phrases = self.dict1, self.mincode, self.maxcode, self.phrases
 
         bitsleft = len(data) * 8
-        data += b"\x00\x00\x00\x00\x00\x00\x00\x00"
+        data = bytes(data) + b"\x00\x00\x00\x00\x00\x00\x00\x00"
         pos = 0
         x, = q(data, pos)
         n = 32
 
-        s = b''
+        s = bytearray()
         while True:
             if n <= 0:
                 pos += 4
                 x, = q(data, pos)
                 n += 32
-            code = (x >> n) & ((1 << 32) - 1)
+            code = (x >> n) & 0xFFFFFFFF
 
-            codelen, term, maxcode = self.dict1[code >> 24]
+            codelen, term, maxc = dict1[code >> 24]
             if not term:
-                while code < self.mincode[codelen]:
+                while code < mincode[codelen]:
                     codelen += 1
-                maxcode = self.maxcode[codelen]
+                maxc = maxcode[codelen]
 
             n -= codelen
             bitsleft -= codelen
             if bitsleft < 0:
                 break
 
-            r = (maxcode - code) >> (32 - codelen)
-            slice, flag = self.dictionary[r]
-            if not flag:
-                self.dictionary[r] = None
-                slice = self.unpack(slice)
-                self.dictionary[r] = (slice, 1)
-            s += slice
-        return s
+            r = (maxc - code) >> (32 - codelen)
+            phrase = phrases[r]
+            if phrase is None:
+                phrase = self.expandPhrase(r)
+            s += phrase
+        return bytes(s)
+
+    def expandPhrase(self, r):
+        if r in self.expanding:
+            raise unpackException('recursive huff dictionary entry %d' % r)
+        self.expanding.add(r)
+        try:
+            phrase = self.unpack(self.dictionary[r][0])
+        finally:
+            self.expanding.discard(r)
+        self.phrases[r] = phrase
+        return phrase
+
+    def unpackRecords(self, records, max_workers=None):
+        # the records only share the (read only) tables, so they get decoded
+        # in worker processes, every one expanding the phrases it needs itself
+        records = [bytes(data) for data in records]
+        workers = max_workers or os.cpu_count() or 1
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_initWorker, initargs=(self,))
+        with executor:
+            return list(executor.map(_unpackInWorker, records, chunksize=max(1, len(records) // (4 * workers))))
+
+
+# reader of the worker process, see HuffcdicReader.unpackRecords()
+_worker_reader = None
+
+
+def _initWorker(reader):
+    global _worker_reader
+    _worker_reader = reader
+
+
+def _unpackInWorker(data):
+    return _worker_reader.unpack(data)
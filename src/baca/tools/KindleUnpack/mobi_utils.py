@@ -8,6 +8,7 @@ from __future__ import unicode_literals, division, absolute_import, print_functi
 from .compatibility_utils import PY2, text_type, bchr, bord
 
 import binascii
+import re
 
 if PY2:
     range = xrange
@@ -152,10 +153,15 @@ def toBase32(value, npad=4):
     return num_string
 
 
+_base32_pattern = re.compile(br'[0-9A-V]+')
+
 # converts base32 string to value
 def fromBase32(str_num):
     if isinstance(str_num, text_type):
         str_num = str_num.encode('latin-1')
+    # the digits are the same as int's up to base 32, anything else is converted the way it always was
+    if _base32_pattern.fullmatch(str_num):
+        return int(str_num, 32)
     scalelst = [1,32,1024,32768,1048576,33554432,1073741824,34359738368]
     value = 0
     j = 0
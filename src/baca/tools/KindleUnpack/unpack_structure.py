@@ -92,7 +92,7 @@ class fileNames:
             elif unipath.isdir(realfilePath):
                 self.zipUpDir(myzip, tdir, localfilePath)
 
-    def makeEPUB(self, usedmap, obfuscate_data, uid):
+    def makeEPUB(self, usedmap, obfuscate_data, uid, zipup=True):
         bname = os.path.join(self.k8dir, self.getInputFileBasename() + '.epub')
         # Create an encryption key for Adobe font obfuscation
         # based on the epub's uid
@@ -151,14 +151,18 @@ xmlns:enc="http://www.w3.org/2001/04/xmlenc#" xmlns:deenc="http://ns.adobe.com/d
             with open(pathof(fileout),'wb') as f:
                 f.write(encryption.encode('utf-8'))
 
-        # ready to build epub
-        self.outzip = zipfile.ZipFile(pathof(bname), 'w')
-
-        # add the mimetype file uncompressed
         mimetype = b'application/epub+zip'
         fileout = os.path.join(self.k8dir,'mimetype')
         with open(pathof(fileout),'wb') as f:
             f.write(mimetype)
+        if not zipup:
+            # the epub-like tree is complete, readable as it is
+            return
+
+        # ready to build epub
+        self.outzip = zipfile.ZipFile(pathof(bname), 'w')
+
+        # add the mimetype file uncompressed
         nzinfo = ZipInfo('mimetype', compress_type=zipfile.ZIP_STORED)
         nzinfo.external_attr = 0o600 << 16 # make this a normal file
         self.outzip.writestr(nzinfo, mimetype)
@@ -0,0 +1,92 @@
+import dataclasses
+import hashlib
+import json
+import os
+import shutil
+import zlib
+from pathlib import Path
+
+from baca import __version__
+from baca.models import BookMetadata, ParsedBook, Segment, SegmentType, TocEntry
+from baca.utils.user_appdirs import retrieve_user_parsed_cachedir
+
+CACHE_FILE_SUFFIX = ".json.z"
+
+
+def get_cache_key(ebook_path: Path) -> str:
+    # NOTE: baca version is part of the key since
+    # parser changes might produce different segments
+    stat = ebook_path.stat()
+    return hashlib.sha1(
+        f"{__version__}:{ebook_path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8")
+    ).hexdigest()
+
+
+def _dump_parsed_book(parsed_book: ParsedBook) -> bytes:
+    data = dict(
+        segments=[[s.type.value, s.content, s.nav_point] for s in parsed_book.segments],
+        toc=[[t.label, t.value] for t in parsed_book.toc],
+        metadata=dataclasses.asdict(parsed_book.metadata),
+    )
+    return zlib.compress(json.dumps(data).encode("utf-8"))
+
+
+def _load_parsed_book(raw: bytes) -> ParsedBook:
+    data = json.loads(zlib.decompress(raw).decode("utf-8"))
+    return ParsedBook(
+        segments=tuple(Segment(type=SegmentType(t), content=c, nav_point=n) for t, c, n in data["segments"]),
+        toc=tuple(TocEntry(label=label, value=value) for label, value in data["toc"]),
+        metadata=BookMetadata(**data["metadata"]),
+    )
+
+
+def load_parsed_book(ebook_path: Path, *, cachedir: Path | None = None) -> ParsedBook | None:
+    cachefile = (cachedir or retrieve_user_parsed_cachedir()) / f"{get_cache_key(ebook_path)}{CACHE_FILE_SUFFIX}"
+    try:
+        with open(cachefile, "rb") as f:
+            parsed_book = _load_parsed_book(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError, zlib.error):
+        # corrupted or outdated cache file
+        cachefile.unlink(missing_ok=True)
+        return None
+
+    # NOTE: mtime is used as last access time for LRU eviction
+    # since atime is unreliable (noatime/relatime mounts)
+    os.utime(cachefile)
+    return parsed_book
+
+
+def save_parsed_book(ebook_path: Path, parsed_book: ParsedBook, max_size: int, *, cachedir: Path | None = None) -> None:
+    """
+    :param max_size: max total size of the cache directory in bytes,
+        least recently used entries get evicted first
+    """
+    cachedir = cachedir or retrieve_user_parsed_cachedir()
+    raw = _dump_parsed_book(parsed_book)
+    if len(raw) > max_size:
+        return
+
+    cachefile = cachedir / f"{get_cache_key(ebook_path)}{CACHE_FILE_SUFFIX}"
+    tmpfile = cachefile.with_suffix(".tmp")
+    with open(tmpfile, "wb") as f:
+        f.write(raw)
+    os.replace(tmpfile, cachefile)
+
+    evict_parsed_books(max_size, cachedir=cachedir)
+
+
+def evict_parsed_books(max_size: int, *, cachedir: Path | None = None) -> None:
+    cachedir = cachedir or retrieve_user_parsed_cachedir()
+    entries = [(f, f.stat()) for f in cachedir.glob(f"*{CACHE_FILE_SUFFIX}")]
+    total_size = sum(stat.st_size for _, stat in entries)
+    for cachefile, stat in sorted(entries, key=lambda x: x[1].st_mtime_ns):
+        if total_size <= max_size:
+            break
+        cachefile.unlink(missing_ok=True)
+        total_size -= stat.st_size
+
+
+def purge_parsed_books(*, cachedir: Path | None = None) -> None:
+    shutil.rmtree(cachedir or retrieve_user_parsed_cachedir(), ignore_errors=True)
@@ -10,6 +10,7 @@ from rich.table import Table
 from baca import __appname__, __version__
 from baca.ebooks import Azw, Ebook, Epub, Mobi
 from baca.exceptions import EbookNotFound, FormatNotSupported
+from baca.utils.book_cache import purge_parsed_books
 from baca.utils.queries import (
     get_all_reading_history,
     get_best_match_from_history,
@@ -52,7 +53,7 @@ def parse_cli_args() -> argparse.Namespace:
     positional_arg_help_str = "[PATH | # | PATTERN ]"
     args_parser = argparse.ArgumentParser(
         prog=prog,
-        usage=f"%(prog)s [-h] [-r] [-v] {positional_arg_help_str}",
+        usage=f"%(prog)s [-h] [-r] [-v] [--clear-cache] {positional_arg_help_str}",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         description="TUI Ebook Reader",
         epilog=textwrap.dedent(
@@ -66,6 +67,7 @@ def parse_cli_args() -> argparse.Namespace:
         ),
     )
     args_parser.add_argument("-r", "--history", action="store_true", help="print reading history")
+    args_parser.add_argument("--clear-cache", action="store_true", help="purge parsed ebooks cache and exit")
     args_parser.add_argument(
         "-v",
         "--version",
@@ -89,6 +91,10 @@ def find_file() -> Path:
         print_reading_history()
         sys.exit(0)
 
+    elif args.clear_cache:
+        purge_parsed_books()
+        sys.exit(0)
+
     elif len(args.ebook) == 0:
         last_read = get_last_read_ebook()
         if last_read is not None:
@@ -1,66 +1,363 @@
-from typing import Iterator
+import html
+import re
+from functools import partial
+from html.parser import HTMLParser
+from typing import Callable, Iterator, Type
 from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup
+from bs4.dammit import EntitySubstitution
+from bs4.element import (
+    CData,
+    Comment,
+    Declaration,
+    Doctype,
+    NavigableString,
+    ProcessingInstruction,
+)
 from markdownify import MarkdownConverter as _MarkdownConverter
 
 from baca.models import Segment, SegmentType
 
+# NOTE: following BeautifulSoup's html.parser tree builder
+# so the serialized html stays the same as str(BeautifulSoup(...).find("body"))
+VOID_ELEMENTS = {
+    "area",
+    "base",
+    "basefont",
+    "bgsound",
+    "br",
+    "col",
+    "command",
+    "embed",
+    "frame",
+    "hr",
+    "image",
+    "img",
+    "input",
+    "isindex",
+    "keygen",
+    "link",
+    "menuitem",
+    "meta",
+    "nextid",
+    "param",
+    "source",
+    "spacer",
+    "track",
+    "wbr",
+}
+PRESERVE_WHITESPACE_ELEMENTS = {"pre", "textarea"}
+UNESCAPED_TEXT_ELEMENTS = {"script", "style"}
+MULTI_VALUED_ATTRIBUTES = {
+    "*": {"class", "accesskey", "dropzone"},
+    "a": {"rel", "rev"},
+    "link": {"rel", "rev"},
+    "td": {"headers"},
+    "th": {"headers"},
+    "form": {"accept-charset"},
+    "object": {"archive"},
+    "area": {"rel"},
+    "icon": {"sizes"},
+    "iframe": {"sandbox"},
+    "output": {"for"},
+}
+ASCII_SPACES = set("\x20\x0a\x09\x0c\x0d")
+NON_WHITESPACE_RE = re.compile(r"\S+")
+IMAGE_ELEMENTS = {"img", "image"}
+
 
 class MarkdownConverter(_MarkdownConverter):
     def convert_img(self, el, text, convert_as_inline):
         return ""
 
 
-def split_html_to_segments(
-    html_src: str, section_name: str, *, ids_to_find: list[str] | None = None
-) -> Iterator[Segment]:
+# NOTE: converter has no per document state, so a single instance is shared
+MARKDOWN_CONVERTER = MarkdownConverter()
+
+
+class HTMLSegmenter(HTMLParser):
+    """
+    Single pass html parser that serializes the first <body> element
+    (or the whole document if there's none) split into segments
+    at section elements (elements with id) and images inside of it.
     """
-    :param ids_to_find:
-        ids_to_find is url fragment (eg. https://url.com/content.html#fragment) to find inside given `html_src`
 
-        - if None will find all possible id(s)
-        - if [] then, will skip finding id(s) section in html_src
+    def __init__(self, *, ids_to_find: set[str] | None = None, root_tag: str | None = "body"):
+        super().__init__(convert_charrefs=False)
+        self.ids_to_find = ids_to_find
+        self.root_tag = root_tag
+
+        # segment contents, each of segments[1:] begins with its element in `elements`
+        self.segments: list[str] = []
+        # (tag name, attributes)
+        self.elements: list[tuple[str, dict[str, str]]] = []
+        self.is_root_found = root_tag is None
+
+        self._pieces: list[str] = []
+        self._stack: list[str] = []
+        self._open_tags: dict[str, int] = {}
+        self._root_depth: int | None = 0 if root_tag is None else None
+        self._is_root_closed = False
+        self._preserve_whitespace_depth = 0
+        self._data: list[str] = []
+        self._already_closed_void_elements: list[str] = []
+
+    @property
+    def is_in_root(self) -> bool:
+        return self._root_depth is not None and not self._is_root_closed
+
+    # NOTE: output hooks, everything passed here is already inside of the root element
+    # and has its newlines replaced with spaces (as the serialized root is kept in one line)
+    def _write_starttag(self, tag: str, attrs: dict[str, str]) -> None:
+        self._pieces.append(f"<{tag}{self._format_attrs(attrs)}{'/' if tag in VOID_ELEMENTS else ''}>")
+
+    def _write_endtag(self, tag: str) -> None:
+        self._pieces.append(f"</{tag}>")
+
+    def _write_string(self, data: str, string_type: Type[NavigableString]) -> None:
+        if string_type is NavigableString:
+            if len(self._stack) == 0 or self._stack[-1] not in UNESCAPED_TEXT_ELEMENTS:
+                data = EntitySubstitution.substitute_xml(data)
+            self._pieces.append(data)
+        else:
+            self._pieces.append((string_type.PREFIX + data + string_type.SUFFIX).replace("\n", " "))
+
+    def _finish_segment(self) -> str:
+        segment = "".join(self._pieces)
+        self._pieces = []
+        return segment
+
+    def _flush_data(self, string_type: Type[NavigableString] = NavigableString) -> None:
+        if len(self._data) == 0:
+            return
+
+        data = "".join(self._data)
+        self._data = []
+        if self._preserve_whitespace_depth == 0 and all(c in ASCII_SPACES for c in data):
+            data = "\n" if "\n" in data else " "
+
+        if self.is_in_root:
+            self._write_string(data.replace("\n", " "), string_type)
+
+    def _push(self, tag: str) -> None:
+        self._stack.append(tag)
+        self._open_tags[tag] = self._open_tags.get(tag, 0) + 1
+        if tag in PRESERVE_WHITESPACE_ELEMENTS:
+            self._preserve_whitespace_depth += 1
+
+    def _pop(self) -> None:
+        tag = self._stack.pop()
+        self._open_tags[tag] -= 1
+        if tag in PRESERVE_WHITESPACE_ELEMENTS:
+            self._preserve_whitespace_depth -= 1
+
+        if self.is_in_root and tag not in VOID_ELEMENTS:
+            self._write_endtag(tag)
+        if self.root_tag is not None and len(self._stack) == self._root_depth:
+            self._is_root_closed = True
+
+    def _pop_to_tag(self, tag: str) -> None:
+        while self._open_tags.get(tag, 0) > 0:
+            is_matched = self._stack[-1] == tag
+            self._pop()
+            if is_matched:
+                break
+
+    @staticmethod
+    def _normalize_attrs(tag: str, attrs: dict[str, str]) -> dict[str, str]:
+        multi_valued_attrs = MULTI_VALUED_ATTRIBUTES["*"] | MULTI_VALUED_ATTRIBUTES.get(tag, set())
+        normalized: dict[str, str] = {}
+        for key, value in sorted(attrs.items()):
+            if key in multi_valued_attrs:
+                value = " ".join(NON_WHITESPACE_RE.findall(value))
+            normalized[key] = value.replace("\n", " ")
+        return normalized
+
+    @staticmethod
+    def _format_attrs(attrs: dict[str, str]) -> str:
+        return "".join(
+            f" {key}={EntitySubstitution.substitute_xml(value, make_quoted_attribute=True)}"
+            for key, value in attrs.items()
+        )
+
+    def _start_tag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self._flush_data()
+
+        attr_dict: dict[str, str] = {}
+        for key, value in attrs:
+            attr_dict[key] = value if value is not None else ""
+
+        if not self.is_root_found and tag == self.root_tag:
+            self.is_root_found = True
+            self._root_depth = len(self._stack)
+
+        if self.is_in_root:
+            if self.ids_to_find is None:
+                is_section = "id" in attr_dict
+            else:
+                is_section = attr_dict.get("id") in self.ids_to_find
+            if is_section or tag in IMAGE_ELEMENTS:
+                self.segments.append(self._finish_segment())
+                self.elements.append((tag, attr_dict))
+
+            self._write_starttag(tag, self._normalize_attrs(tag, attr_dict))
+        self._push(tag)
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self._start_tag(tag, attrs)
+        if tag in VOID_ELEMENTS:
+            self._pop_to_tag(tag)
+            self._already_closed_void_elements.append(tag)
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self._start_tag(tag, attrs)
+        self._pop_to_tag(tag)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self._already_closed_void_elements:
+            self._already_closed_void_elements.remove(tag)
+        else:
+            self._flush_data()
+            self._pop_to_tag(tag)
+
+    def handle_data(self, data: str) -> None:
+        self._data.append(data)
+
+    def handle_charref(self, name: str) -> None:
+        self._data.append(html.unescape(f"&#{name};"))
+
+    def handle_entityref(self, name: str) -> None:
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self._data.append(character if character is not None else f"&{name}")
+
+    def _handle_special_string(self, data: str, string_type: Type[NavigableString]) -> None:
+        self._flush_data()
+        self._data.append(data)
+        self._flush_data(string_type)
+
+    def handle_comment(self, data: str) -> None:
+        self._handle_special_string(data, Comment)
+
+    def handle_decl(self, decl: str) -> None:
+        self._handle_special_string(decl[len("DOCTYPE ") :], Doctype)
+
+    def unknown_decl(self, data: str) -> None:
+        if data.upper().startswith("CDATA["):
+            self._handle_special_string(data[len("CDATA[") :], CData)
+        else:
+            self._handle_special_string(data, Declaration)
+
+    def handle_pi(self, data: str) -> None:
+        self._handle_special_string(data, ProcessingInstruction)
+
+    def close(self) -> None:
+        super().close()
+        self._flush_data()
+        while len(self._stack) > 0:
+            self._pop()
+        self.segments.append(self._finish_segment())
+
+
+class MarkdownSegmenter(HTMLSegmenter):
+    """
+    HTMLSegmenter that converts each segment into markdown as soon as it's finished
+    by feeding the parse events directly into a BeautifulSoup tree for markdownify,
+    instead of serializing it to html and parsing it back.
     """
-    soup = BeautifulSoup(html_src, "html.parser", store_line_numbers=True)
-    body = soup.find("body")
-    body_html = str(body).replace("\n", " ")
-    body = BeautifulSoup(body_html, "html.parser")
 
+    def __init__(self, *, converter: _MarkdownConverter, **kwargs):
+        super().__init__(**kwargs)
+        self.converter = converter
+        self._soup = BeautifulSoup("", "html.parser")
+
+    def _write_starttag(self, tag: str, attrs: dict[str, str]) -> None:
+        self._soup.handle_starttag(tag, None, None, attrs)
+        if tag in VOID_ELEMENTS:
+            self._soup.handle_endtag(tag)
+
+    def _write_endtag(self, tag: str) -> None:
+        self._soup.handle_endtag(tag)
+
+    def _write_string(self, data: str, string_type: Type[NavigableString]) -> None:
+        if string_type is NavigableString:
+            self._soup.handle_data(data)
+            return
+
+        # NOTE: same as what html.parser would make of the serialized html,
+        # <?declaration?> is read back as a processing instruction ending with "?"
+        # and the newline after doctype as a (whitespace) string
+        if string_type is Declaration:
+            string_type, data = ProcessingInstruction, data + "?"
+        self._soup.endData()
+        self._soup.handle_data(data)
+        self._soup.endData(string_type)
+        if string_type is Doctype:
+            self._soup.handle_data(" ")
+
+    def _finish_segment(self) -> str:
+        self._soup.endData()
+        while self._soup.currentTag.name != self._soup.ROOT_TAG_NAME:
+            self._soup.popTag()
+        segment = self.converter.convert_soup(self._soup)
+        self._soup.reset()
+        return segment
+
+
+def _iter_segments(
+    segmenter_factory: Callable[..., HTMLSegmenter],
+    html_src: str,
+    section_name: str,
+    *,
+    ids_to_find: list[str] | None = None,
+) -> Iterator[Segment]:
     find_nav_points = ids_to_find is None or len(ids_to_find) > 0
-    if find_nav_points:
-        section_elems = body.find_all(id=True if ids_to_find is None else ids_to_find)
-    else:
-        section_elems = []
-    img_elems = body.find_all(["img", "image"])
-    all_elems = sorted(section_elems + img_elems, key=lambda x: [x.sourceline, x.sourcepos])  # type: ignore
-
-    start = 0
+    parser = segmenter_factory(ids_to_find=None if ids_to_find is None else set(ids_to_find))
+    parser.feed(html_src)
+    parser.close()
+    if not parser.is_root_found:
+        parser = segmenter_factory(ids_to_find=None if ids_to_find is None else set(ids_to_find), root_tag=None)
+        parser.feed(html_src)
+        parser.close()
+
     nav_point = section_name
-    for elem in all_elems:
-        yield Segment(type=SegmentType.BODY, content=body_html[start : elem.sourcepos], nav_point=nav_point)  # type: ignore
+    for content, (tag, attrs) in zip(parser.segments, parser.elements):
+        yield Segment(type=SegmentType.BODY, content=content, nav_point=nav_point)
 
-        start = elem.sourcepos
-        fragment = elem.get("id")
+        fragment = attrs.get("id")
         nav_point = f"{section_name}#{fragment}" if find_nav_points and fragment is not None else None
 
-        if elem.name in {"img", "image"}:  # type: ignore
-            img_src = elem.get("src") or elem.get("href")  # type: ignore
+        if tag in IMAGE_ELEMENTS:
+            img_src = attrs.get("src") or attrs.get("href")
             if img_src is not None:
                 # NOTE: urljoin should be able to handle relative path. ie urljoin("a", "b") == "b"
                 yield Segment(type=SegmentType.IMAGE, content=urljoin(section_name, img_src), nav_point=nav_point)
 
-    yield Segment(type=SegmentType.BODY, content=body_html[start:], nav_point=nav_point)
+    yield Segment(type=SegmentType.BODY, content=parser.segments[-1], nav_point=nav_point)
+
+
+def split_html_to_segments(
+    html_src: str, section_name: str, *, ids_to_find: list[str] | None = None
+) -> Iterator[Segment]:
+    """
+    :param ids_to_find:
+        ids_to_find is url fragment (eg. https://url.com/content.html#fragment) to find inside given `html_src`
+
+        - if None will find all possible id(s)
+        - if [] then, will skip finding id(s) section in html_src
+    """
+    yield from _iter_segments(HTMLSegmenter, html_src, section_name, ids_to_find=ids_to_find)
 
 
 def parse_html_to_segmented_md(
     html_src: str, section_name: str, *, ids_to_find: list[str] | None = None
 ) -> Iterator[Segment]:
-    for segment in split_html_to_segments(html_src, section_name, ids_to_find=ids_to_find):
-        yield Segment(
-            type=segment.type,
-            content=MarkdownConverter().convert(segment.content)
-            if segment.type == SegmentType.BODY
-            else segment.content,
-            nav_point=segment.nav_point,
-        )
+    """
+    Same segments as `split_html_to_segments` with body segments converted to markdown,
+    equivalent to (but without re-parsing each segment html)::
+
+        MarkdownConverter().convert(segment.content)
+    """
+    yield from _iter_segments(
+        partial(MarkdownSegmenter, converter=MARKDOWN_CONVERTER), html_src, section_name, ids_to_find=ids_to_find
+    )
@@ -0,0 +1,300 @@
+from types import SimpleNamespace
+from typing import Iterator
+
+from baca.models import BookMetadata, TocEntry
+from baca.tools.KindleUnpack.compatibility_utils import unescapeit
+from baca.tools.KindleUnpack.kindleunpack import (
+    EOF_RECORD,
+    K8_BOUNDARY,
+    unpackException,
+)
+from baca.tools.KindleUnpack.mobi_cover import CoverProcessor, get_image_type
+from baca.tools.KindleUnpack.mobi_dict import dictSupport
+from baca.tools.KindleUnpack.mobi_header import MobiHeader
+from baca.tools.KindleUnpack.mobi_html import HTMLProcessor, XHTMLK8Processor
+from baca.tools.KindleUnpack.mobi_k8proc import K8Processor
+from baca.tools.KindleUnpack.mobi_k8resc import K8RESCProcessor
+from baca.tools.KindleUnpack.mobi_ncx import ncxExtract
+from baca.tools.KindleUnpack.mobi_sectioner import Sectionizer
+
+# resource sections without any file to unpack
+NON_FILE_SECTIONS = {b"FLIS", b"FCIS", b"FDST", b"DATP", b"SRCS", b"PAGE", b"CMET", b"CONT", b"kind"}
+# NOTE: the cover page is created the way KindleUnpack does for KF8 books
+# not showing their cover image at the start of the first part
+COVER_PAGE_DIRS = SimpleNamespace(k8images="Images", k8text="Text")
+
+MOBI7_HTML = "book.html"
+
+
+class KindleBook:
+    """
+    Kindle book (Mobi7, KF8 or combination of both) unpacked into memory,
+    the in-memory counterpart of `baca.tools.unpack_kindle_book` without
+    writing the unpacked tree (and an epub of it) to the disk.
+
+    The unpacked files are kept with the paths they would have in the
+    unpacked tree, relative to its OEBPS dir for KF8 (eg. "Text/part0000.xhtml",
+    "Images/image00012.jpeg") or to the mobi7 dir for Mobi7 books ("book.html").
+    The xhtml of the KF8 parts is only built once read, see `read()`.
+    """
+
+    def __init__(self, ebook_path: str, *, use_hd: bool = True, max_workers: int | None = 1):
+        # unpacked path -> content
+        self.files: dict[str, bytes | memoryview] = {}
+        self.spine: tuple[str, ...] = ()
+        self.toc: tuple[TocEntry, ...] = ()
+        # path -> number of the KF8 parts, their xhtml is built on the first read
+        self._part_numbers: dict[str, int] = {}
+        self._xhtml_processor: XHTMLK8Processor | None = None
+
+        # NOTE: the book file is mapped rather than read whole, the images are kept
+        # as views of the mapping so they only get read once they're actually shown
+        self._sect = Sectionizer(ebook_path, use_mmap=True)
+        try:
+            self._unpack(self._sect, use_hd, max_workers)
+        except BaseException:
+            self.close()
+            raise
+
+    def read(self, path: str) -> bytes | memoryview:
+        """
+        :return: content of the unpacked file
+        :raises KeyError: if there's no such file
+        """
+        if path not in self.files and path in self._part_numbers:
+            assert self._xhtml_processor is not None
+            self.files[path] = self._xhtml_processor.buildPart(self._part_numbers[path])
+        return self.files[path]
+
+    def close(self) -> None:
+        """
+        Unmap the book file, the images can't be read anymore
+        """
+        self.files.clear()
+        self._sect.close()
+
+    def _unpack(self, sect: Sectionizer, use_hd: bool, max_workers: int | None) -> None:
+        if sect.ident != b"BOOKMOBI" and sect.ident != b"TEXtREAd":
+            raise unpackException("Invalid file format")
+
+        mobi_headers = [MobiHeader(sect, 0)]
+        k8_boundary = -1
+        if not mobi_headers[0].isK8():
+            k8_boundary = find_k8_boundary(sect)
+            if k8_boundary != -1:
+                mobi_headers.append(MobiHeader(sect, k8_boundary + 1))
+
+        # NOTE: resources of all the headers share the numbering,
+        # KF8 part of a combination book refers to the images of its Mobi7 part
+        self._rscnames: list[str | None] = []
+        self._rsc_ptr = -1
+        self._k8resc: K8RESCProcessor | None = None
+        for mh in mobi_headers:
+            if mh.isEncrypted():
+                raise unpackException("Book is encrypted")
+            self._unpack_resources(sect, mh, k8_boundary, use_hd)
+
+        # only the last header gets unpacked, ie. KF8 part of a combination book
+        mh = mobi_headers[-1]
+        self.codec: str = mh.codec
+        self.metadata = get_book_metadata(mh.getMetaData())
+        if mh.isPrintReplica():
+            raise NotImplementedError("Unsupported Print Replica book")
+        elif mh.isK8():
+            self._unpack_mobi8(sect, mh, max_workers)
+        else:
+            self._unpack_mobi7(sect, mh, max_workers)
+
+    def _unpack_resources(self, sect: Sectionizer, mh: MobiHeader, k8_boundary: int, use_hd: bool) -> None:
+        metadata = mh.getMetaData()
+        beg = mh.firstresource
+        end = k8_boundary if beg < k8_boundary else sect.num_sections
+        try:
+            thumb_offset = int(metadata.get("ThumbOffset", ["-1"])[0])
+        except ValueError:
+            thumb_offset = None
+        cover_offset = int(metadata.get("CoverOffset", ["-1"])[0])
+
+        for i in range(beg, end):
+            data = sect.loadSectionView(i)
+            section_type = bytes(data[0:4])
+            name = None
+            if section_type in NON_FILE_SECTIONS or data == EOF_RECORD or data[0:8] == K8_BOUNDARY:
+                pass
+            elif section_type == b"RESC":
+                self._k8resc = K8RESCProcessor(bytes(data[16:]), False)
+            elif section_type == b"FONT":
+                # NOTE: fonts are of no use in the terminal,
+                # only keep their place in the resource numbering
+                name = f"font{i:05d}.dat"
+                if self._rsc_ptr == -1:
+                    self._rsc_ptr = i - beg
+            elif section_type == b"CRES":
+                # HD image overwriting the low resolution one
+                hd_image = data[12:]
+                low_res_name = self._rscnames[self._rsc_ptr] if 0 <= self._rsc_ptr < len(self._rscnames) else None
+                if use_hd and low_res_name is not None and sniff_image_type(hd_image) is not None:
+                    self.files[f"Images/{low_res_name}"] = hd_image
+                self._rsc_ptr += 1
+            elif section_type == b"\xa0\xa0\xa0\xa0":
+                # empty HD image placeholder
+                self._rsc_ptr += 1
+            else:
+                image_type = sniff_image_type(data)
+                if image_type is not None:
+                    if i == beg + cover_offset:
+                        name = f"cover{i:05d}.{image_type}"
+                    elif thumb_offset is not None and i == beg + thumb_offset:
+                        name = f"thumb{i:05d}.{image_type}"
+                    else:
+                        name = f"image{i:05d}.{image_type}"
+                    self.files[f"Images/{name}"] = data
+                    if self._rsc_ptr == -1:
+                        self._rsc_ptr = i - beg
+            self._rscnames.append(name)
+
+    def _unpack_mobi8(self, sect: Sectionizer, mh: MobiHeader, max_workers: int | None) -> None:
+        k8proc = K8Processor(mh, sect, None)
+        # NOTE: text records of large huffman coded books get decoded
+        # in worker processes, unless opened with a single one
+        k8proc.buildParts(mh.getRawML(max_workers=max_workers))
+
+        ncx_data = ncxExtract(mh, None).parseNCX()
+        for entry in ncx_data:
+            _, _, _, fid, _, off = entry["pos_fid"].split(":")
+            filename, idtag = k8proc.getIDTagByPosFid(fid, off)
+            fragment = f"#{idtag.decode('utf-8')}" if idtag != b"" else ""
+            entry["href"] = f"Text/{filename}{fragment}"
+
+        # NOTE: only the links & flows get processed upfront,
+        # the xhtml of every part is built once it's read
+        self._xhtml_processor = XHTMLK8Processor(self._rscnames, k8proc)
+        self._xhtml_processor.prepare()
+        k8proc.setFlows(self._xhtml_processor.flows)
+
+        # spine item key (skeleton number or "coverpage") -> path
+        parts: dict[str, str] = {}
+        for i in range(k8proc.getNumberOfParts()):
+            skelnum = k8proc.getPartInfo(i)[0]
+            parts[str(skelnum)] = get_part_path(k8proc, i)
+            self._part_numbers[parts[str(skelnum)]] = i
+        cover_page = self._build_cover_page(mh, k8proc)
+        if cover_page is not None:
+            parts = {"coverpage": "Text/" + cover_page.getXHTMLName(), **parts}
+            self.files[parts["coverpage"]] = cover_page.buildXHTML().encode("utf-8")
+        for i in range(1, k8proc.getNumberOfFlows()):
+            _, flow_format, dirname, filename = k8proc.getFlowInfo(i)
+            if flow_format == b"file":
+                self.files[f"{dirname}/{filename}"] = k8proc.getFlow(i)
+
+        if self._k8resc is not None and self._k8resc.hasSpine():
+            self.spine = tuple(dict.fromkeys(parts[key] for key in self._k8resc.spine_order if key in parts))
+        else:
+            self.spine = tuple(parts.values())
+        self.toc = tuple(iter_toc(ncx_data))
+
+    def _build_cover_page(self, mh: MobiHeader, k8proc: K8Processor) -> CoverProcessor | None:
+        """
+        :return: cover page to insert before the parts (see `processMobi8`) if any
+        """
+        metadata = mh.getMetaData()
+        if "CoverOffset" not in metadata:
+            return None
+        cover_offset = int(metadata["CoverOffset"][0])
+        cover_image = self._rscnames[cover_offset] if 0 <= cover_offset < len(self._rscnames) else None
+        if cover_image is None:
+            return None
+
+        k8resc = self._k8resc
+        if k8resc is None or not k8resc.hasSpine():
+            if self.read(get_part_path(k8proc, 0)).find(cover_image.encode("utf-8")) != -1:
+                return None
+        else:
+            if "coverpage" not in k8resc.spine_idrefs:
+                part = self.read(get_part_path(k8proc, int(k8resc.spine_order[0])))
+                if part.find(cover_image.encode("utf-8")) == -1:
+                    k8resc.prepend_to_spine("coverpage", "inserted", "no", None)
+            if k8resc.spine_order[0] != "coverpage":
+                return None
+        return CoverProcessor(
+            COVER_PAGE_DIRS, metadata, self._rscnames, cover_image, bytes(self.files[f"Images/{cover_image}"])
+        )
+
+    def _unpack_mobi7(self, sect: Sectionizer, mh: MobiHeader, max_workers: int | None) -> None:
+        raw_ml = mh.getRawML(max_workers=max_workers)
+        ncx_data = ncxExtract(mh, None).parseNCX()
+        for entry in ncx_data:
+            entry["href"] = f"{MOBI7_HTML}#filepos{entry['pos']}"
+
+        position_map = dictSupport(mh, sect).getPositionMap() if mh.isDictionary() else {}
+        html_processor = HTMLProcessor(None, mh.getMetaData(), self._rscnames)
+        html_processor.findAnchors(raw_ml, ncx_data, position_map)
+        self.files[MOBI7_HTML], _ = html_processor.insertHREFS()
+
+        self.spine = (MOBI7_HTML,)
+        self.toc = tuple(iter_toc(ncx_data))
+
+
+def get_part_path(k8proc: K8Processor, i: int) -> str:
+    _, dirname, filename, _, _, _ = k8proc.getPartInfo(i)
+    return f"{dirname}/{filename}"
+
+
+def find_k8_boundary(sect: Sectionizer) -> int:
+    """
+    :return: section number of the boundary of combination Mobi7/KF8 book, -1 if there's none
+    """
+    for i in range(len(sect.sectionoffsets) - 1):
+        before, after = sect.sectionoffsets[i : i + 2]
+        if after - before == len(K8_BOUNDARY) and sect.loadSection(i) == K8_BOUNDARY:
+            return i
+    return -1
+
+
+def sniff_image_type(data: memoryview) -> str | None:
+    """
+    The same as `get_image_type()` without reading the whole image unless it's a bare jpeg
+    """
+    # NOTE: imghdr only looks at the first 32 bytes
+    image_type = get_image_type(None, bytes(data[:32]))
+    if image_type is None and data[0:2] == b"\xff\xd8":
+        image_type = get_image_type(None, bytes(data))
+    return image_type
+
+
+def iter_toc(ncx_data: list[dict]) -> Iterator[TocEntry]:
+    """
+    Flatten the ncx entries in document order, the same as `ncxExtract.buildNCX()` nests them
+    """
+
+    def iter_level(start: int, end: int, level: int) -> Iterator[TocEntry]:
+        for entry in ncx_data[start:end]:
+            if entry["hlvl"] != level:
+                continue
+            yield TocEntry(label=unescapeit(entry["text"]), value=entry["href"])
+            if entry["child1"] >= 0:
+                yield from iter_level(entry["child1"], entry["childn"] + 1, level + 1)
+
+    return iter_level(0, len(ncx_data), 0)
+
+
+def get_book_metadata(metadata: dict[str, list[str]]) -> BookMetadata:
+    """
+    :param metadata: metadata of mobi header, see `MobiHeader.getMetaData()`
+    """
+
+    def get(key: str) -> str | None:
+        # NOTE: the same as the first dc element of the opf KindleUnpack creates
+        values = metadata.get(key)
+        return unescapeit(values[0]) if values else None
+
+    return BookMetadata(
+        title=get("Title"),
+        creator=get("Creator"),
+        description=get("Description"),
+        publisher=get("Publisher"),
+        date=get("Published"),
+        language=get("Language"),
+        identifier=get("UniqueID"),
+        source=get("Source"),
+    )
@@ -0,0 +1,42 @@
+from typing import Callable
+
+
+class SearchIndex:
+    """
+    Plain text of the laid out lines (joined with newlines) of every segment,
+    so searching doesn't need to render the content line by line
+    """
+
+    def __init__(self):
+        # None for the segments not indexed yet
+        self.texts: list[str | None] = []
+        # bumped on every reset to stop the outdated builds
+        self.generation = 0
+
+    def reset(self, size: int) -> None:
+        """
+        Drop the whole index, eg. once the segments get laid out for another width
+        """
+        self.generation += 1
+        self.texts = [None] * size
+
+    def extend(self, size: int) -> None:
+        """
+        Make room for the newly added segments
+        """
+        self.texts.extend([None] * (size - len(self.texts)))
+
+    def build(self, layout_text: Callable[[int], str]) -> None:
+        """
+        Index the segments not indexed yet, meant to be run in a worker thread;
+        stops early once the index gets reset
+
+        :param layout_text: returns the plain text of the segment at given index
+        """
+        generation, texts = self.generation, self.texts
+        index = 0
+        # NOTE: segments may get added while building
+        while index < len(texts) and generation == self.generation:
+            if texts[index] is None:
+                texts[index] = layout_text(index)
+            index += 1
@@ -17,6 +17,14 @@ def retrieve_user_cache_dbfile() -> Path:
     return Path(cachedir) / f"{__appname__}.db"
 
 
+def retrieve_user_parsed_cachedir() -> Path:
+    cachedir = Path(appdirs.user_cache_dir(__appname__)) / "parsed"
+    if not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+
+    return cachedir
+
+
 def retrieve_user_config_file() -> Path:
     configdir = Path(appdirs.user_config_dir(appname=__appname__))
     if not os.path.isdir(configdir):
@@ -0,0 +1,818 @@
+"""
+Minimal Mobipocket (Mobi7), KF8 (AZW3) & combination Mobi7/KF8 book writer,
+just enough of the format for KindleUnpack to read the books back.
+
+Chapters are written in a tiny xhtml subset:
+  - `<img src="image:N"/>` refers to the N-th image (1-based)
+  - `<a href="#ID">` links to an element with `id="ID"`
+  - `<h2 id="ID">` are the chapter headings, `<h3 id="ID">` their sections,
+    both end up in the ncx toc
+"""
+
+import heapq
+import io
+import random
+import re
+import struct
+from collections import Counter
+from dataclasses import dataclass, field
+
+from PIL import Image
+
+from baca.tools.KindleUnpack.mobi_k8proc import (
+    K8Processor,
+    locate_beg_end_of_tag,
+    reverse_tag_iter,
+)
+from baca.tools.KindleUnpack.mobi_uncompress import HuffcdicReader
+from baca.tools.KindleUnpack.mobi_utils import toBase32
+
+RECORD_SIZE = 4096
+# NOTE: real books store fragments of a few kilobytes
+FRAGMENT_SIZE = 1024
+
+NO_COMPRESSION = 1
+PALMDOC_COMPRESSION = 2
+HUFFCDIC_COMPRESSION = 0x4448
+
+EOF_RECORD = b"\xe9\x8e\r\n"
+NULL_INDEX = 0xFFFFFFFF
+
+
+@dataclass
+class Chapter:
+    title: str
+    body: str
+
+
+@dataclass
+class BookSpec:
+    title: str = "The Title"
+    creator: str = "The Author"
+    chapters: list[Chapter] = field(default_factory=list)
+    images: list[bytes] = field(default_factory=list)
+    css: str = "p { margin: 0; }"
+    cover: int | None = None  # 1-based image number
+
+
+def make_image(width: int = 16, height: int = 8, color: tuple[int, int, int] = (200, 30, 30)) -> bytes:
+    with io.BytesIO() as f:
+        Image.new("RGB", (width, height), color).save(f, "PNG")
+        return f.getvalue()
+
+
+def make_book_spec(chapters: int = 3, paragraphs: int = 6, *, seed: int = 0) -> BookSpec:
+    rnd = random.Random(seed)
+    words = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+    spec = BookSpec(images=[make_image(16 + n, 8, (n * 40 % 256, 80, 160)) for n in range(3)], cover=1)
+    for n in range(1, chapters + 1):
+        body = [f'<h2 id="ch{n}">Chapter {n}</h2>']
+        for p in range(paragraphs):
+            if p == paragraphs // 2:
+                body.append(f'<h3 id="ch{n}s1">Section {n}.1</h3>')
+            text = " ".join(rnd.choice(words) for _ in range(rnd.randint(20, 60)))
+            body.append(f"<p>{text}</p>")
+        body.append(f'<p><img src="image:{2 + n % 2}"/></p>')
+        body.append(f'<p>See <a href="#ch{n % chapters + 1}">the next chapter</a>.</p>')
+        spec.chapters.append(Chapter(title=f"Chapter {n}", body="".join(body)))
+    return spec
+
+
+# --- palm database primitives ---
+
+
+def palmdoc_compress(data: bytes) -> bytes:
+    """
+    Greedy LZ77 PalmDOC compressor, including overlapping back references
+    """
+    out = bytearray()
+    positions: dict[bytes, int] = {}
+    i, size = 0, len(data)
+    while i < size:
+        best_len, best_dist = 0, 0
+        if i + 3 <= size:
+            candidate = positions.get(data[i : i + 3])
+            if candidate is not None and 0 < i - candidate <= 2047:
+                dist = i - candidate
+                length = 0
+                while length < 10 and i + length < size and data[i + length - dist] == data[i + length]:
+                    length += 1
+                if length >= 3:
+                    best_len, best_dist = length, dist
+            positions[data[i : i + 3]] = i
+        if best_len:
+            out += struct.pack(">H", 0x8000 | (best_dist << 3) | (best_len - 3))
+            for j in range(i + 1, min(i + best_len, size - 2)):
+                positions[data[j : j + 3]] = j
+            i += best_len
+            continue
+        c = data[i]
+        if c == 0x20 and i + 1 < size and 0x40 <= data[i + 1] < 0x80:
+            out.append(data[i + 1] ^ 0x80)
+            i += 2
+        elif c == 0 or 0x09 <= c < 0x80:
+            out.append(c)
+            i += 1
+        else:
+            run = data[i : i + 1]
+            while len(run) < 8 and i + len(run) < size and not (0x09 <= data[i + len(run)] < 0x80):
+                run += data[i + len(run) : i + len(run) + 1]
+            out.append(len(run))
+            out += run
+            i += len(run)
+    return bytes(out)
+
+
+HUFF_TOKEN = re.compile(rb"[A-Za-z]+ ?|.", re.S)
+
+
+def _huffman_code_lengths(frequencies: list[int], max_length: int = 24) -> list[int]:
+    while True:
+        heap = [(frequency, n, [n]) for n, frequency in enumerate(frequencies)]
+        heapq.heapify(heap)
+        lengths = [0] * len(frequencies)
+        while len(heap) > 1:
+            f1, n1, symbols1 = heapq.heappop(heap)
+            f2, n2, symbols2 = heapq.heappop(heap)
+            for symbol in symbols1 + symbols2:
+                lengths[symbol] += 1
+            heapq.heappush(heap, (f1 + f2, min(n1, n2), symbols1 + symbols2))
+        if max(lengths) <= max_length:
+            return lengths
+        frequencies = [frequency // 2 + 1 for frequency in frequencies]
+
+
+def huffcdic_compress(chunks: list[bytes], *, cdic_bits: int = 8) -> tuple[list[bytes], list[bytes]]:
+    """
+    HUFF/CDIC compressor: canonical huffman codes of the single bytes & frequent words
+    and word pairs (phrases), some phrases stored huffman coded themselves so the
+    decoder has to expand them recursively
+
+    :return: compressed chunks, the HUFF record followed by the CDIC records
+    """
+    tokens = [HUFF_TOKEN.findall(chunk) for chunk in chunks]
+    words = Counter(token for chunk_tokens in tokens for token in chunk_tokens if len(token) > 1)
+    phrases = [word for word, count in words.most_common(200) if count > 1]
+    frequent_words = set(phrases)
+    pairs = Counter(
+        first + second
+        for chunk_tokens in tokens
+        for first, second in zip(chunk_tokens, chunk_tokens[1:])
+        if first in frequent_words and second in frequent_words
+    )
+    phrases += [pair for pair, count in pairs.most_common(100) if count > 1]
+    # NOTE: the single bytes make sure there are more than 256 symbols,
+    # ie. the zero padding (the longest code) is never a whole code
+    symbols = [bytes([n]) for n in range(256)] + phrases
+    index = {symbol: n for n, symbol in enumerate(symbols)}
+
+    def tokenize(chunk_tokens: list[bytes]) -> list[int]:
+        out, k = [], 0
+        while k < len(chunk_tokens):
+            pair = b"".join(chunk_tokens[k : k + 2])
+            if k + 1 < len(chunk_tokens) and pair in index:
+                out.append(index[pair])
+                k += 2
+            else:
+                out.extend([index[chunk_tokens[k]]] if chunk_tokens[k] in index else chunk_tokens[k])
+                k += 1
+        return out
+
+    # phrases stored coded: every other word as its bytes & every word pair as its words
+    coded: dict[int, list[int]] = {}
+    for n, symbol in enumerate(symbols[256:], 256):
+        if symbol not in frequent_words:
+            coded[n] = [index[word] for word in HUFF_TOKEN.findall(symbol)]
+        elif n % 2:
+            coded[n] = list(symbol)
+    encoded_chunks = [tokenize(chunk_tokens) for chunk_tokens in tokens]
+    frequencies = Counter(symbol for chunk in encoded_chunks for symbol in chunk)
+    frequencies.update(symbol for phrase in coded.values() for symbol in phrase)
+    lengths = _huffman_code_lengths([frequencies[n] + 1 for n in range(len(symbols))])
+
+    # canonical codes with the bits inverted, ie. shorter codes are numerically larger;
+    # the dictionary is ordered by code length, the largest code of a length first
+    order = sorted(range(len(symbols)), key=lambda n: (lengths[n], n))
+    codes: dict[int, tuple[int, int]] = {}
+    mincode, maxcode, highest = [0] * 33, [0] * 33, [-1] * 33
+    code, previous_length = 0, lengths[order[0]]
+    for r, n in enumerate(order):
+        length = lengths[n]
+        code <<= length - previous_length
+        previous_length = length
+        value = ~code & ((1 << length) - 1)
+        codes[n] = (value, length)
+        if highest[length] == -1:
+            # decoded as r = maxcode - code
+            highest[length], maxcode[length] = value, value + r
+        mincode[length] = value
+        code += 1
+    for length in range(lengths[order[0]] + 1, 33):
+        if highest[length] == -1:
+            # no codes of this length, the longer codes are all smaller than the shorter ones
+            mincode[length] = mincode[length - 1] << 1
+
+    def encode(symbols_to_encode: list[int]) -> bytes:
+        bits, size = 0, 0
+        for symbol in symbols_to_encode:
+            value, length = codes[symbol]
+            bits, size = (bits << length) | value, size + length
+        padding = -size % 8
+        return (bits << padding).to_bytes((size + padding) // 8, "big")
+
+    dict1 = []
+    for prefix in range(256):
+        for length in range(1, 9):
+            if mincode[length] <= prefix >> (8 - length) <= highest[length]:
+                dict1.append((maxcode[length] << 8) | 0x80 | length)
+                break
+        else:
+            # longer code, the decoder looks for its length starting from the shortest one
+            dict1.append(
+                min(length for value, length in codes.values() if length > 8 and value >> (length - 8) == prefix)
+            )
+    dict2 = [value for length in range(1, 33) for value in (mincode[length], maxcode[length])]
+    huff = b"HUFF\x00\x00\x00\x18" + struct.pack(">LL", 24, 24 + 4 * 256) + b"\x00" * 8
+    huff += struct.pack(">256L", *dict1) + struct.pack(">64L", *dict2)
+
+    entries = []
+    for n in order:
+        if n in coded:
+            data = encode(coded[n])
+            entries.append(struct.pack(">H", len(data)) + data)
+        else:
+            entries.append(struct.pack(">H", 0x8000 | len(symbols[n])) + symbols[n])
+    cdics = []
+    per_record = 1 << cdic_bits
+    for start in range(0, len(entries), per_record):
+        record_entries = entries[start : start + per_record]
+        offsets, offset = [], 2 * len(record_entries)
+        for entry in record_entries:
+            offsets.append(offset)
+            offset += len(entry)
+        cdic = b"CDIC\x00\x00\x00\x10" + struct.pack(">LL", len(entries), cdic_bits)
+        cdics.append(cdic + struct.pack(">%dH" % len(offsets), *offsets) + b"".join(record_entries))
+    return [encode(chunk) for chunk in encoded_chunks], [huff] + cdics
+
+
+def _vwi(value: int) -> bytes:
+    # forward encoded variable width integer, the last byte is flagged
+    out = [value & 0x7F | 0x80]
+    value >>= 7
+    while value:
+        out.append(value & 0x7F)
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def _pad4(data: bytes) -> bytes:
+    return data + b"\x00" * (-len(data) % 4)
+
+
+def _indx_header(length: int, idxt_start: int, count: int, total: int = 0, nctoc: int = 0) -> bytes:
+    header = bytearray(0xC0)
+    header[0:4] = b"INDX"
+    # len, nul1, type, gen, start, count, code, lng, total, ordt, ligt, nligt, nctoc
+    struct.pack_into(">13L", header, 4, length, 0, 0, 0, idxt_start, count, 65001, NULL_INDEX, total, 0, 0, 0, nctoc)
+    return bytes(header)
+
+
+def build_index(entries: list[tuple[bytes, dict[int, list[int]]]], tags: list[tuple[int, int]]) -> list[bytes]:
+    """
+    :param entries: (entry text, {tag: values}) pairs
+    :param tags: (tag, values per entry) of the tag table, at most 8
+    :return: main INDX record followed by the entry records
+    """
+    tagx = b"TAGX" + struct.pack(">LL", 12 + 4 * (len(tags) + 1), 1)
+    tagx += b"".join(struct.pack(">BBBB", tag, nvalues, 1 << n, 0) for n, (tag, nvalues) in enumerate(tags))
+    tagx += b"\x00\x00\x00\x01"
+
+    records: list[bytes] = []
+    chunk: list[bytes] = []
+
+    def flush() -> None:
+        body = b"".join(chunk)
+        offsets, pos = [], 0xC0
+        for entry in chunk:
+            offsets.append(pos)
+            pos += len(entry)
+        idxt_start = 0xC0 + len(body)
+        idxt = b"IDXT" + b"".join(struct.pack(">H", o) for o in offsets)
+        records.append(_pad4(_indx_header(0xC0, idxt_start, len(chunk)) + body + idxt))
+        chunk.clear()
+
+    size = 0
+    for text, tag_values in entries:
+        control = 0
+        values = b""
+        for n, (tag, nvalues) in enumerate(tags):
+            if tag in tag_values:
+                assert len(tag_values[tag]) == nvalues
+                control |= 1 << n
+                values += b"".join(_vwi(v) for v in tag_values[tag])
+        entry = bytes([len(text)]) + text + bytes([control]) + values
+        if size + len(entry) + 2 * (len(chunk) + 1) > 0xF000:
+            flush()
+            size = 0
+        chunk.append(entry)
+        size += len(entry)
+    if chunk:
+        flush()
+
+    main = _indx_header(0xC0, 0, len(records), total=len(entries)) + tagx
+    return [_pad4(main)] + records
+
+
+class Ctoc:
+    """
+    CTOC string table shared by the entries of an index
+    """
+
+    def __init__(self):
+        self.records: list[bytearray] = [bytearray()]
+
+    def add(self, text: bytes) -> int:
+        entry = _vwi(len(text)) + text
+        if len(self.records[-1]) + len(entry) >= 0xFFF0:
+            self.records.append(bytearray())
+        offset = (len(self.records) - 1) * 0x10000 + len(self.records[-1])
+        self.records[-1] += entry
+        return offset
+
+    def finish(self, index_records: list[bytes]) -> list[bytes]:
+        main = bytearray(index_records[0])
+        struct.pack_into(">L", main, 4 + 12 * 4, len(self.records))
+        return [bytes(main)] + index_records[1:] + [_pad4(bytes(r)) for r in self.records]
+
+
+def _text_records(text: bytes, compression: int) -> tuple[list[bytes], list[bytes]]:
+    """
+    :return: text records & the HUFF/CDIC records of their dictionary if huffman coded
+    """
+    chunks = [text[start : start + RECORD_SIZE] for start in range(0, len(text), RECORD_SIZE)]
+    huff_records = []
+    if compression == PALMDOC_COMPRESSION:
+        chunks = [palmdoc_compress(chunk) for chunk in chunks]
+    elif compression == HUFFCDIC_COMPRESSION:
+        chunks, huff_records = huffcdic_compress(chunks)
+    # NOTE: a multibyte overlap byte (none overlapping) & a 1 byte trailing entry
+    return [chunk + b"\x00" + b"\x81" for chunk in chunks], huff_records
+
+
+def _exth(spec: BookSpec) -> bytes:
+    items = [(100, spec.creator.encode("utf-8")), (101, b"The Publisher"), (106, b"2020-01-02")]
+    items += [(103, b"A &amp; B description")]
+    if spec.cover is not None:
+        items.append((201, struct.pack(">L", spec.cover - 1)))
+    body = b"".join(struct.pack(">LL", id, 8 + len(data)) + data for id, data in items)
+    return _pad4(b"EXTH" + struct.pack(">LL", 12 + len(body), len(items)) + body)
+
+
+def _record0(
+    spec: BookSpec,
+    *,
+    version: int,
+    text_length: int,
+    text_records: int,
+    compression: int,
+    first_resource: int,
+    ncx_index: int,
+    skel_index: int = NULL_INDEX,
+    frag_index: int = NULL_INDEX,
+    fdst_index: int = NULL_INDEX,
+    fdst_count: int = 0,
+    huff_index: int = 0,
+    huff_count: int = 0,
+) -> bytes:
+    header_length = 0x108 if version == 8 else 0xE8
+    header = bytearray(16 + header_length)
+    struct.pack_into(">HHLHHHH", header, 0, compression, 0, text_length, text_records, RECORD_SIZE, 0, 0)
+    header[16:20] = b"MOBI"
+    struct.pack_into(">LLLLL", header, 20, header_length, 2, 65001, 0x1234, version)
+    for offset in range(0x28, 0x50, 4):
+        struct.pack_into(">L", header, offset, NULL_INDEX)
+    exth_data = _exth(spec)
+    title = spec.title.encode("utf-8")
+    struct.pack_into(">LLLL", header, 0x50, first_resource, len(header) + len(exth_data), len(title), 0x09)
+    struct.pack_into(">LLLL", header, 0x68, version, first_resource, huff_index, huff_count)
+    struct.pack_into(">L", header, 0x80, 0x40)
+    struct.pack_into(">LLLL", header, 0xA4, NULL_INDEX, 0, 0, 0)
+    struct.pack_into(">LL", header, 0xC0, fdst_index, fdst_count)
+    struct.pack_into(">LL", header, 0xE8, NULL_INDEX, NULL_INDEX)
+    struct.pack_into(">HH", header, 0xF0, 0, 3)
+    struct.pack_into(">L", header, 0xF4, ncx_index)
+    if version == 8:
+        struct.pack_into(">LLLL", header, 0xF8, frag_index, skel_index, NULL_INDEX, NULL_INDEX)
+    return _pad4(bytes(header) + exth_data + title + b"\x00\x00")
+
+
+def _palm_database(name: str, records: list[bytes]) -> bytes:
+    header = bytearray(78)
+    header[0:32] = name.encode("latin-1")[:31].ljust(32, b"\x00")
+    header[0x3C:0x44] = b"BOOKMOBI"
+    struct.pack_into(">H", header, 76, len(records))
+    offset = 78 + 8 * len(records) + 2
+    table = bytearray()
+    for n, record in enumerate(records):
+        table += struct.pack(">LL", offset, 2 * n)
+        offset += len(record)
+    return bytes(header) + bytes(table) + b"\x00\x00" + b"".join(records)
+
+
+def _link_placeholders(text: bytes, make_placeholder, targets: list[bytes]) -> bytes:
+    """
+    Replace `<a href="#ID">` links with fixed size placeholders (of the index of
+    ID in `targets`), so the positions don't change once the links get resolved
+    """
+
+    def replace(m: re.Match) -> bytes:
+        targets.append(m.group(1))
+        return make_placeholder(len(targets) - 1)
+
+    return re.sub(rb'<a href="#([^"]+)">', replace, text)
+
+
+def _ncx_index(entries: list[tuple[int, str, dict[int, list[int]]]], ctoc: Ctoc) -> list[tuple[bytes, dict]]:
+    """
+    :param entries: (heading level, label, tag values) in document order
+    :return: index entries, top level entries first followed by the children of each
+    """
+    parents = [n for n, (level, _, _) in enumerate(entries) if level == 0]
+    children: dict[int, list[int]] = {p: [] for p in parents}
+    for n, (level, _, _) in enumerate(entries):
+        if level == 1:
+            children[max(p for p in parents if p < n)].append(n)
+    order = parents + [c for p in parents for c in children[p]]
+    position = {n: i for i, n in enumerate(order)}
+
+    index_entries = []
+    for n in order:
+        level, label, values = entries[n]
+        tag_values = dict(values)
+        tag_values[3] = [ctoc.add(label.encode("utf-8"))]
+        tag_values[4] = [level]
+        if level == 0 and children[n]:
+            tag_values[22] = [position[children[n][0]]]
+            tag_values[23] = [position[children[n][-1]]]
+        elif level == 1:
+            tag_values[21] = [position[max(p for p in parents if p < n)]]
+        index_entries.append((b"%03d" % position[n], tag_values))
+    return index_entries
+
+
+# --- mobi7 ---
+
+
+def _mobi7_text(spec: BookSpec) -> tuple[bytes, list[tuple[int, str, int]]]:
+    """
+    :return: raw markup & the (heading level, label, filepos) of the headings
+    """
+    pieces = []
+    for chapter in spec.chapters:
+        pieces.append(
+            re.sub(r'<img src="image:(\d+)"/>', lambda m: f'<img recindex="{int(m.group(1)):05d}"/>', chapter.body)
+        )
+    text = ("<html><head><guide></guide></head><body>" + "<mbp:pagebreak/>".join(pieces) + "</body></html>").encode()
+
+    targets: list[bytes] = []
+    text = _link_placeholders(text, lambda n: b"<a filepos=@%09d>" % n, targets)
+    ids = {m.group(1): m.start() for m in re.finditer(rb'<h[23] id="([^"]+)">', text)}
+    text = re.sub(rb"filepos=@(\d{9})", lambda m: b"filepos=%010d" % ids[targets[int(m.group(1))]], text)
+
+    headings = [
+        (int(m.group(1)) - 2, m.group(2).decode(), m.start())
+        for m in re.finditer(rb'<h([23]) id="[^"]+">(.*?)</h[23]>', text)
+    ]
+    return text, headings
+
+
+def _mobi7_records(spec: BookSpec, compression: int) -> list[bytes]:
+    text, headings = _mobi7_text(spec)
+    texts, huff = _text_records(text, compression)
+    ctoc = Ctoc()
+    entries = _ncx_index([(level, label, {1: [pos], 2: [0]}) for level, label, pos in headings], ctoc)
+    ncx = ctoc.finish(build_index(entries, [(1, 1), (2, 1), (3, 1), (4, 1), (21, 1), (22, 1), (23, 1)]))
+    ncx_index = 1 + len(texts) + len(huff)
+    record0 = _record0(
+        spec,
+        version=6,
+        text_length=len(text),
+        text_records=len(texts),
+        compression=compression,
+        first_resource=ncx_index + len(ncx),
+        ncx_index=ncx_index,
+        huff_index=1 + len(texts),
+        huff_count=len(huff),
+    )
+    return [record0] + texts + huff + ncx + list(spec.images) + [b"FLIS" + b"\x00" * 32, b"FCIS" + b"\x00" * 40]
+
+
+def build_mobi7(spec: BookSpec, *, compression: int = PALMDOC_COMPRESSION) -> bytes:
+    return _palm_database(spec.title, _mobi7_records(spec, compression) + [EOF_RECORD])
+
+
+# --- kf8 ---
+
+
+def _kf8_text(spec: BookSpec) -> tuple[bytes, list, list, list]:
+    """
+    :return: main flow of the raw markup, skeleton table, fragment table & ncx entries
+    """
+    skeletons: list[tuple[bytes, int, int, int]] = []
+    # insert position, file number, text
+    fragments: list[tuple[int, int, bytes]] = []
+    headings: list[tuple[int, str, bytes]] = []
+    aids = iter(range(1, 1 << 30))
+    targets: list[bytes] = []
+    text = bytearray()
+
+    for n, chapter in enumerate(spec.chapters):
+        body = re.sub(
+            r'<img src="image:(\d+)"/>',
+            lambda m: f'<img src="kindle:embed:{toBase32(int(m.group(1))).decode()}?mime=image/png"/>',
+            chapter.body,
+        ).encode("utf-8")
+        body = _link_placeholders(body, lambda n: b'<a href="kindle:pos:fid:@%018d">' % n, targets)
+        body = re.sub(rb"<(p|h2|h3)\b", lambda m: b'<%s aid="%s"' % (m.group(1), toBase32(next(aids))), body)
+        headings += [
+            (int(m.group(1)) - 2, m.group(3).decode(), m.group(2))
+            for m in re.finditer(rb'<h([23]) [^>]*id="([^"]+)">(.*?)</h[23]>', body)
+        ]
+        # split the body into fragments at the block boundaries
+        chunks = [b""]
+        for block in re.findall(rb"<(?:p|h2|h3) .*?</(?:p|h2|h3)>", body):
+            if chunks[-1] and len(chunks[-1]) + len(block) > FRAGMENT_SIZE:
+                chunks.append(b"")
+            chunks[-1] += block
+
+        skeleton = (
+            b'<?xml version="1.0" encoding="utf-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml"><head><title>'
+            + chapter.title.encode("utf-8")
+            + b'</title><link href="kindle:flow:0001?mime=text/css" rel="stylesheet" type="text/css"/></head>'
+            + b'<body aid="0"></body></html>'
+        )
+        skeletons.append((b"SKEL%010d" % n, len(chunks), len(text), len(skeleton)))
+        insertpos = len(text) + skeleton.index(b"</body>")
+        text += skeleton
+        for chunk in chunks:
+            fragments.append((insertpos, n, chunk))
+            insertpos += len(chunk)
+            text += chunk
+
+    # link to kindle:pos:fid:XXXX:off:YYYYYYYYYY, XXXX being the fragment
+    # and YYYYYYYYYY the offset inside the fragment (both base32)
+    ids: dict[bytes, list[int]] = {}
+    fragptr = 0
+    for skelname, fragcnt, skelpos, skellen in skeletons:
+        fragpos = skelpos + skellen
+        for seq in range(fragptr, fragptr + fragcnt):
+            length = len(fragments[seq][2])
+            for m in re.finditer(rb'<h[23] [^>]*id="([^"]+)"', text[fragpos : fragpos + length]):
+                ids[m.group(1)] = [seq, m.start()]
+            fragpos += length
+        fragptr += fragcnt
+
+    def resolve(m: re.Match) -> bytes:
+        seq, off = ids[targets[int(m.group(1))]]
+        return b"kindle:pos:fid:" + toBase32(seq, 4) + b":off:" + toBase32(off, 10)
+
+    resolved = re.sub(rb"kindle:pos:fid:@(\d{18})", resolve, bytes(text))
+    ncx = [(level, label, {6: ids[id]}) for level, label, id in headings]
+    return resolved, skeletons, fragments, ncx
+
+
+def _kf8_records(spec: BookSpec, compression: int, *, with_images: bool) -> list[bytes]:
+    """
+    :return: kf8 records up to the resources, including the images if `with_images`
+    """
+    main, skeletons, fragments, ncx_entries = _kf8_text(spec)
+    text = main + spec.css.encode("utf-8")
+    texts, huff = _text_records(text, compression)
+
+    frag_ctoc = Ctoc()
+    frag = frag_ctoc.finish(
+        build_index(
+            [
+                (
+                    b"%010d" % insertpos,
+                    {
+                        2: [frag_ctoc.add(b"P-//*[@aid='%d']" % seq)],
+                        3: [filenum],
+                        4: [seq],
+                        6: [insertpos - skeletons[filenum][2], len(chunk)],
+                    },
+                )
+                for seq, (insertpos, filenum, chunk) in enumerate(fragments)
+            ],
+            [(2, 1), (3, 1), (4, 1), (6, 2)],
+        )
+    )
+    skel = build_index(
+        [(name, {1: [fragcnt], 6: [skelpos, skellen]}) for name, fragcnt, skelpos, skellen in skeletons],
+        [(1, 1), (6, 2)],
+    )
+    ncx_ctoc = Ctoc()
+    ncx = ncx_ctoc.finish(
+        build_index(_ncx_index(ncx_entries, ncx_ctoc), [(3, 1), (4, 1), (6, 2), (21, 1), (22, 1), (23, 1)])
+    )
+    fdst = b"FDST" + struct.pack(">LL", 12, 2) + struct.pack(">4L", 0, len(main), len(main), len(text))
+
+    frag_index = 1 + len(texts) + len(huff)
+    skel_index = frag_index + len(frag)
+    ncx_index = skel_index + len(skel)
+    fdst_index = ncx_index + len(ncx)
+    record0 = _record0(
+        spec,
+        version=8,
+        text_length=len(text),
+        text_records=len(texts),
+        compression=compression,
+        first_resource=fdst_index + 1,
+        ncx_index=ncx_index,
+        skel_index=skel_index,
+        frag_index=frag_index,
+        fdst_index=fdst_index,
+        fdst_count=2,
+        huff_index=1 + len(texts),
+        huff_count=len(huff),
+    )
+    images = list(spec.images) if with_images else []
+    return [record0] + texts + huff + frag + skel + ncx + [fdst] + images
+
+
+def build_kf8(spec: BookSpec, *, compression: int = PALMDOC_COMPRESSION) -> bytes:
+    records = _kf8_records(spec, compression, with_images=True)
+    return _palm_database(spec.title, records + [b"FLIS" + b"\x00" * 32, b"FCIS" + b"\x00" * 40, EOF_RECORD])
+
+
+def build_combo(spec: BookSpec, *, compression: int = PALMDOC_COMPRESSION) -> bytes:
+    """
+    Combination Mobi7/KF8 book as kindlegen makes them: the kf8 part comes
+    after a BOUNDARY record & refers to the images stored in the mobi7 part
+    """
+    kf8 = _kf8_records(spec, compression, with_images=False)
+    kf8 += [b"FLIS" + b"\x00" * 32, b"FCIS" + b"\x00" * 40, EOF_RECORD]
+    return _palm_database(spec.title, _mobi7_records(spec, compression) + [b"BOUNDARY"] + kf8)
+
+
+# --- legacy decoders, the reference the optimized ones are checked against ---
+
+
+def legacy_palmdoc_unpack(i: bytes) -> bytes:
+    """
+    `PalmdocReader.unpack()` of KindleUnpack 0.83, quadratic on immutable bytes
+    """
+    o, p = b"", 0
+    while p < len(i):
+        c = ord(i[p : p + 1])
+        p += 1
+        if c >= 1 and c <= 8:
+            o += i[p : p + c]
+            p += c
+        elif c < 128:
+            o += bytes([c])
+        elif c >= 192:
+            o += b" " + bytes([c ^ 128])
+        else:
+            if p < len(i):
+                c = (c << 8) | ord(i[p : p + 1])
+                p += 1
+                m = (c >> 3) & 0x07FF
+                n = (c & 7) + 3
+                if m > n:
+                    o += o[-m : n - m]
+                else:
+                    for _ in range(n):
+                        if m == 1:
+                            o += o[-m:]
+                        else:
+                            o += o[-m : -m + 1]
+    return o
+
+
+class LegacyHuffcdicReader(HuffcdicReader):
+    """
+    `HuffcdicReader.unpack()` of KindleUnpack 0.83, concatenating immutable bytes
+    & expanding the phrases in place of the dictionary entries
+    """
+
+    def unpack(self, data: bytes) -> bytes:
+        q = HuffcdicReader.q
+
+        bitsleft = len(data) * 8
+        data += b"\x00\x00\x00\x00\x00\x00\x00\x00"
+        pos = 0
+        (x,) = q(data, pos)
+        n = 32
+
+        s = b""
+        while True:
+            if n <= 0:
+                pos += 4
+                (x,) = q(data, pos)
+                n += 32
+            code = (x >> n) & ((1 << 32) - 1)
+
+            codelen, term, maxcode = self.dict1[code >> 24]
+            if not term:
+                while code < self.mincode[codelen]:
+                    codelen += 1
+                maxcode = self.maxcode[codelen]
+
+            n -= codelen
+            bitsleft -= codelen
+            if bitsleft < 0:
+                break
+
+            r = (maxcode - code) >> (32 - codelen)
+            slice, flag = self.dictionary[r]
+            if not flag:
+                self.dictionary[r] = None
+                slice = self.unpack(slice)
+                self.dictionary[r] = (slice, 1)
+            s += slice
+        return s
+
+
+def legacy_assemble_parts(text: bytes, skeltbl: list, fragtbl: list) -> tuple[list[bytes], list[list]]:
+    """
+    Skeleton & fragment loop of `K8Processor.buildParts()` of KindleUnpack 0.83,
+    copying the whole part for every fragment inserted
+    """
+    parts, partinfo = [], []
+    fragptr = 0
+    filename = "part0000.xhtml"
+    for skelnum, skelname, fragcnt, skelpos, skellen in skeltbl:
+        baseptr = skelpos + skellen
+        skeleton = text[skelpos:baseptr]
+        aidtext = "0"
+        for i in range(fragcnt):
+            insertpos, idtext, filenum, seqnum, startpos, length = fragtbl[fragptr]
+            aidtext = idtext[12:-2]
+            if i == 0:
+                filename = "part%04d.xhtml" % filenum
+            slice = text[baseptr : baseptr + length]
+            insertpos = insertpos - skelpos
+            head = skeleton[:insertpos]
+            tail = skeleton[insertpos:]
+            actual_inspos = insertpos
+            if tail.find(b">") < tail.find(b"<") or head.rfind(b">") < head.rfind(b"<"):
+                bp, ep = locate_beg_end_of_tag(skeleton, aidtext)
+                if bp != ep:
+                    actual_inspos = ep + 1 + startpos
+            if insertpos != actual_inspos:
+                insertpos = actual_inspos
+                fragtbl[fragptr][0] = actual_inspos + skelpos
+            skeleton = skeleton[0:insertpos] + slice + skeleton[insertpos:]
+            baseptr = baseptr + length
+            fragptr += 1
+        parts.append(skeleton)
+        partinfo.append([skelnum, "Text", filename, skelpos, baseptr, aidtext])
+    return parts, partinfo
+
+
+class LegacyK8Processor(K8Processor):
+    """
+    Position lookups of `K8Processor` of KindleUnpack 0.83, scanning the tables
+    & searching backwards from a copy of the part before the position
+    """
+
+    def getFragTblInfo(self, pos):
+        for j in range(len(self.fragtbl)):
+            insertpos, idtext, filenum, seqnum, startpos, length = self.fragtbl[j]
+            if pos >= insertpos and pos < (insertpos + length):
+                return seqnum, b"in: " + idtext
+            if pos < insertpos:
+                return seqnum, b"before: " + idtext
+        return None, None
+
+    def getFileInfo(self, pos):
+        for partnum, pdir, filename, start, end, aidtext in self.partinfo:
+            if pos >= start and pos < end:
+                return filename, partnum, start, end
+        return None, None, None, None
+
+    def getIDTag(self, pos):
+        fname, pn, skelpos, skelend = self.getFileInfo(pos)
+        textblock = self.parts[pn]
+        npos = pos - skelpos
+        pgt = textblock.find(b">", npos)
+        plt = textblock.find(b"<", npos)
+        if plt == npos or pgt < plt:
+            npos = pgt + 1
+        textblock = textblock[0:npos]
+        id_pattern = re.compile(rb"""<[^>]*\sid\s*=\s*['"]([^'"]*)['"]""", re.IGNORECASE)
+        name_pattern = re.compile(rb"""<[^>]*\sname\s*=\s*['"]([^'"]*)['"]""", re.IGNORECASE)
+        aid_pattern = re.compile(rb"""<[^>]+\s(?:aid|AID)\s*=\s*['"]([^'"]+)['"]""")
+        for tag in reverse_tag_iter(textblock):
+            if tag[0:6] == b"<body ":
+                return b""
+            if tag[0:6] != b"<meta ":
+                m = id_pattern.match(tag) or name_pattern.match(tag)
+                if m is not None:
+                    return m.group(1)
+                m = aid_pattern.match(tag)
+                if m is not None:
+                    self.linked_aids.add(m.group(1))
+                    return b"aid-" + m.group(1)
+        return b""
@@ -0,0 +1,60 @@
+import io
+
+import pytest
+from climage import climage
+from PIL import Image
+from rich.console import Console
+from rich.segment import Segment
+from rich.text import Text
+
+from baca.components import contents
+from baca.components.contents import image_to_ansi_text
+
+
+def make_image(width: int, height: int) -> Image.Image:
+    img = Image.new("RGB", (width, height), (255, 255, 255))
+    for x in range(width):
+        for y in range(height):
+            if (x // 7 + y // 5) % 3 == 0:
+                img.putpixel((x, y), ((x * 13) % 256, (y * 29) % 256, (x * y) % 256))
+    return img
+
+
+def render(text: Text) -> list:
+    console = Console(width=200, color_system="truecolor")
+    # NOTE: compare the cells, regardless of how they're split into segments
+    return list(Segment.simplify(console.render(text, console.options.update(no_wrap=True))))
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+@pytest.mark.parametrize("size,width", [((120, 90), 40), ((33, 100), 20), ((64, 3), 64)])
+def test_image_to_ansi_text_matches_climage(monkeypatch, use_numpy, size, width):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(contents, "np", None)
+
+    img = make_image(*size)
+    img_ansi = climage._toAnsi(
+        img, oWidth=width, is_unicode=True, color_type=climage.color_types.truecolor, palette="default"
+    )
+    assert render(image_to_ansi_text(img, width)) == render(Text.from_ansi(img_ansi))
+
+
+def test_image_errors(monkeypatch):
+    class FakeEbook:
+        def get_img_bytestr(self, src: str) -> tuple[str, bytes]:
+            buffer = io.BytesIO()
+            make_image(100, 100).save(buffer, format="PNG")
+            return src, buffer.getvalue()
+
+    # NOTE: too wide to be resized to any line
+    with pytest.raises(contents.IMAGE_ERRORS):
+        image_to_ansi_text(make_image(400, 2), 40)
+
+    ebook = FakeEbook()
+    assert contents.get_image_size(ebook, "image.png") == (100, 100)
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 100)
+    with pytest.raises(contents.IMAGE_ERRORS):
+        contents.render_ansi_image(ebook, "bomb.png", 40)
+    assert contents.get_image_size(ebook, "bomb.png") is None
@@ -0,0 +1,115 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from baca.ebooks import CachedEbook, Ebook
+from baca.models import BookMetadata, ParsedBook, Segment, SegmentType, TocEntry
+from baca.utils import book_cache
+from baca.utils.book_cache import (
+    CACHE_FILE_SUFFIX,
+    load_parsed_book,
+    purge_parsed_books,
+    save_parsed_book,
+)
+
+PARSED_BOOK = ParsedBook(
+    segments=(
+        Segment(type=SegmentType.BODY, content="# Chapter 1", nav_point="ch1.html"),
+        Segment(type=SegmentType.IMAGE, content="images/cover.png", nav_point=None),
+        Segment(type=SegmentType.BODY, content="Once upon a time", nav_point="ch1.html#s1"),
+    ),
+    toc=(TocEntry(label="Chapter 1", value="ch1.html"), TocEntry(label="Section 1", value="ch1.html#s1")),
+    metadata=BookMetadata(title="Title", creator="Author"),
+)
+
+
+def test_parsed_book_cache_roundtrip(tmp_path):
+    ebook_path = tmp_path / "book.epub"
+    ebook_path.write_bytes(b"ebook")
+    cachedir = tmp_path / "cache"
+    cachedir.mkdir()
+
+    assert load_parsed_book(ebook_path, cachedir=cachedir) is None
+    save_parsed_book(ebook_path, PARSED_BOOK, 1024**2, cachedir=cachedir)
+    assert load_parsed_book(ebook_path, cachedir=cachedir) == PARSED_BOOK
+
+    # modified ebook file invalidates the cache
+    ebook_path.write_bytes(b"modified ebook")
+    assert load_parsed_book(ebook_path, cachedir=cachedir) is None
+
+    purge_parsed_books(cachedir=cachedir)
+    assert not cachedir.exists()
+
+
+def test_parsed_book_cache_lru_eviction(tmp_path):
+    cachedir = tmp_path / "cache"
+    cachedir.mkdir()
+    ebook_paths = []
+    for n in range(3):
+        ebook_path = tmp_path / f"book{n}.epub"
+        ebook_path.write_bytes(b"ebook")
+        ebook_paths.append(ebook_path)
+
+    save_parsed_book(ebook_paths[0], PARSED_BOOK, 1024**2, cachedir=cachedir)
+    entry_size = next(cachedir.glob(f"*{CACHE_FILE_SUFFIX}")).stat().st_size
+    save_parsed_book(ebook_paths[1], PARSED_BOOK, 1024**2, cachedir=cachedir)
+    for n, cachefile in enumerate(cachedir.glob(f"*{CACHE_FILE_SUFFIX}")):
+        os.utime(cachefile, (n, n))
+
+    # book0 becomes the most recently used
+    assert load_parsed_book(ebook_paths[0], cachedir=cachedir) is not None
+    save_parsed_book(ebook_paths[2], PARSED_BOOK, entry_size * 2, cachedir=cachedir)
+
+    assert load_parsed_book(ebook_paths[0], cachedir=cachedir) is not None
+    assert load_parsed_book(ebook_paths[1], cachedir=cachedir) is None
+    assert load_parsed_book(ebook_paths[2], cachedir=cachedir) is not None
+
+
+def test_cached_ebook_not_opened_on_cache_hit(tmp_path, monkeypatch):
+    cachedir = tmp_path / "cache"
+    cachedir.mkdir()
+    monkeypatch.setattr(book_cache, "retrieve_user_parsed_cachedir", lambda: cachedir)
+    ebook_path = tmp_path / "book.epub"
+    ebook_path.write_bytes(b"ebook")
+    save_parsed_book(ebook_path, PARSED_BOOK, 1024**2)
+
+    class UnopenableEbook(Ebook):
+        def __init__(self, ebook_path: Path, *, max_workers: int | None = 1):
+            raise AssertionError("ebook opened on a cache hit")
+
+    ebook = CachedEbook(ebook_path, UnopenableEbook, max_cache_size=1024**2)
+    assert tuple(ebook.iter_parsed_contents()) == PARSED_BOOK.segments
+    assert ebook.get_toc() == PARSED_BOOK.toc
+    assert ebook.get_meta() == PARSED_BOOK.metadata
+    ebook.cleanup()
+
+
+def test_cached_ebook_opened_once_for_images(tmp_path, monkeypatch):
+    cachedir = tmp_path / "cache"
+    cachedir.mkdir()
+    monkeypatch.setattr(book_cache, "retrieve_user_parsed_cachedir", lambda: cachedir)
+    ebook_path = tmp_path / "book.epub"
+    ebook_path.write_bytes(b"ebook")
+    save_parsed_book(ebook_path, PARSED_BOOK, 1024**2)
+
+    opened = []
+
+    class FakeEbook(Ebook):
+        def __init__(self, ebook_path: Path, *, max_workers: int | None = 1):
+            assert max_workers == 2
+            # NOTE: slow to open, so the threads needing images wait for the same one
+            time.sleep(0.05)
+            opened.append(ebook_path)
+
+        def get_img_bytestr(self, image_id: str) -> tuple[str, bytes]:
+            return image_id, b"image"
+
+    ebook = CachedEbook(ebook_path, FakeEbook, max_cache_size=1024**2, max_workers=2)
+    assert tuple(ebook.iter_parsed_contents()) == PARSED_BOOK.segments
+    assert opened == []
+
+    # NOTE: images get read from the UI thread & the image rendering ones
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert set(executor.map(ebook.get_img_bytestr, ["images/cover.png"] * 8)) == {("images/cover.png", b"image")}
+    assert opened == [ebook_path.resolve()]
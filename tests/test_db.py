@@ -0,0 +1,43 @@
+import pytest
+
+from baca.db import migrate
+from baca.models import DbMetadata, ReadingHistory, db
+
+
+@pytest.fixture
+def tmp_db(tmp_path):
+    database = db.database
+    db.init(str(tmp_path / "baca.db"))
+    try:
+        yield db
+    finally:
+        db.init(database)
+
+
+def test_migrate_reading_position(tmp_db):
+    # database created before the reading position got saved
+    tmp_db.execute_sql("CREATE TABLE metadata (version INTEGER NOT NULL PRIMARY KEY, migrated_at DATETIME NOT NULL)")
+    tmp_db.execute_sql(
+        "CREATE TABLE reading_history (filepath VARCHAR(255) NOT NULL PRIMARY KEY, title VARCHAR(255), "
+        "author VARCHAR(255), reading_progress REAL NOT NULL, last_read DATETIME NOT NULL)"
+    )
+    tmp_db.execute_sql("INSERT INTO metadata VALUES (0, '2023-01-01 00:00:00')")
+    tmp_db.execute_sql("INSERT INTO reading_history VALUES ('book.epub', NULL, NULL, 0.5, '2023-01-01 00:00:00')")
+    tmp_db.close()
+
+    migrate()
+
+    rh = ReadingHistory.get_by_id("book.epub")
+    assert (rh.reading_progress, rh.segment_index, rh.segment_offset) == (0.5, None, None)
+    rh.segment_index, rh.segment_offset = 3, 42
+    rh.save()
+    assert ReadingHistory.get_by_id("book.epub").segment_index == 3
+    assert [m.version for m in DbMetadata.select().order_by(DbMetadata.version)] == [0, 1]
+
+
+def test_migrate_fresh_db(tmp_db):
+    migrate()
+    migrate()
+
+    ReadingHistory.create(filepath="book.epub", reading_progress=0.0, segment_index=1, segment_offset=0.5)
+    assert ReadingHistory.get_by_id("book.epub").segment_offset == 0.5
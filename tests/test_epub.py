@@ -0,0 +1,80 @@
+import xml.etree.ElementTree as ET
+import zipfile
+from io import StringIO
+
+from baca.ebooks import Epub
+
+CONTENT_OPF = """<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:title>The Title</dc:title>
+    <dc:creator>The Author</dc:creator>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav scripted"/>
+    <item id="ch2" href="text/ch%202.xhtml" media-type="application/xhtml+xml"/>
+    <item id="cover" href="images/cover.png" media-type="image/png" properties="cover-image"/>
+    <item id="ch1" href="text/ch1.xhtml" media-type="application/xhtml+xml"/>
+  </manifest>
+  <spine>
+    <itemref idref="ch1"/>
+    <itemref idref="missing"/>
+    <itemref idref="ch2"/>
+    <itemref idref="ch1"/>
+    <itemref idref="nav"/>
+  </spine>
+</package>
+"""
+
+
+def test_parse_content_opf():
+    package = Epub._parse_package(ET.parse(StringIO(CONTENT_OPF)))
+    assert package.version == "3.0"
+    assert package.toc_href == "nav.xhtml"
+    assert package.metadata.title == "The Title"
+    assert package.metadata.creator == "The Author"
+    assert package.manifest["cover"].media_type == "image/png"
+    assert package.manifest["cover"].properties == "cover-image"
+
+    assert Epub._parse_content_opf(package, "OEBPS/") == ("OEBPS/text/ch1.xhtml", "OEBPS/text/ch 2.xhtml")
+
+
+def test_iter_parsed_contents_in_parallel(tmp_path):
+    ebook_path = tmp_path / "book.epub"
+    with zipfile.ZipFile(ebook_path, "w", zipfile.ZIP_DEFLATED) as f:
+        f.writestr("mimetype", "application/epub+zip")
+        f.writestr(
+            "META-INF/container.xml",
+            '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf"/></rootfiles></container>',
+        )
+        f.writestr("OEBPS/content.opf", CONTENT_OPF)
+        f.writestr(
+            "OEBPS/nav.xhtml",
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">'
+            '<body><nav epub:type="toc"><ol>'
+            '<li><a href="text/ch1.xhtml">One</a></li><li><a href="text/ch%202.xhtml#s1">Two</a></li>'
+            "</ol></nav></body></html>",
+        )
+        for n, name in enumerate(["ch1.xhtml", "ch 2.xhtml"], start=1):
+            f.writestr(
+                f"OEBPS/text/{name}",
+                f'<html><body><h1>Chapter {n}</h1><p>text</p><img src="../images/cover.png"/>'
+                f'<h2 id="s1">Section {n}</h2><p>more text</p></body></html>',
+            )
+
+    ebook = Epub(ebook_path)
+    try:
+        segments = list(ebook.iter_parsed_contents())
+        assert [s.nav_point for s in segments] == [
+            "OEBPS/text/ch1.xhtml",
+            None,
+            None,
+            "OEBPS/text/ch 2.xhtml",
+            None,
+            None,
+            "OEBPS/text/ch 2.xhtml#s1",
+        ]
+        assert list(ebook.iter_parsed_contents(max_workers=2)) == segments
+    finally:
+        ebook.cleanup()
@@ -1,4 +1,8 @@
-from baca.utils.html_parser import split_html_to_segments
+from baca.utils.html_parser import (
+    MarkdownConverter,
+    parse_html_to_segmented_md,
+    split_html_to_segments,
+)
 from baca.models import SegmentType
 
 HTML_TEST = """
@@ -53,3 +57,39 @@ def test_html_splitters():
         == '<img alt="Girl in a jacket" height="600" src="img_girl.jpg" width="500"/> <p class="story">...</p> </body>'
     )
     assert segment.nav_point is None
+
+
+def test_html_splitters_image_section():
+    segments = list(
+        split_html_to_segments(
+            '<html><body><p id="a">x &amp; y</p><img id="i" src="im.png"/><p>z</p></body></html>', "test.html"
+        )
+    )
+    assert [s.type for s in segments] == [SegmentType.BODY, SegmentType.BODY, SegmentType.IMAGE, SegmentType.BODY]
+    assert segments[1].content == '<p id="a">x &amp; y</p>'
+    assert segments[1].nav_point == "test.html#a"
+    assert segments[2].content == "im.png"
+    assert segments[2].nav_point == "test.html#i"
+    assert segments[3].content == '<img id="i" src="im.png"/><p>z</p></body>'
+
+
+def test_html_splitters_without_body():
+    segments = list(split_html_to_segments('<p>no body</p><img src="a.png">', "test.html"))
+    assert segments[0].content == "<p>no body</p>"
+    assert segments[1].type == SegmentType.IMAGE
+    assert segments[1].content == "a.png"
+    assert segments[2].content == '<img src="a.png"/>'
+
+
+def test_parse_html_to_segmented_md():
+    html_src = HTML_TEST + '<pre>  <span id="code">code</span>\n  block</pre><!-- comment --><ul><li>item</li></ul>'
+    segments = list(parse_html_to_segmented_md(html_src, "test.html"))
+
+    # same result as converting each serialized segment on its own
+    expected = [
+        MarkdownConverter().convert(segment.content) if segment.type == SegmentType.BODY else segment.content
+        for segment in split_html_to_segments(html_src, "test.html")
+    ]
+    assert [segment.content for segment in segments] == expected
+    expected_types = [SegmentType.BODY] * 3 + [SegmentType.IMAGE] + [SegmentType.BODY] * 2
+    assert [segment.type for segment in segments] == expected_types
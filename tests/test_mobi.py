@@ -0,0 +1,176 @@
+import contextlib
+from pathlib import Path
+
+import pytest
+from kindle_books import build_combo, build_kf8, build_mobi7, make_book_spec
+
+from baca.ebooks import Azw, Mobi
+from baca.models import SegmentType
+from baca.tools import unpack_kindle_book
+from baca.tools.KindleUnpack.mobi_header import MobiHeader
+from baca.tools.KindleUnpack.mobi_sectioner import Sectionizer
+from baca.utils.kindle_book import KindleBook
+
+
+@pytest.fixture
+def spec():
+    return make_book_spec()
+
+
+def open_book(cls, path: Path, book: bytes):
+    path.write_bytes(book)
+    ebook = cls(path)
+    yield ebook
+    ebook.cleanup()
+
+
+@pytest.fixture(params=[build_kf8, build_combo])
+def kf8_book(request, tmp_path, spec):
+    yield from open_book(Azw, tmp_path / "book.azw3", request.param(spec))
+
+
+@pytest.fixture
+def mobi7_book(tmp_path, spec):
+    yield from open_book(Mobi, tmp_path / "book.mobi", build_mobi7(spec))
+
+
+def test_kf8_unpacked_in_memory(kf8_book, spec):
+    assert kf8_book._get_contents() == (
+        "Text/cover_page.xhtml",
+        "Text/part0000.xhtml",
+        "Text/part0001.xhtml",
+        "Text/part0002.xhtml",
+    )
+    assert [(entry.label, entry.value) for entry in kf8_book.get_toc()] == [
+        ("Chapter 1", "Text/part0000.xhtml#ch1"),
+        ("Section 1.1", "Text/part0000.xhtml#ch1s1"),
+        ("Chapter 2", "Text/part0001.xhtml#ch2"),
+        ("Section 2.1", "Text/part0001.xhtml#ch2s1"),
+        ("Chapter 3", "Text/part0002.xhtml#ch3"),
+        ("Section 3.1", "Text/part0002.xhtml#ch3s1"),
+    ]
+    assert 'href="part0001.xhtml#ch2"' in kf8_book.get_raw_text("Text/part0000.xhtml")
+    # nothing gets unpacked to the disk
+    assert list(kf8_book.get_tempdir().iterdir()) == []
+
+    segments = list(kf8_book.iter_parsed_contents())
+    assert [segment.nav_point for segment in segments if segment.nav_point is not None] == [
+        "Text/cover_page.xhtml",
+        "Text/part0000.xhtml",
+        "Text/part0000.xhtml#ch1",
+        "Text/part0000.xhtml#ch1s1",
+        "Text/part0001.xhtml",
+        "Text/part0001.xhtml#ch2",
+        "Text/part0001.xhtml#ch2s1",
+        "Text/part0002.xhtml",
+        "Text/part0002.xhtml#ch3",
+        "Text/part0002.xhtml#ch3s1",
+    ]
+    images = [segment.content for segment in segments if segment.type == SegmentType.IMAGE]
+    assert [kf8_book.get_img_bytestr(image)[1] for image in images] == [spec.images[2], spec.images[1], spec.images[2]]
+    # svg image of the cover page
+    assert 'xlink:href="../Images/cover' in kf8_book.get_raw_text("Text/cover_page.xhtml")
+    cover_image = next(content for content in kf8_book._book.files if content.startswith("Images/cover"))
+    assert kf8_book.get_img_bytestr("Text/../" + cover_image) == (cover_image[len("Images/") :], spec.images[0])
+
+
+def test_mobi7_unpacked_in_memory(mobi7_book, spec):
+    assert mobi7_book._get_contents() == ("book.html",)
+    toc = mobi7_book.get_toc()
+    assert [entry.label for entry in toc] == [
+        "Chapter 1",
+        "Section 1.1",
+        "Chapter 2",
+        "Section 2.1",
+        "Chapter 3",
+        "Section 3.1",
+    ]
+    assert all(entry.value.startswith("book.html#filepos") for entry in toc)
+    assert list(mobi7_book.get_tempdir().iterdir()) == []
+
+    segments = list(mobi7_book.iter_parsed_contents())
+    assert [segment.nav_point for segment in segments if segment.nav_point is not None] == [
+        "book.html",
+        *(entry.value for entry in toc),
+    ]
+    images = [segment.content for segment in segments if segment.type == SegmentType.IMAGE]
+    assert [mobi7_book.get_img_bytestr(image)[1] for image in images] == [
+        spec.images[2],
+        spec.images[1],
+        spec.images[2],
+    ]
+
+
+def test_kf8_parts_built_once_read(kf8_book):
+    book = kf8_book._book
+    # NOTE: the first part is built to check if it shows the cover
+    assert "Text/part0002.xhtml" not in book.files
+    raw_text = kf8_book.get_raw_text("Text/part0002.xhtml")
+    assert book.files["Text/part0002.xhtml"] == raw_text.encode("utf-8")
+    assert "kindle:" not in raw_text and " aid=" not in raw_text
+    with pytest.raises(KeyError):
+        book.read("Text/part0003.xhtml")
+
+
+def test_kindle_book_meta(mobi7_book, kf8_book):
+    for ebook in (mobi7_book, kf8_book):
+        meta = ebook.get_meta()
+        assert meta.title == "The Title"
+        assert meta.creator == "The Author"
+        assert meta.description == "A & B description"
+        assert meta.language == "en"
+        assert meta.identifier == "4660"
+
+
+def test_kindle_book_parsed_in_parallel(kf8_book):
+    assert list(kf8_book.iter_parsed_contents(max_workers=2)) == list(kf8_book.iter_parsed_contents())
+
+
+@pytest.mark.parametrize("max_workers", [1, 2, None])
+def test_kindle_book_decompressed_with_max_workers(tmp_path, spec, monkeypatch, max_workers):
+    path = tmp_path / "book.azw3"
+    path.write_bytes(build_kf8(spec))
+    get_raw_ml = MobiHeader.getRawML
+    used_workers = []
+
+    def record_workers(self, max_workers=1):
+        used_workers.append(max_workers)
+        return get_raw_ml(self, max_workers)
+
+    monkeypatch.setattr(MobiHeader, "getRawML", record_workers)
+    with contextlib.redirect_stdout(None):
+        Azw(path).cleanup()
+        Azw(path, max_workers=max_workers).cleanup()
+    assert used_workers == [1, max_workers]
+
+
+def test_mapped_sectionizer(tmp_path, spec):
+    path = tmp_path / "book.azw3"
+    path.write_bytes(build_kf8(spec))
+
+    sectionizer = Sectionizer(str(path))
+    with Sectionizer(str(path), use_mmap=True) as mapped_sectionizer:
+        assert mapped_sectionizer.ident == sectionizer.ident == b"BOOKMOBI"
+        for i in range(sectionizer.num_sections):
+            assert mapped_sectionizer.loadSection(i) == sectionizer.loadSection(i)
+            assert mapped_sectionizer.loadSectionView(i) == sectionizer.loadSection(i)
+    assert mapped_sectionizer.loadSection(0) == b""
+
+
+@pytest.mark.parametrize("skip_epub_zip", [False, True])
+def test_kf8_unpacked_tree(tmp_path, spec, skip_epub_zip):
+    path = tmp_path / "book.azw3"
+    path.write_bytes(build_kf8(spec))
+    unpack_kindle_book(str(path), str(tmp_path / "unpacked"), epubver="A", doskipepubzip=skip_epub_zip)
+    # the flag only applies to its own call
+    unpack_kindle_book(str(path), str(tmp_path / "zipped"), epubver="A")
+    assert (tmp_path / "zipped" / "mobi8" / "book.epub").exists()
+
+    mobi8_dir = tmp_path / "unpacked" / "mobi8"
+    assert (mobi8_dir / "book.epub").exists() is not skip_epub_zip
+    assert (mobi8_dir / "mimetype").read_bytes() == b"application/epub+zip"
+    assert (mobi8_dir / "META-INF" / "container.xml").exists()
+    assert (mobi8_dir / "OEBPS" / "content.opf").exists()
+    with contextlib.closing(KindleBook(str(path))) as book:
+        for content in book.spine:
+            assert (mobi8_dir / "OEBPS" / content).read_bytes() == book.read(content)
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+from kindle_books import build_mobi7, make_book_spec
+
+from baca.tools.KindleUnpack.mobi_header import MobiHeader
+from baca.tools.KindleUnpack.mobi_html import HTMLProcessor
+from baca.tools.KindleUnpack.mobi_ncx import ncxExtract
+from baca.tools.KindleUnpack.mobi_sectioner import Sectionizer
+
+RSCNAMES = ["image00001.png", None, "image00003.gif"]
+
+MARKUP_TOKENS = [
+    b"<a>",
+    b"<a/>",
+    b"<a />",
+    b"</a>",
+    b" ",
+    b"\n",
+    b"<a filepos=12>",
+    b"<A FILEPOS='0034' class=x>",
+    b'<a href="#x" filepos="5"/>',
+    b"<img recindex=1>",
+    b'<IMG recindex="3" src=x>',
+    b"<img recindex=00002/>",
+    b"<",
+    b">",
+    b"x",
+    b"<a",
+    b"/>",
+    b"filepos=5",
+    b"<p>",
+    b"<i",
+    b"mg ",
+]
+
+
+def insert_hrefs(srctext: bytes, metadata: dict, in_passes: bool = False) -> bytes:
+    html_processor = HTMLProcessor(None, metadata, RSCNAMES)
+    html_processor.findAnchors(srctext, [], {})
+    srctext, _ = html_processor.insertHREFSInPasses() if in_passes else html_processor.insertHREFS()
+    return srctext
+
+
+def test_insert_hrefs():
+    srctext = (
+        b"<html><head></head><body>"
+        b'<p><a filepos=0000000115>next</a> <a/> <a> <a /> </a><img align=left recindex="00003"></p>'
+        b"<mbp:pagebreak/><p>second</p></body></html>"
+    )
+    assert insert_hrefs(srctext, {"Codec": ["utf-8"]}) == (
+        b'<html><head><meta http-equiv="content-type" content="text/html; charset=utf-8" /></head><body>'
+        b'<p><a href="#filepos115">next</a>  <img align=left src="Images/image00003.gif"></p>'
+        b'<a id="filepos115" /><mbp:pagebreak/><p>second</p></body></html>'
+    )
+
+
+@pytest.mark.parametrize("seed", range(500))
+def test_insert_hrefs_as_in_passes(seed):
+    rnd = random.Random(seed)
+    srctext = b"<html><head>" + b"".join(rnd.choice(MARKUP_TOKENS) for _ in range(rnd.randint(0, 40)))
+    metadata = {"Codec": ["utf-8"]} if rnd.random() < 0.5 else {}
+    assert insert_hrefs(srctext, metadata) == insert_hrefs(srctext, metadata, in_passes=True)
+
+
+def test_insert_hrefs_of_book_in_single_pass(tmp_path, monkeypatch):
+    path = tmp_path / "book.mobi"
+    path.write_bytes(build_mobi7(make_book_spec(chapters=5, paragraphs=20)))
+
+    with Sectionizer(str(path)) as sect:
+        mh = MobiHeader(sect, 0)
+        raw_ml = mh.getRawML()
+        ncx_data = ncxExtract(mh, None).parseNCX()
+
+    def insert_hrefs(in_passes: bool) -> bytes:
+        html_processor = HTMLProcessor(None, mh.getMetaData(), RSCNAMES)
+        html_processor.findAnchors(raw_ml, ncx_data, {})
+        srctext, _ = html_processor.insertHREFSInPasses() if in_passes else html_processor.insertHREFS()
+        return srctext
+
+    in_passes = insert_hrefs(in_passes=True)
+    monkeypatch.setattr(HTMLProcessor, "insertHREFSInPasses", None)
+    srctext = insert_hrefs(in_passes=False)
+    assert srctext == in_passes
+    assert b'href="#filepos' in srctext and b'src="Images/' in srctext
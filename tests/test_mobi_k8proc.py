@@ -0,0 +1,194 @@
+import copy
+import random
+
+import pytest
+from kindle_books import (
+    LegacyK8Processor,
+    build_kf8,
+    legacy_assemble_parts,
+    make_book_spec,
+)
+
+from baca.tools.KindleUnpack import mobi_k8proc
+from baca.tools.KindleUnpack.mobi_header import MobiHeader
+from baca.tools.KindleUnpack.mobi_html import XHTMLK8Processor
+from baca.tools.KindleUnpack.mobi_k8proc import K8Processor, assemble_parts
+from baca.tools.KindleUnpack.mobi_sectioner import Sectionizer
+from baca.tools.KindleUnpack.mobi_utils import fromBase32, toBase32
+from baca.utils.kindle_book import KindleBook
+
+
+def random_tables(rnd: random.Random) -> tuple[bytes, list, list]:
+    """
+    :return: random text, skeleton & fragment tables, including insert positions
+        inside of tags, out of range & negative ones
+    """
+    text = b""
+    skeltbl, fragtbl = [], []
+    for skelnum in range(rnd.randint(1, 5)):
+        aid = str(skelnum)
+        skeleton = rnd.choice([b"", b"<p>", b"<a><b aid='%s'>x</b></a>" % aid.encode(), b"<div><", b"> <"])
+        skeleton += bytes(rnd.choice(b"<>ab ") for _ in range(rnd.randint(0, 20)))
+        fragcnt = rnd.randint(0, 6)
+        skelpos = len(text)
+        skeltbl.append([skelnum, b"SKEL%010d" % skelnum, fragcnt, skelpos, len(skeleton)])
+        text += skeleton
+        for seqnum in range(fragcnt):
+            fragment = bytes(rnd.choice(b"<>xy") for _ in range(rnd.randint(0, 10)))
+            insertpos = skelpos + rnd.randint(-3, len(skeleton) + 2 + seqnum * 3)
+            idtext = rnd.choice(["P-//*[@aid='%s']" % aid, b"P-//*[@aid='%s']" % aid.encode()])
+            fragtbl.append([insertpos, idtext, skelnum, seqnum, rnd.randint(0, 3), len(fragment)])
+            text += fragment
+    return text, skeltbl, fragtbl
+
+
+@pytest.mark.parametrize("seed", range(500))
+def test_assemble_parts_as_legacy(seed):
+    text, skeltbl, fragtbl = random_tables(random.Random(seed))
+    legacy_fragtbl = copy.deepcopy(fragtbl)
+    assert assemble_parts(text, skeltbl, fragtbl) == legacy_assemble_parts(text, skeltbl, legacy_fragtbl)
+    assert fragtbl == legacy_fragtbl
+
+
+def test_part_buffer():
+    part = mobi_k8proc.PartBuffer(b"<a></a>")
+    part.moveGap(3)
+    part.insert(b"one")
+    part.moveGap(-4)
+    part.insert(b"<")
+    part.moveGap(100)
+    part.insert(b"two")
+    value = part.getvalue()
+    assert value == b"<a>one<</a>two"
+    for pos in range(-len(value) - 1, len(value) + 2):
+        part.moveGap(pos)
+        head, tail = value[:pos], value[pos:]
+        assert part.headInTag() == (head.rfind(b">") < head.rfind(b"<"))
+        assert part.tailInTag() == (tail.find(b">") < tail.find(b"<"))
+        assert part.getvalue() == value
+
+
+@pytest.mark.parametrize("fragment_size", [64, 1024, 1 << 20])
+def test_build_parts_of_book(tmp_path, monkeypatch, fragment_size):
+    monkeypatch.setattr("kindle_books.FRAGMENT_SIZE", fragment_size)
+    path = tmp_path / "book.azw3"
+    path.write_bytes(build_kf8(make_book_spec(chapters=4, paragraphs=30)))
+
+    with Sectionizer(str(path)) as sect:
+        mh = MobiHeader(sect, 0)
+        raw_ml = mh.getRawML()
+        k8proc = K8Processor(mh, sect, None)
+        legacy_fragtbl = copy.deepcopy(k8proc.fragtbl)
+        k8proc.buildParts(raw_ml)
+
+    parts, partinfo = legacy_assemble_parts(raw_ml, k8proc.skeltbl, legacy_fragtbl)
+    assert len(k8proc.parts) == 4
+    assert k8proc.parts == parts
+    assert k8proc.partinfo == partinfo
+    assert k8proc.fragtbl == legacy_fragtbl
+
+
+def test_build_part_as_build_xhtml(tmp_path):
+    path = tmp_path / "book.azw3"
+    path.write_bytes(build_kf8(make_book_spec(chapters=4, paragraphs=30)))
+    book = KindleBook(str(path))
+    rscnames = book._rscnames
+    book.close()
+
+    def k8_processor(sect):
+        mh = MobiHeader(sect, 0)
+        k8proc = K8Processor(mh, sect, None)
+        k8proc.buildParts(mh.getRawML())
+        return k8proc
+
+    with Sectionizer(str(path)) as sect:
+        k8proc = k8_processor(sect)
+        used = XHTMLK8Processor(rscnames, k8proc).buildXHTML()
+
+        lazy_k8proc = k8_processor(sect)
+        xhtml_processor = XHTMLK8Processor(rscnames, lazy_k8proc)
+        xhtml_processor.prepare()
+        assert xhtml_processor.flows == k8proc.flows
+        # in any order
+        for i in reversed(range(k8proc.getNumberOfParts())):
+            assert xhtml_processor.buildPart(i) == k8proc.getPart(i)
+        assert xhtml_processor.used == used
+
+
+MARKUP_TOKENS = [b"<", b">", b"<p", b"<a ", b" id='a%d'", b' aid="%d"', b" name=n%d", b"<body ", b"<meta ", b"x", b" "]
+
+
+def k8_processor_of(cls, parts: list[bytes], partinfo: list, fragtbl: list) -> K8Processor:
+    k8proc = cls.__new__(cls)
+    k8proc.parts, k8proc.partinfo, k8proc.fragtbl = parts, partinfo, fragtbl
+    k8proc.linked_aids = set()
+    k8proc.fragindex = k8proc.partindex = None
+    k8proc.anchorindex = {}
+    return k8proc
+
+
+def assert_same_lookups(k8proc: K8Processor, legacy_k8proc: K8Processor, positions: range):
+    for pos in positions:
+        assert k8proc.getFragTblInfo(pos) == legacy_k8proc.getFragTblInfo(pos)
+        assert k8proc.getFileInfo(pos) == legacy_k8proc.getFileInfo(pos)
+        if legacy_k8proc.getFileInfo(pos)[0] is not None:
+            assert k8proc.getIDTag(pos) == legacy_k8proc.getIDTag(pos), pos
+    assert k8proc.linked_aids == legacy_k8proc.linked_aids
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_position_lookups_as_legacy(seed):
+    rnd = random.Random(seed)
+    parts, partinfo, fragtbl = [], [], []
+    pos = 0
+    for partnum in range(rnd.randint(1, 4)):
+        part = b"".join(rnd.choice(MARKUP_TOKENS).replace(b"%d", b"%d" % rnd.randint(0, 3)) for _ in range(60))
+        pos += rnd.randint(0, 3)
+        parts.append(part)
+        partinfo.append([partnum, "Text", "part%04d.xhtml" % partnum, pos, pos + len(part), b"0"])
+        pos += len(part)
+    # overlapping & unordered parts
+    if rnd.random() < 0.2:
+        rnd.shuffle(partinfo)
+        partinfo[0][3] = max(0, partinfo[0][3] - 10)
+    for seqnum in range(rnd.randint(0, 10)):
+        fragtbl.append([rnd.randint(0, pos), b"P-//*[@aid='0']", 0, seqnum, 0, rnd.randint(-2, 50)])
+    if rnd.random() < 0.7:
+        fragtbl.sort()
+
+    assert_same_lookups(
+        k8_processor_of(K8Processor, parts, partinfo, fragtbl),
+        k8_processor_of(LegacyK8Processor, parts, partinfo, fragtbl),
+        range(-1, pos + 2),
+    )
+
+
+def test_position_lookups_of_book(tmp_path):
+    path = tmp_path / "book.azw3"
+    path.write_bytes(build_kf8(make_book_spec(chapters=3, paragraphs=20)))
+
+    with Sectionizer(str(path)) as sect:
+        mh = MobiHeader(sect, 0)
+        raw_ml = mh.getRawML()
+        k8procs = []
+        for cls in (K8Processor, LegacyK8Processor):
+            k8proc = cls(mh, sect, None)
+            k8proc.buildParts(raw_ml)
+            k8procs.append(k8proc)
+
+    k8proc, legacy_k8proc = k8procs
+    assert_same_lookups(k8proc, legacy_k8proc, range(k8proc.partinfo[-1][4] + 1))
+    for seq in range(len(k8proc.fragtbl)):
+        for off in (b"0000000000", b"0000000010", b"00000000AA"):
+            posfid = toBase32(seq, 4)
+            assert k8proc.getIDTagByPosFid(posfid, off) == legacy_k8proc.getIDTagByPosFid(posfid, off)
+
+
+def test_from_base32():
+    for value in [0, 1, 31, 32, 1023, 123456789, 1 << 50]:
+        assert fromBase32(toBase32(value)) == value
+        assert fromBase32(toBase32(value, 10).decode()) == value
+    # anything else than the base32 digits is converted as by KindleUnpack 0.83
+    assert fromBase32(b"") == 0
+    assert fromBase32(b"a") == ord("a") - ord("A") + 10
+    assert fromBase32(b"1|") == 32 + ord("|") - ord("A") + 10
@@ -0,0 +1,102 @@
+import random
+
+import pytest
+from kindle_books import (
+    HUFFCDIC_COMPRESSION,
+    RECORD_SIZE,
+    LegacyHuffcdicReader,
+    build_kf8,
+    huffcdic_compress,
+    legacy_palmdoc_unpack,
+    make_book_spec,
+    palmdoc_compress,
+)
+
+from baca.tools.KindleUnpack import mobi_header as mobi_header_module
+from baca.tools.KindleUnpack.mobi_header import MobiHeader
+from baca.tools.KindleUnpack.mobi_sectioner import Sectionizer
+from baca.tools.KindleUnpack.mobi_uncompress import (
+    HuffcdicReader,
+    PalmdocReader,
+    unpackException,
+)
+
+
+def test_palmdoc_unpack_text_records(tmp_path):
+    path = tmp_path / "book.azw3"
+    path.write_bytes(build_kf8(make_book_spec(chapters=5, paragraphs=20)))
+    sectionizer = Sectionizer(str(path))
+    mobi_header = MobiHeader(sectionizer, 0)
+    assert mobi_header.compression == 2
+
+    for n in range(1, mobi_header.records + 1):
+        record = sectionizer.loadSection(n)
+        assert PalmdocReader().unpack(record) == legacy_palmdoc_unpack(record)
+        assert PalmdocReader().unpack(memoryview(record)) == legacy_palmdoc_unpack(record)
+
+
+def test_palmdoc_unpack_overlapping_references():
+    for text in [b"a" * 100, b"ab" * 50 + b"c", b"abc" * 40 + b"abcd" * 30, b"x y " * 64]:
+        record = palmdoc_compress(text)
+        assert PalmdocReader().unpack(record) == legacy_palmdoc_unpack(record) == text
+
+
+def test_palmdoc_unpack_fuzzed():
+    rnd = random.Random(0)
+    for _ in range(2000):
+        # NOTE: random bytes include invalid distances (zero or before the start of the output)
+        record = rnd.randbytes(rnd.randint(0, 64))
+        assert PalmdocReader().unpack(record) == legacy_palmdoc_unpack(record)
+    for _ in range(200):
+        text = bytes(rnd.choice(b"ab \x00\xe9") for _ in range(rnd.randint(0, 512)))
+        record = palmdoc_compress(text)
+        assert PalmdocReader().unpack(record) == legacy_palmdoc_unpack(record) == text
+
+
+def load_huffcdic_reader(reader: HuffcdicReader, tables: list[bytes]) -> HuffcdicReader:
+    reader.loadHuff(tables[0])
+    for cdic in tables[1:]:
+        reader.loadCdic(cdic)
+    return reader
+
+
+def test_huffcdic_unpack():
+    spec = make_book_spec(chapters=8, paragraphs=30)
+    text = "".join(chapter.body for chapter in spec.chapters).encode("utf-8")
+    chunks = [text[start : start + RECORD_SIZE] for start in range(0, len(text), RECORD_SIZE)]
+    records, tables = huffcdic_compress(chunks, cdic_bits=6)
+    assert len(tables) > 2
+
+    reader = load_huffcdic_reader(HuffcdicReader(), tables)
+    legacy_reader = load_huffcdic_reader(LegacyHuffcdicReader(), tables)
+    for record, chunk in zip(records, chunks):
+        assert reader.unpack(record) == legacy_reader.unpack(record) == chunk
+        assert reader.unpack(memoryview(record)) == chunk
+    # phrases get expanded once & cached
+    assert all(phrase is not None for phrase in reader.phrases[256:])
+
+    fresh_reader = load_huffcdic_reader(HuffcdicReader(), tables)
+    assert fresh_reader.unpackRecords(records, max_workers=2) == chunks
+
+
+def test_huffcdic_recursive_phrase():
+    records, tables = huffcdic_compress([b"lorem ipsum " * 20])
+    reader = load_huffcdic_reader(HuffcdicReader(), tables)
+    # make every phrase refer to itself
+    reader.dictionary = [(records[0], 0)] * len(reader.dictionary)
+    reader.phrases = [None] * len(reader.phrases)
+    with pytest.raises(unpackException):
+        reader.unpack(records[0])
+
+
+def test_huffcdic_text_records(tmp_path, monkeypatch):
+    path = tmp_path / "book.azw3"
+    path.write_bytes(build_kf8(make_book_spec(), compression=HUFFCDIC_COMPRESSION))
+    sectionizer = Sectionizer(str(path))
+    mobi_header = MobiHeader(sectionizer, 0)
+    assert mobi_header.compression == HUFFCDIC_COMPRESSION
+
+    raw_ml = mobi_header.getRawML()
+    assert b"<title>Chapter 1</title>" in raw_ml
+    monkeypatch.setattr(mobi_header_module, "HUFF_PARALLEL_MIN_RECORDS", 2)
+    assert mobi_header.getRawML(max_workers=2) == raw_ml
@@ -0,0 +1,32 @@
+from baca.utils.search_index import SearchIndex
+
+
+def test_search_index_build():
+    index = SearchIndex()
+    index.extend(2)
+    index.texts[1] = "already\nindexed"
+
+    laid_out: list[int] = []
+
+    def layout_text(n: int) -> str:
+        laid_out.append(n)
+        if n == 0:
+            # segments added while building get indexed too
+            index.extend(3)
+        return f"segment {n}"
+
+    index.build(layout_text)
+    assert laid_out == [0, 2]
+    assert index.texts == ["segment 0", "already\nindexed", "segment 2"]
+
+
+def test_search_index_reset_stops_build():
+    index = SearchIndex()
+    index.extend(3)
+
+    def layout_text(n: int) -> str:
+        index.reset(3)
+        return f"segment {n}"
+
+    index.build(layout_text)
+    assert index.texts == [None, None, None]